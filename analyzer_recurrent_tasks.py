@@ -0,0 +1,92 @@
+# stdlib
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+# thirdparty
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError
+
+# project
+from analyzer_tasks_header import app
+from db.db_setup import redis_client
+from db.session_manager import db_manager
+from services.batch_classifier import create_batch_classifier
+from services.trends_collector import collect_federated_trends
+from settings import get_settings
+from utils.logging import logger
+
+settings = get_settings()
+
+BATCH_CLASSIFIER_LOCK = "lock:batch_classifier"
+TRENDS_COLLECTOR_LOCK = "lock:trends_collector"
+
+
+async def renew_lock(lock: Lock) -> None:
+    while True:
+        await asyncio.sleep(settings.TASK_LOCK_TTL / 3)
+        try:
+            await lock.reacquire()
+        except LockError as e:
+            logger.warning(f"Lost the task lock {lock.name}: {str(e)}")
+            return
+
+
+@asynccontextmanager
+async def task_lock(name: str) -> AsyncIterator[bool]:
+    """
+    Yield whether the lock was acquired. It expires shortly and is renewed while the task runs, so a crashed worker
+    blocks the next runs for TASK_LOCK_TTL seconds at most.
+    """
+    lock = redis_client.lock(name, timeout=settings.TASK_LOCK_TTL, blocking=False)
+    if not await lock.acquire():
+        yield False
+        return
+
+    renewal = asyncio.create_task(renew_lock(lock))
+    try:
+        yield True
+    finally:
+        renewal.cancel()
+        await asyncio.gather(renewal, return_exceptions=True)
+        try:
+            await lock.release()
+        except LockError:
+            pass
+
+
+async def classify_statuses_to_check_async() -> int:
+    # beat schedules runs every minute, a run which takes longer must not be overlapped by the next one
+    async with task_lock(BATCH_CLASSIFIER_LOCK) as acquired:
+        if not acquired:
+            logger.info("Batch classifier is already running")
+            return 0
+
+        db_manager.init(settings.DATABASE_URL)
+        try:
+            return await create_batch_classifier().run(max_batches=settings.BATCH_CLASSIFIER_MAX_BATCHES)
+        finally:
+            await db_manager.close()
+
+
+@app.task(name="analyzer_recurrent_tasks.classify_statuses_to_check")
+def classify_statuses_to_check() -> int:
+    return asyncio.run(classify_statuses_to_check_async())
+
+
+async def collect_federated_trends_async() -> int:
+    async with task_lock(TRENDS_COLLECTOR_LOCK) as acquired:
+        if not acquired:
+            logger.info("Trends collector is already running")
+            return 0
+
+        db_manager.init(settings.DATABASE_URL)
+        try:
+            return await collect_federated_trends(instances_count=settings.TRENDS_COLLECTOR_INSTANCES_COUNT)
+        finally:
+            await db_manager.close()
+
+
+@app.task(name="analyzer_recurrent_tasks.collect_federated_trends")
+def collect_federated_trends_task() -> int:
+    return asyncio.run(collect_federated_trends_async())
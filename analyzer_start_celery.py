@@ -1,18 +1,27 @@
 # stdlib
 import logging
+import os
 
 # thirdparty
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
 
 # project
 from analyzer_tasks_header import app
 from settings import get_settings
+from utils.multiprocess_metrics import (create_metrics_dir, mark_process_dead,
+                                        remove_metrics_dir,
+                                        start_metrics_server)
 
 settings = get_settings()
 
 app.conf.beat_schedule = {
-    "reward_clans": {
-        "task": "analyzer_recurrent_tasks",  # noqa
+    "classify_statuses_to_check": {
+        "task": "analyzer_recurrent_tasks.classify_statuses_to_check",  # noqa
+        "schedule": crontab(),  # noqa
+    },
+    "collect_federated_trends": {
+        "task": "analyzer_recurrent_tasks.collect_federated_trends",  # noqa
         "schedule": crontab(),  # noqa
     },
 }
@@ -22,7 +31,17 @@ app.conf.task_acks_late = True
 app.conf.beat_enabled = True
 
 
+def mark_worker_process_dead(pid: int, **kwargs) -> None:
+    # every task runs in a new child, live gauges of the exited ones are dropped
+    mark_process_dead(pid, os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
 if __name__ == "__main__":
+    # pool processes are forked from here, so prometheus_client must see the directory before the tasks import it
+    metrics_dir = create_metrics_dir(prefix="analyzer-celery-metrics-")
+    start_metrics_server(port=settings.CELERY_METRICS_PORT, path=metrics_dir)
+    worker_process_shutdown.connect(mark_worker_process_dead)
+
     app.control.purge()
 
     worker = app.Worker(
@@ -36,4 +55,7 @@ if __name__ == "__main__":
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
-    worker.start()
+    try:
+        worker.start()
+    finally:
+        remove_metrics_dir(metrics_dir)
@@ -0,0 +1,21 @@
+# stdlib
+import logging
+
+# project
+from services.ingestion_supervisor import IngestionSupervisor
+from settings import get_settings
+from utils.logging import setup_logging
+
+settings = get_settings()
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+
+    supervisor = IngestionSupervisor(
+        instances_count=settings.FEDERATED_INSTANCES_COUNT,
+        processes=settings.FEDERATED_INGESTION_PROCESSES,
+        stale_timeout=settings.FEDERATED_INGESTION_STALE_TIMEOUT,
+        metrics_port=settings.FEDERATED_INGESTION_METRICS_PORT,
+    )
+    supervisor.run()
@@ -0,0 +1,104 @@
+"""
+Compares cache serializers on payloads shaped like the responses of the list endpoints.
+
+Run from the project root:
+    python -m benchmarks.serialization
+"""
+# stdlib
+import random
+import string
+import timeit
+from datetime import datetime, timedelta, timezone
+
+# project
+from cache.serialization import CODECS, PickleSerializer, results_serializer
+from db.models.instance_model import InstanceModel
+from db.models.statuses_to_check_model import StatusToCheckModel
+from db.schemas.instance_schema import InstanceSchema
+from db.schemas.suspicious_status_schema import SuspiciousStatusSchema
+from utils.pagination import calculate_pagination
+
+NOW = datetime.now(timezone.utc)
+
+
+def random_text(words: int) -> str:
+    return " ".join("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 10))) for _ in range(words))
+
+
+def make_status(index: int) -> StatusToCheckModel:
+    return StatusToCheckModel(
+        id=str(113000000000000000 + index),
+        created_at=NOW - timedelta(minutes=index),
+        language="en",
+        url=f"https://mastodon.social/@user{index}/{113000000000000000 + index}",
+        content=f"<p>{random_text(60)} <a href=\"https://example.com\">#tag{index % 20}</a></p>",
+        is_suspicious=bool(index % 2),
+        openai_response=random_text(80),
+        openai_confidence=random.random(),
+        openai_is_suspicious=bool(index % 3),
+        checked_at=NOW,
+        author_followers_count=random.randint(0, 10000),
+        author_following_count=random.randint(0, 1000),
+        author_statuses_count=random.randint(0, 50000),
+        author_created_at=NOW - timedelta(days=random.randint(1, 2000)),
+    )
+
+
+def make_instance(index: int) -> InstanceModel:
+    return InstanceModel(
+        id=str(index),
+        name=f"instance{index}.social",
+        added_at=NOW - timedelta(days=index),
+        updated_at=NOW,
+        checked_at=NOW,
+        uptime=99,
+        up=True,
+        dead=False,
+        version="4.3.0",
+        ipv6=True,
+        https_score=100,
+        https_rank="A+",
+        users=str(random.randint(10, 100000)),
+        statuses=str(random.randint(100, 10000000)),
+        connections=str(random.randint(100, 50000)),
+        open_registrations=bool(index % 2),
+        info={"short_description": random_text(30), "languages": ["en", "de"], "categories": ["general"]},
+        active_users=random.randint(0, 5000),
+    )
+
+
+def bench(name: str, serializer, value, number: int = 200) -> None:
+    value = serializer.normalize(value)
+    data = serializer.serialize(value)
+
+    dump = timeit.timeit(lambda: serializer.serialize(value), number=number) / number
+    load = timeit.timeit(lambda: serializer.deserialize(data), number=number) / number
+
+    print(f"{name:<32} {len(data):>10} B {dump * 1e6:>10.1f} us {load * 1e6:>10.1f} us")
+
+
+def main() -> None:
+    random.seed(0)
+
+    payloads = {
+        "statuses": (make_status, SuspiciousStatusSchema),
+        "instances": (make_instance, InstanceSchema),
+    }
+
+    print(f"{'serializer':<32} {'size':>12} {'serialize':>13} {'deserialize':>13}")
+
+    for name, (factory, schema) in payloads.items():
+        for rows in (20, 100, 500):
+            value = ([factory(index) for index in range(rows)], calculate_pagination(1, rows, rows * 10))
+            print(f"\n{name}, {rows} rows")
+
+            bench("pickle, ORM rows", PickleSerializer(), value)
+            bench("typed, not compressed", results_serializer(schema, compress_threshold=2 ** 31), value)
+
+            for codec in CODECS:
+                if codec != b"n":
+                    bench(f"typed, codec {codec.decode()}", results_serializer(schema, codec=codec), value)
+
+
+if __name__ == "__main__":
+    main()
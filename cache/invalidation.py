@@ -0,0 +1,43 @@
+# stdlib
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+# project
+from db.db_setup import redis_client
+from utils.logging import logger
+
+InvalidationHandler = Callable[[bytes], Awaitable[None]]
+
+
+async def publish_invalidation(channel: str, message: bytes | str = b"") -> None:
+    """Notify every process subscribed to the channel that its local state is stale."""
+    try:
+        await redis_client.publish(channel, message)
+    except Exception as e:
+        logger.warning(f"Failed to publish invalidation to {channel}: {str(e)}")
+
+
+async def listen_for_invalidations(handlers: Dict[str, InvalidationHandler], reconnect_delay: float = 5.0) -> None:
+    """Subscribe to invalidation channels and dispatch messages to their handlers until cancelled."""
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(*handlers)
+
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    try:
+                        await handlers[channel](message["data"])
+                    except Exception as e:
+                        logger.error(f"Failed to handle invalidation from {channel}: {str(e)}", exc_info=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Invalidation subscription interrupted: {str(e)}")
+
+        await asyncio.sleep(reconnect_delay)
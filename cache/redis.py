@@ -1,17 +1,57 @@
 # stdlib
+import asyncio
+import math
+import random
+import time
 from datetime import timedelta
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Callable, Dict, Iterable, Set
 
 # thirdparty
+import orjson
 from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # project
-from cache.serialization import AbstractSerializer, PickleSerializer
+from cache.invalidation import publish_invalidation
+from cache.serialization import (AbstractSerializer, PickleSerializer,
+                                 StaleValueError)
 from db.db_setup import redis_client
+from db.session_manager import db_manager
+from settings import get_settings
+from utils.logging import logger
+from utils.lru_cache import TTLCache
+from utils.metrics import CACHE_LATENCY, CACHE_REQUESTS
+
+settings = get_settings()
 
 DEFAULT_TTL = 100
 
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+
+# keys of the process-local tier by tag, a key leaves the index together with its entry
+local_cache_tags: Dict[str, Set[str]] = {}
+
+
+def _forget_local_key(key: str) -> None:
+    for tag in list(local_cache_tags):
+        keys = local_cache_tags[tag]
+        keys.discard(key)
+        if not keys:
+            del local_cache_tags[tag]
+
+
+# process-local tier in front of Redis, entries live shortly because other workers do not see local writes
+local_cache = TTLCache(maxsize=settings.CACHE_L1_SIZE, ttl=settings.CACHE_L1_TTL, on_evict=_forget_local_key)
+
+# computations in flight, concurrent callers of one key inside a process share a single one
+in_flight: Dict[str, asyncio.Future] = {}
+
+_MISSING = object()
+
+# payload of cached None results, kept outside of the serializers, which may only accept values of their type
+_NONE_PAYLOAD = b""
+
 
 def build_key(*args: tuple[str, Any], **kwargs: dict[str, Any]) -> str:
     """Build a string key based on provided arguments and keyword arguments."""
@@ -20,16 +60,34 @@ def build_key(*args: tuple[str, Any], **kwargs: dict[str, Any]) -> str:
     return f"{args_str}:{kwargs_str}"
 
 
-async def set_redis_value(
-    key: bytes | str, value: bytes | str, ttl: int | timedelta | None = DEFAULT_TTL, is_transaction: bool = False
-) -> None:
-    """Set a value in Redis with an optional time-to-live (TTL)."""
-    async with redis_client.pipeline(transaction=is_transaction) as pipeline:
-        await pipeline.set(key, value)
-        if ttl:
-            await pipeline.expire(key, ttl)
+def _seconds(ttl: int | timedelta) -> float:
+    return ttl.total_seconds() if isinstance(ttl, timedelta) else float(ttl)
+
+
+async def set_redis_value(key: bytes | str, value: bytes | str, ttl: int | timedelta | None = DEFAULT_TTL) -> None:
+    """Set a value in Redis with an optional time-to-live (TTL), the expiration is set atomically."""
+    await redis_client.set(key, value, ex=ttl or None)
+
+
+def _pack(value: bytes, expires_at: float, delta: float) -> bytes:
+    # logical expiration and recomputation time are needed for the probabilistic early expiration
+    return f"{expires_at:.3f}:{delta:.3f}:".encode() + value
+
+
+def _unpack(data: bytes) -> tuple[float, float, bytes]:
+    expires_at, delta, value = data.split(b":", 2)
+    return float(expires_at), float(delta), value
+
 
-        await pipeline.execute()
+def _should_recompute(expires_at: float, delta: float, beta: float) -> bool:
+    # XFetch: the closer the expiration and the longer the computation, the more likely an early recomputation
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def _set_local(key: str, value: Any, ttl: float, tags: Iterable[str]) -> None:
+    local_cache.set(key, value, ttl=min(ttl, settings.CACHE_L1_TTL))
+    for tag in tags:
+        local_cache_tags.setdefault(tag, set()).add(key)
 
 
 def cached(
@@ -38,32 +96,117 @@ def cached(
     cache: Redis = redis_client,
     key_builder: Callable[..., str] = build_key,
     serializer: AbstractSerializer | None = None,
+    tags: Iterable[str] = (),
+    negative_ttl: int | timedelta | None = None,
+    ignore_kwargs: Iterable[str] = ("session",),
+    beta: float = 1.0,
 ) -> Callable:
-    """Caches the functions return value into a key generated with module_name, function_name and args."""
+    """
+    Caches the functions return value into a key generated with module_name, function_name and args.
+
+    Values are looked up in the process-local tier first, then in Redis. Concurrent misses of one key inside
+    a process share a single call, across processes a value is recomputed a bit before it expires by one of the
+    callers (probabilistic early expiration) while the rest keep getting the cached one. None results are cached
+    for negative_ttl. Tags allow to invalidate all cached values of a kind with invalidate_tags(). Keyword
+    arguments from ignore_kwargs (e.g. a database session) are not a part of the key. A shared call gets its own
+    session instead of the one of the caller which started it.
+    """
     if serializer is None:
         serializer = PickleSerializer()
 
+    tags = tuple(tags)
+    ignore_kwargs = frozenset(ignore_kwargs)
+    ttl_seconds = _seconds(ttl)
+    negative_ttl_seconds = _seconds(negative_ttl if negative_ttl is not None else settings.CACHE_NEGATIVE_TTL)
+
     def decorator(func: Callable) -> Callable:
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            if isinstance(kwargs.get("session"), AsyncSession):
+                # the call is shared by all waiters and outlives the request which started it, so it must not use
+                # the session of that request
+                async with db_manager.session() as session:
+                    return await func(*args, **{**kwargs, "session": session})
+
+            return await func(*args, **kwargs)
+
+        async def compute(key: str, *args: Any, **kwargs: Any) -> Any:
+            started_at = time.time()
+            result = await call(*args, **kwargs)
+            if result is not None:
+                result = serializer.normalize(result)
+            delta = time.time() - started_at
+
+            result_ttl = ttl_seconds if result is not None else negative_ttl_seconds
+            _set_local(key, result, result_ttl, tags)
+
+            try:
+                async with cache.pipeline(transaction=False) as pipeline:
+                    pipeline.set(
+                        key,
+                        _pack(
+                            serializer.serialize(result) if result is not None else _NONE_PAYLOAD,
+                            expires_at=time.time() + result_ttl,
+                            delta=delta,
+                        ),
+                        # keep the value a bit longer than its logical expiration for early recomputations
+                        ex=math.ceil(result_ttl + delta * beta * 10) + 1,
+                    )
+                    for tag in tags:
+                        pipeline.sadd(f"cache_tag:{tag}", key)
+                        pipeline.expire(f"cache_tag:{tag}", math.ceil(ttl_seconds) * 2)
+                    await pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Failed to store {key} in Redis: {str(e)}")
+
+            return result
+
+        def single_flight(key: str, *args: Any, **kwargs: Any) -> asyncio.Future:
+            future = in_flight.get(key)
+            if future is None:
+                future = in_flight[key] = asyncio.ensure_future(compute(key, *args, **kwargs))
+                future.add_done_callback(lambda _: in_flight.pop(key, None))
+            return future
+
         @wraps(func)
         async def wrapper(*args: tuple[str, Any], **kwargs: dict[str, Any]) -> Any:
-            key = key_builder(*args, **kwargs)
+            started_at = time.perf_counter()
+
+            key_kwargs = {name: value for name, value in kwargs.items() if name not in ignore_kwargs}
+            key = key_builder(*args, **key_kwargs)
             key = f"{namespace}:{func.__module__}:{func.__name__}:{key}"
 
-            # Check if the key is in the cache
-            cached_value = await cache.get(key)
+            value = local_cache.get(key, _MISSING)
+            if value is not _MISSING:
+                CACHE_REQUESTS.labels(namespace, "local_hit").inc()
+                CACHE_LATENCY.labels(namespace).observe(time.perf_counter() - started_at)
+                return value
+
+            try:
+                cached_value = await cache.get(key)
+            except Exception as e:
+                logger.warning(f"Failed to read {key} from Redis: {str(e)}")
+                cached_value = None
+
             if cached_value is not None:
-                return serializer.deserialize(cached_value)
+                expires_at, delta, payload = _unpack(cached_value)
 
-            # If not in cache, call the original function
-            result = await func(*args, **kwargs)
+                # a value close to its expiration may be recomputed early by this caller
+                if not _should_recompute(expires_at, delta, beta):
+                    try:
+                        value = serializer.deserialize(payload) if payload != _NONE_PAYLOAD else None
+                    except StaleValueError:
+                        value = _MISSING
 
-            # Store the result in Redis
-            await set_redis_value(
-                key=key,
-                value=serializer.serialize(result),
-                ttl=ttl,
-            )
+                if value is not _MISSING:
+                    _set_local(key, value, expires_at - time.time(), tags)
 
+                    CACHE_REQUESTS.labels(namespace, "redis_hit").inc()
+                    CACHE_LATENCY.labels(namespace).observe(time.perf_counter() - started_at)
+                    return value
+
+            CACHE_REQUESTS.labels(namespace, "miss").inc()
+            result = await asyncio.shield(single_flight(key, *args, **kwargs))
+            CACHE_LATENCY.labels(namespace).observe(time.perf_counter() - started_at)
             return result
 
         return wrapper
@@ -71,25 +214,25 @@ def cached(
     return decorator
 
 
-async def clear_cache(
-    func: Callable,
-    *args: Any,
-    **kwargs: Any,
-) -> None:
-    """Clear the cache for a specific function and arguments.
+def clear_local_tags(tags: Iterable[str]) -> None:
+    for tag in tags:
+        for key in local_cache_tags.pop(tag, set()):
+            local_cache.delete(key)
 
-    Parameters
-    ----------
-    - func (Callable): The target function for which the cache needs to be cleared.
-    - args (Any): Positional arguments passed to the function.
-    - kwargs (Any): Keyword arguments passed to the function.
 
-    Keyword Arguments:
-    - namespace (str, optional): A string indicating the namespace for the cache. Defaults to "main".
-    """
-    namespace: str = kwargs.get("namespace", "main")
+async def handle_cache_invalidation(message: bytes) -> None:
+    clear_local_tags(orjson.loads(message))
+
+
+async def invalidate_tags(*tags: str) -> None:
+    """Drop every cached value with one of the tags in Redis and in local tiers of all processes."""
+    clear_local_tags(tags)
 
-    key = build_key(*args, **kwargs)
-    key = f"{namespace}:{func.__module__}:{func.__name__}:{key}"
+    try:
+        for tag in tags:
+            keys = await redis_client.smembers(f"cache_tag:{tag}")
+            await redis_client.delete(f"cache_tag:{tag}", *keys)
+    except Exception as e:
+        logger.warning(f"Failed to invalidate cache tags {tags}: {str(e)}")
 
-    await redis_client.delete(key)
+    await publish_invalidation(CACHE_INVALIDATION_CHANNEL, orjson.dumps(list(tags)))
@@ -0,0 +1,93 @@
+# stdlib
+import hashlib
+import inspect
+from datetime import timedelta
+from functools import wraps
+from typing import Any, Callable, Iterable, NamedTuple
+
+# thirdparty
+from fastapi import Request, Response, params, status
+
+# project
+from cache.redis import cached
+from cache.serialization import AbstractSerializer, StaleValueError
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    body: bytes
+
+
+class ResponseSerializer(AbstractSerializer):
+    "Store encoded response bodies as they are, prefixed with their ETag."
+
+    def serialize(self, obj: CachedResponse) -> bytes:
+        return obj.etag.encode() + b"\n" + obj.body
+
+    def deserialize(self, obj: bytes) -> CachedResponse:
+        etag, separator, body = obj.partition(b"\n")
+        if not separator:
+            raise StaleValueError("Cached response has no ETag")
+        return CachedResponse(etag=etag.decode(), body=body)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    # weak comparison, a list of tags or a wildcard may be sent
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+
+def cached_response(ttl: int | timedelta, namespace: str, tags: Iterable[str] = ()) -> Callable:
+    """
+    Cache encoded JSON bodies of a GET endpoint per path and parsed parameters with the two-tier cache, so
+    repeated requests skip the database and the encoding. Query parameters the endpoint does not declare are not
+    a part of the key. Responses carry an ETag, a matching If-None-Match gets 304. Only successful responses are
+    cached, errors are raised by the endpoint as usual.
+    """
+
+    def decorator(endpoint: Callable) -> Callable:
+        signature = inspect.signature(endpoint)
+        # dependencies such as the database session are not a part of the request
+        key_parameters = sorted(
+            name
+            for name, parameter in signature.parameters.items()
+            if not isinstance(parameter.default, params.Depends)
+        )
+
+        @cached(
+            ttl=ttl,
+            namespace=namespace,
+            serializer=ResponseSerializer(),
+            tags=tags,
+            # only the request key is a part of the cache key, the endpoint arguments are derived from it
+            ignore_kwargs=signature.parameters,
+        )
+        async def render(request_key: str, **kwargs: Any) -> CachedResponse:
+            response = await endpoint(**kwargs)
+            etag = f'"{hashlib.md5(response.body).hexdigest()}"'
+            return CachedResponse(etag=etag, body=response.body)
+
+        @wraps(endpoint)
+        async def wrapper(request: Request, **kwargs: Any) -> Response:
+            query = "&".join(f"{name}={kwargs[name]}" for name in key_parameters)
+            result = await render(f"{request.url.path}?{query}", **kwargs)
+
+            headers = {"ETag": result.etag, "Cache-Control": "no-cache"}
+            if etag_matches(request, result.etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+            return Response(content=result.body, media_type="application/json", headers=headers)
+
+        # FastAPI has to inject the request in addition to the parameters of the endpoint
+        keyword_only = inspect.Parameter.KEYWORD_ONLY
+        parameters = [parameter.replace(kind=keyword_only) for parameter in signature.parameters.values()]
+        wrapper.__signature__ = signature.replace(
+            parameters=[inspect.Parameter("request", keyword_only, annotation=Request), *parameters]
+        )
+        return wrapper
+
+    return decorator
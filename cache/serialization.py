@@ -1,11 +1,28 @@
 # ruff: noqa: S301
 # stdlib
+import hashlib
 import pickle
+import zlib
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Callable, Dict, List, Tuple, Type
 
 # thirdparty
 import orjson
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+class StaleValueError(ValueError):
+    "Raised for cached values written with a different layout, they are treated as cache misses."
 
 
 class AbstractSerializer(ABC):
@@ -17,6 +34,10 @@ class AbstractSerializer(ABC):
     def deserialize(self, obj: Any) -> Any:
         "Support for deserializing objects stored in Redis."
 
+    def normalize(self, obj: Any) -> Any:
+        "Convert a value to the form deserialize() returns, so every cache tier serves the same objects."
+        return obj
+
 
 class PickleSerializer(AbstractSerializer):
     "Serialize values using pickle."
@@ -38,3 +59,60 @@ class JSONSerializer(AbstractSerializer):
     def deserialize(self, obj: str) -> Any:
         "Deserialize values using JSON."
         return orjson.loads(obj)
+
+
+# codecs by the byte stored in the header of a value, the ones whose libraries are not installed are skipped
+CODECS: Dict[bytes, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {b"n": (bytes, bytes)}
+if zstandard is not None:
+    CODECS[b"s"] = (zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress)
+if lz4 is not None:
+    CODECS[b"l"] = (lz4.frame.compress, lz4.frame.decompress)
+CODECS[b"z"] = (lambda data: zlib.compress(data, 1), zlib.decompress)
+
+# zlib costs more time than it saves on transfers to Redis, values are only compressed by default with zstd or lz4
+DEFAULT_CODEC = next((codec for codec in (b"s", b"l") if codec in CODECS), b"n")
+
+
+class TypedSerializer(AbstractSerializer):
+    """
+    Serialize values of a known type, e.g. pydantic schemas built from ORM rows, to JSON with pydantic-core.
+    Values above compress_threshold bytes are compressed. Every value starts with a fingerprint of the type layout
+    and the version, so a deploy which changes a schema does not read values written by the previous one.
+    """
+
+    FINGERPRINT_SIZE = 8
+
+    def __init__(self, type_: Any, version: int = 1, compress_threshold: int = 1024, codec: bytes = DEFAULT_CODEC):
+        self.adapter = TypeAdapter(type_)
+        self.compress_threshold = compress_threshold
+        self.codec = codec
+        self.compress, _ = CODECS[codec]
+
+        layout = orjson.dumps(self.adapter.json_schema(), option=orjson.OPT_SORT_KEYS)
+        self.fingerprint = hashlib.md5(f"{version}:".encode() + layout).hexdigest()[:self.FINGERPRINT_SIZE].encode()
+
+    def normalize(self, obj: Any) -> Any:
+        return self.adapter.validate_python(obj, from_attributes=True)
+
+    def serialize(self, obj: Any) -> bytes:
+        data = self.adapter.dump_json(obj)
+
+        if self.codec == b"n" or len(data) < self.compress_threshold:
+            return self.fingerprint + b"n" + data
+
+        return self.fingerprint + self.codec + self.compress(data)
+
+    def deserialize(self, obj: bytes) -> Any:
+        fingerprint = obj[:self.FINGERPRINT_SIZE]
+        codec = obj[self.FINGERPRINT_SIZE:self.FINGERPRINT_SIZE + 1]
+
+        if fingerprint != self.fingerprint or codec not in CODECS:
+            raise StaleValueError(f"Cached value has a layout {fingerprint.decode(errors='replace')}")
+
+        _, decompress = CODECS[codec]
+        return self.adapter.validate_json(decompress(obj[self.FINGERPRINT_SIZE + 1:]))
+
+
+def results_serializer(schema: Type[BaseModel], version: int = 1, **kwargs: Any) -> TypedSerializer:
+    "Serializer of (rows, pagination) pairs returned by list services."
+    return TypedSerializer(Tuple[List[schema], Dict[str, Any]], version=version, **kwargs)
@@ -3,7 +3,8 @@ import datetime
 from typing import Annotated
 
 # thirdparty
-from sqlalchemy import BigInteger, text
+from sqlalchemy import BigInteger, String, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import DeclarativeBase, mapped_column
 
 int_pk = Annotated[int, mapped_column(primary_key=True, unique=True, autoincrement=False)]
@@ -14,6 +15,7 @@ big_int_pk = Annotated[int, mapped_column(primary_key=True, unique=True, autoinc
 big_int_pk_increment = Annotated[
     int, mapped_column(primary_key=True, unique=True, autoincrement=True, type_=BigInteger)
 ]
+str_array = Annotated[list[str], mapped_column(type_=ARRAY(String))]
 created_at = Annotated[datetime.datetime, mapped_column(server_default=text("TIMEZONE('utc', now())"))]
 
 
@@ -34,3 +34,4 @@ class InstanceModel(Base):
     active_users: Mapped[int]
     email: Mapped[str]
     admin: Mapped[str]
+    row_hash: Mapped[str | None]
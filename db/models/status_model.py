@@ -3,7 +3,7 @@ from datetime import datetime
 from sqlalchemy.orm import Mapped
 
 from db.db_setup import Base
-from db.models.base import big_int, created_at, str_pk
+from db.models.base import big_int, created_at, str_array, str_pk
 
 
 class StatusModel(Base):
@@ -27,7 +27,8 @@ class StatusModel(Base):
     quote_approval: Mapped[str | None]
     edited_at: Mapped[datetime]
     content: Mapped[str]
-    tags: Mapped[str]
+    tags: Mapped[str_array]
+    cluster_id: Mapped[str | None]
 
 
 class RawStatusModel(Base):
@@ -49,4 +50,4 @@ class RawStatusModel(Base):
     favourites_count: Mapped[int]
     edited_at: Mapped[datetime]
     content: Mapped[str]
-    tags: Mapped[str]
+    tags: Mapped[str_array]
@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy.orm import Mapped
+from sqlalchemy import text
+from sqlalchemy.orm import Mapped, mapped_column
 
 from db.db_setup import Base
 from db.models.base import created_at, str_pk
@@ -32,3 +33,8 @@ class StatusToCheckModel(Base):
     author_following_count: Mapped[int]
     author_statuses_count: Mapped[int]
     author_created_at: Mapped[datetime]
+    cluster_id: Mapped[str | None]
+    content_hash: Mapped[str | None]
+    author_bucket: Mapped[str | None]
+    prompt_version: Mapped[str | None]
+    classification_attempts: Mapped[int] = mapped_column(server_default=text("0"))
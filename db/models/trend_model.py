@@ -1,18 +1,51 @@
-from sqlalchemy.orm import Mapped
+from datetime import date
+
+from sqlalchemy import BigInteger, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
 
 from db.db_setup import Base
-from db.models.base import big_int_pk, big_int_pk_increment
+from db.models.base import big_int_pk_increment, created_at
+
+
+class TrendSnapshotModel(Base):
+    __tablename__ = "trend_snapshots"
+    __table_args__ = (Index("trend_snapshots_instance_url_taken_at_index", "instance_url", "taken_at"),)
+
+    id: Mapped[big_int_pk_increment]
+    instance_url: Mapped[str]
+    taken_at: Mapped[created_at]
+
+
+class CurrentTrendSnapshotModel(Base):
+    __tablename__ = "current_trend_snapshots"
+
+    instance_url: Mapped[str] = mapped_column(primary_key=True)
+    snapshot_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("trend_snapshots.id"))
 
 
 class TrendModel(Base):
     __tablename__ = "trends"
 
-    id: Mapped[big_int_pk]
+    snapshot_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("trend_snapshots.id", ondelete="CASCADE"), primary_key=True
+    )
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
     name: Mapped[str]
     url: Mapped[str]
     uses_in_last_seven_days: Mapped[int]
 
 
+class TrendHistoryModel(Base):
+    __tablename__ = "trend_history"
+    __table_args__ = (Index("trend_history_day_index", "day"),)
+
+    instance_url: Mapped[str] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+    uses: Mapped[int]
+    accounts: Mapped[int]
+
+
 class SuspiciousTrendModel(Base):
     __tablename__ = "suspicious_trends"
 
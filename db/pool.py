@@ -0,0 +1,70 @@
+# stdlib
+import math
+import time
+from typing import Any, Dict
+
+# thirdparty
+from sqlalchemy import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+# project
+from utils.metrics import (DB_POOL_CHECKED_OUT, DB_POOL_CHECKOUTS,
+                           DB_POOL_OVERFLOW, DB_POOL_TIMEOUTS, DB_POOL_WAIT)
+
+POOL_MODE_QUEUE = "queue"
+POOL_MODE_PGBOUNCER = "pgbouncer"
+POOL_MODE_NULL = "null"
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Exports how long checkouts wait for a connection (including opening a new one), and pool usage."""
+
+    metrics_label = "default"
+
+    def _do_get(self) -> Any:
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(self.metrics_label).inc()
+            raise
+        finally:
+            DB_POOL_WAIT.labels(self.metrics_label).observe(time.perf_counter() - started_at)
+
+        DB_POOL_CHECKOUTS.labels(self.metrics_label).inc()
+        self._update_gauges()
+        return connection
+
+    def _do_return_conn(self, record: Any) -> None:
+        super()._do_return_conn(record)
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        DB_POOL_CHECKED_OUT.labels(self.metrics_label).set(self.checkedout())
+        DB_POOL_OVERFLOW.labels(self.metrics_label).set(max(self.overflow(), 0))
+
+
+def per_worker(total: int, workers: int, minimum: int = 1) -> int:
+    # the configured size is shared by all workers of a host
+    return max(math.ceil(total / max(workers, 1)), minimum)
+
+
+def engine_options(mode: str, pool_size: int, max_overflow: int, timeout: float, recycle: int) -> Dict[str, Any]:
+    """Keyword arguments of create_async_engine() for a pooling mode."""
+    if mode == POOL_MODE_NULL:
+        return {"poolclass": NullPool}
+
+    return {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": timeout,
+        "pool_recycle": recycle,
+    }
+
+
+def instrument_pool(engine: Engine, label: str) -> None:
+    """Label metrics of an engine's pool."""
+    if isinstance(engine.pool, InstrumentedAsyncQueuePool):
+        engine.pool.metrics_label = label
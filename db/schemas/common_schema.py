@@ -5,7 +5,7 @@ from typing import Generic, List, TypeVar
 from pydantic import BaseModel
 
 # project
-from utils.helpers import PaginationModel
+from utils.helpers import CursorPaginationModel, PaginationModel
 
 M = TypeVar("M", bound=BaseModel)
 
@@ -16,7 +16,7 @@ class ResultResponse(BaseModel, Generic[M]):
 
 class ResultsResponse(BaseModel, Generic[M]):
     results: List[M]
-    pagination: PaginationModel | None = None
+    pagination: PaginationModel | CursorPaginationModel | None = None
 
 
 class CommonResponseSchema(BaseModel):
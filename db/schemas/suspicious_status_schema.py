@@ -16,3 +16,4 @@ class SuspiciousStatusSchema(BaseModel):
     author_following_count: int | None = 0
     author_statuses_count: int | None = 0
     author_created_at: datetime | None = None
+    cluster_id: str | None = None
@@ -6,6 +6,14 @@ class TrendSchema(BaseModel):
     name: str
     url: str
     uses_in_last_seven_days: int
+    # growth of the uses of the latest day relative to the previous days, None without enough history
+    velocity: float | None = None
+
+
+class FederatedTrendSchema(BaseModel):
+    name: str
+    instances_count: int
+    uses_in_last_seven_days: int
 
 
 class SuspiciousTrendSchema(BaseModel):
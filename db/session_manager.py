@@ -7,7 +7,13 @@ from uuid import uuid4
 from asyncpg import Connection
 from sqlalchemy.ext.asyncio import (AsyncConnection, AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
-from sqlalchemy.pool import NullPool
+
+# project
+from db.pool import (POOL_MODE_PGBOUNCER, engine_options, instrument_pool,
+                     per_worker)
+from settings import get_settings
+
+settings = get_settings()
 
 
 class CConnection(Connection):
@@ -20,22 +26,30 @@ class DatabaseSessionManager:
         self._engine: Optional[AsyncEngine] = None
         self._sessionmaker: Optional[async_sessionmaker[AsyncSession]] = None
 
-    def init(self, db_url: str) -> None:
-        # Just additional example of customization.
-        # you can add parameters to init and so on
-        if "postgresql" in db_url:
+    def init(self, db_url: str, pool_mode: Optional[str] = None) -> None:
+        pool_mode = pool_mode or settings.DATABASE_POOL_MODE
+
+        if "postgresql" in db_url and pool_mode == POOL_MODE_PGBOUNCER:
             # These settings are needed to work with pgbouncer in transaction mode
             # because you can't use prepared statements in such case
             connect_args = {
-                # "statement_cache_size": 0,
-                # "prepared_statement_cache_size": 0,
-                # "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+                "connection_class": CConnection,
             }
         else:
             connect_args = {}
-        self._engine = create_async_engine(
-            url=db_url, pool_pre_ping=True, connect_args=connect_args, poolclass=NullPool
+
+        options = engine_options(
+            mode=pool_mode,
+            pool_size=per_worker(settings.ASYNC_ENGINE_POOL_SIZE, settings.WEB_CONCURRENCY),
+            max_overflow=per_worker(settings.ASYNC_ENGINE_MAX_OVERFLOW, settings.WEB_CONCURRENCY, minimum=0),
+            timeout=settings.DATABASE_POOL_TIMEOUT,
+            recycle=settings.DATABASE_POOL_RECYCLE,
         )
+        self._engine = create_async_engine(url=db_url, pool_pre_ping=True, connect_args=connect_args, **options)
+        instrument_pool(self._engine.sync_engine, "async")
         self._sessionmaker = async_sessionmaker(
             bind=self._engine,
             expire_on_commit=False,
@@ -46,6 +46,8 @@ worker_class = "uvicorn.workers.UvicornWorker"
 loglevel = use_loglevel
 # workers = 4
 workers = web_concurrency
+# workers inherit the environment, database pools are divided between them
+os.environ["WEB_CONCURRENCY"] = str(workers)
 bind = use_bind
 errorlog = use_errorlog
 accesslog = use_accesslog
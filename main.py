@@ -2,7 +2,9 @@
 import asyncio
 import json
 import logging
-from contextlib import asynccontextmanager
+import time
+from contextlib import aclosing, asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
 
 import nltk
 # thirdparty
@@ -12,21 +14,29 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from starlette.websockets import WebSocket, WebSocketDisconnect
 
+from cache.invalidation import listen_for_invalidations
+from cache.redis import (CACHE_INVALIDATION_CHANNEL, handle_cache_invalidation,
+                         invalidate_tags)
+from db.models.statuses_to_check_model import StatusToCheckModel
 from db.session_manager import db_manager
 # project
 from routers import accounts, instances, statuses, trends
 from services.listener import listen_mastodon_stream
-from services.llm_provider import LLMModel, extract_json_and_confidence
+from services.llm_provider import LLMModel, ensemble_verdict, parse_verdict
 from services.mastodon_service import upsert_mastodon_instances
 from services.status_service import (get_ai_response,
                                      get_suspicious_status_by_id,
-                                     save_ai_response)
+                                     save_ai_responses)
 from services.trends_service import update_mastodon_trends
+from services.verdict_cache import (Verdict, get_cached_verdicts,
+                                    store_verdict, stored_verdict, verdict_key)
 from settings import get_settings
 from utils.helpers import (CustomHTTPException, custom_exception_handler,
                            general_exception_handler,
                            validation_exception_handler)
 from utils.logging import logger, setup_logging
+from utils.utils import metrics
+from utils.verdict_parser import VERDICT_FIELDS, IncrementalVerdictParser
 
 setup_logging(logging.INFO)
 
@@ -34,6 +44,9 @@ settings = get_settings()
 
 router = APIRouter(prefix="/api/v1")
 
+# version 2 of the websocket protocol sends text deltas instead of the accumulated text
+WS_PROTOCOL_VERSION = 2
+
 nltk.download('punkt')
 nltk.download('punkt_tab')
 
@@ -47,8 +60,16 @@ async def lifespan(app: FastAPI):  # noqa
     #     await upsert_mastodon_instances(session=session)
     #     await update_mastodon_trends(session=session)
     #     pass
+
+    # local tiers of cached responses are dropped when other processes invalidate them
+    cache_invalidation_task = asyncio.create_task(
+        listen_for_invalidations({CACHE_INVALIDATION_CHANNEL: handle_cache_invalidation})
+    )
     yield
 
+    cache_invalidation_task.cancel()
+    await asyncio.gather(cache_invalidation_task, return_exceptions=True)
+
     logger.info("Shutting down Mastodon stream.")
     # task.cancel()
     # try:
@@ -83,6 +104,97 @@ router.include_router(instances.router)
 router.include_router(trends.router)
 router.include_router(statuses.router)
 app.include_router(router)
+app.add_route("/metrics", metrics)
+
+
+def parse_models(value) -> List[LLMModel]:
+    """Models requested by a client, a ValueError describes an empty or unknown request."""
+    if isinstance(value, str) and value.lower() == "all":
+        return list(LLMModel)
+
+    values = value if isinstance(value, list) else [value]
+    if not values:
+        raise ValueError("No model requested")
+
+    available = {model.value for model in LLMModel}
+    unknown = [str(item) for item in values if str(item).lower() not in available]
+    if unknown:
+        raise ValueError(f"Unknown models {unknown}")
+
+    # keep the requested order, but analyze every model once
+    return list(dict.fromkeys(LLMModel(str(item).lower()) for item in values))
+
+
+async def stream_verdict(
+        send: Callable[[dict], Awaitable[None]],
+        status: dict,
+        model: LLMModel,
+        protocol: int = 1,
+        verdict_only: bool = False,
+) -> Optional[Verdict]:
+    parser = IncrementalVerdictParser()
+    pending: List[str] = []
+    sent_at = time.monotonic()
+    truncated = False
+
+    async def flush():
+        if not pending:
+            return
+
+        if protocol >= 2:
+            await send({
+                "type": "delta",
+                "model": model.value,
+                "content": "".join(pending)
+            })
+        else:
+            # older clients expect the whole text received so far
+            await send({
+                "type": "stream",
+                "model": model.value,
+                "content": parser.text
+            })
+        pending.clear()
+
+    try:
+        async with aclosing(get_ai_response(status=status, model=model)) as deltas:
+            async for delta in deltas:
+                pending.append(delta)
+                fields = parser.feed(delta)
+
+                # chunks arriving within the window go out as one frame
+                if time.monotonic() - sent_at >= settings.WS_COALESCE_INTERVAL:
+                    await flush()
+                    sent_at = time.monotonic()
+
+                # verdict fields are surfaced the moment they are parsed
+                if protocol >= 2 and any(field in fields for field in VERDICT_FIELDS):
+                    await flush()
+                    await send({
+                        "type": "verdict",
+                        "model": model.value,
+                        **{field: parser.fields[field] for field in VERDICT_FIELDS if field in parser.fields}
+                    })
+
+                # closing the stream cancels the provider request
+                if verdict_only and parser.done:
+                    truncated = True
+                    break
+
+        await flush()
+    except Exception as stream_error:
+        logger.error(f"Streaming error: {str(stream_error)}", exc_info=True)
+        await send({
+            "error": f"Streaming error: {str(stream_error)}",
+            "model": model.value
+        })
+        return None
+
+    _, confidence, is_suspicious = parse_verdict(parser)
+    verdict = Verdict(response=parser.text, confidence=confidence, is_suspicious=is_suspicious, truncated=truncated)
+
+    await store_verdict(key=verdict_key(status=status, model=model, truncated=truncated), verdict=verdict)
+    return verdict
 
 
 @app.websocket("/ws")
@@ -93,11 +205,27 @@ async def ws_endpoint(websocket: WebSocket):
     Клиент отправляет JSON:
     {
         "status_id": "123456",
-        "model": "openai"
+        "model": "openai",
+        "protocol": 2,
+        "verdict_only": false
     }
+
+    С "protocol": 2 текст приходит фреймами "delta" с новыми фрагментами, без него - фреймами "stream"
+    с накопленным текстом. Также во втором протоколе фреймы "verdict" приходят, как только в ответе появились
+    is_suspicious и confidence. С "verdict_only": true ответ модели обрывается сразу после них.
+
+    "model" также может быть "all" или списком моделей: тогда модели работают параллельно,
+    фреймы помечены моделью, а в конце приходит фрейм "ensemble" со взвешенным по confidence вердиктом.
     """
     await websocket.accept()
 
+    # frames of concurrently streaming models are written one at a time
+    send_lock = asyncio.Lock()
+
+    async def send(payload: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(payload))
+
     try:
         while True:
             message_text = await websocket.receive_text()
@@ -105,76 +233,118 @@ async def ws_endpoint(websocket: WebSocket):
             try:
                 message_data = json.loads(message_text)
                 status_id = str(message_data.get("status_id"))
-                model_name = message_data.get("model", "openai").lower()
+                model_value = message_data.get("model", "openai")
+                protocol = message_data.get("protocol", 1)
+                protocol = min(protocol, WS_PROTOCOL_VERSION) if isinstance(protocol, int) else 1
+                verdict_only = bool(message_data.get("verdict_only", False))
 
                 try:
-                    model = LLMModel(model_name)
-                except ValueError:
-                    await websocket.send_text(json.dumps({
-                        "error": f"Invalid model. Available: {[m.value for m in LLMModel]}"
-                    }))
+                    models = parse_models(model_value)
+                except ValueError as e:
+                    await send({
+                        "error": f"Invalid model. {str(e)}. Available: {[m.value for m in LLMModel] + ['all']}",
+                        "status_id": status_id
+                    })
                     continue
 
             except json.JSONDecodeError:
                 status_id = str(message_text)
-                model = LLMModel.OPENAI
+                model_value = LLMModel.OPENAI.value
+                models = [LLMModel.OPENAI]
+                protocol = 1
+                verdict_only = False
 
+            is_ensemble = len(models) > 1 or model_value == "all"
+
+            # sessions are only held for reads and the final write, not while the models are streaming
+            verdicts: Dict[LLMModel, Verdict] = {}
             async with db_manager.session() as session:
                 status = await get_suspicious_status_by_id(session=session, status_id=status_id)
 
-                if not status:
-                    await websocket.send_text(json.dumps({
-                        "error": "Status not found",
-                        "status_id": status_id
-                    }))
-                    continue
+                if status:
+                    status_dict = status.__dict__
+                    status_dict.pop('_sa_instance_state', None)
 
-                status_dict = status.__dict__
-                status_dict.pop('_sa_instance_state', None)
+                    # verdicts already given for this status or for the same text by a similar author
+                    cached = await get_cached_verdicts(
+                        session=session, statuses=[status_dict], models=models, verdict_only=verdict_only
+                    )
+                    verdicts = {model: verdict for (_, model), verdict in cached.items()}
 
-                await websocket.send_text(json.dumps({
-                    "type": "start",
-                    "model": model.value,
+            if not status:
+                await send({
+                    "error": "Status not found",
                     "status_id": status_id
-                }))
+                })
+                continue
 
-                final_response = ""
-                try:
-                    async for text in get_ai_response(status=status_dict, model=model):
-                        final_response = text
-                        await websocket.send_text(json.dumps({
-                            "type": "stream",
-                            "content": text
-                        }))
-                except Exception as stream_error:
-                    logger.error(f"Streaming error: {str(stream_error)}", exc_info=True)
-                    await websocket.send_text(json.dumps({
-                        "error": f"Streaming error: {str(stream_error)}"
-                    }))
-                    continue
-
-                _, confidence, is_suspicious = extract_json_and_confidence(final_response)
-
-                try:
-                    await save_ai_response(
-                        session=session,
-                        status_id=status_id,
-                        model=model,
-                        ai_response=final_response,
-                        confidence=confidence,
-                        is_suspicious=is_suspicious
-                    )
-                    await session.commit()
-                except Exception as save_error:
-                    logger.error(f"Save error: {str(save_error)}", exc_info=True)
-                    await session.rollback()
-
-                await websocket.send_text(json.dumps({
+            for model in models:
+                await send({
+                    "type": "start",
+                    "model": model.value,
+                    "status_id": status_id,
+                    "protocol": protocol
+                })
+
+            # replay cached verdicts
+            for model, verdict in verdicts.items():
+                await send({
+                    "type": "delta" if protocol >= 2 else "stream",
+                    "model": model.value,
+                    "content": verdict.response
+                })
+                await send({
                     "type": "complete",
                     "model": model.value,
+                    "confidence": verdict.confidence,
+                    "is_suspicious": verdict.is_suspicious,
+                    "cached": True
+                })
+
+            # the rest of models stream concurrently, so the latency is the one of the slowest model
+            async def analyze(model: LLMModel):
+                verdict = await stream_verdict(
+                    send=send, status=status_dict, model=model, protocol=protocol, verdict_only=verdict_only
+                )
+                if verdict is not None:
+                    verdicts[model] = verdict
+                    await send({
+                        "type": "complete",
+                        "model": model.value,
+                        "confidence": verdict.confidence,
+                        "is_suspicious": verdict.is_suspicious
+                    })
+
+            await asyncio.gather(*(analyze(model) for model in models if model not in verdicts))
+
+            response = dict(
+                status_id=status_id,
+                # verdicts stored in the row itself are not written again
+                verdicts={
+                    model: verdict
+                    for model, verdict in verdicts.items()
+                    if stored_verdict(status_dict, model, verdict_only=verdict_only) != verdict
+                },
+            )
+
+            if is_ensemble and verdicts:
+                is_suspicious, confidence = ensemble_verdict(verdicts=verdicts.values())
+                response["is_suspicious"] = is_suspicious
+
+                await send({
+                    "type": "ensemble",
+                    "models": [model.value for model in verdicts],
                     "confidence": confidence,
                     "is_suspicious": is_suspicious
-                }))
+                })
+
+            if response["verdicts"] or "is_suspicious" in response:
+                try:
+                    async with db_manager.session() as session:
+                        await save_ai_responses(session=session, responses=[response])
+                    await invalidate_tags(StatusToCheckModel.__tablename__)
+                except Exception as save_error:
+                    logger.error(f"Save error: {str(save_error)}", exc_info=True)
 
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected by client")
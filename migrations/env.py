@@ -1,11 +1,13 @@
 # stdlib
+import asyncio
 import os
 from logging.config import fileConfig
 
 # thirdparty
 from alembic import context
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import Connection, pool
+from sqlalchemy.ext.asyncio import create_async_engine
 
 # project
 from db.db_setup import Base
@@ -39,7 +41,7 @@ def run_migrations_offline():
 
     """
     context.configure(
-        url=os.environ["DATABASE_URL_PSYCOPG2"],
+        url=os.environ["DATABASE_URL"],
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
@@ -50,6 +52,27 @@ def run_migrations_offline():
         context.run_migrations()
 
 
+def do_run_migrations(connection: Connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        version_table_schema="public",
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    # migrations use the asyncpg driver of the application, so no second driver is needed
+    connectable = create_async_engine(os.environ["DATABASE_URL"], poolclass=pool.NullPool)
+
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
+
+
 def run_migrations_online():
     """Run migrations in 'online' mode.
 
@@ -57,17 +80,7 @@ def run_migrations_online():
     and associate a connection with the context.
 
     """
-    connectable = create_engine(os.environ["DATABASE_URL_PSYCOPG2"])
-
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata,
-            version_table_schema="public",
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+    asyncio.run(run_async_migrations())
 
 
 if context.is_offline_mode():
@@ -0,0 +1,34 @@
+"""status cluster id
+
+Revision ID: 5c1e7a9d3b20
+Revises: 07fb4c089138
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5c1e7a9d3b20"
+down_revision = "07fb4c089138"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("statuses", sa.Column("cluster_id", sa.VARCHAR(), nullable=True, comment="Near-Duplicate Cluster ID"))
+    op.add_column(
+        "statuses_to_check",
+        sa.Column("cluster_id", sa.VARCHAR(), nullable=True, comment="Near-Duplicate Cluster ID"),
+    )
+
+    op.create_index("statuses_cluster_id_index", "statuses", ["cluster_id"], unique=False)
+    op.create_index("statuses_to_check_cluster_id_index", "statuses_to_check", ["cluster_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("statuses_to_check_cluster_id_index", table_name="statuses_to_check")
+    op.drop_index("statuses_cluster_id_index", table_name="statuses")
+
+    op.drop_column("statuses_to_check", "cluster_id")
+    op.drop_column("statuses", "cluster_id")
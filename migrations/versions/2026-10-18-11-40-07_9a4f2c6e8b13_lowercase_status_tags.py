@@ -0,0 +1,37 @@
+"""lowercase status tags
+
+Revision ID: 9a4f2c6e8b13
+Revises: 5c1e7a9d3b20
+Create Date: 2026-10-18 11:40:07.502716
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9a4f2c6e8b13"
+down_revision = "5c1e7a9d3b20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # tags are looked up by array containment on the GIN index, which is case-sensitive
+    op.execute(
+        sa.text(
+            """
+            UPDATE statuses
+            SET tags = (
+                SELECT array_agg(lower(tag) ORDER BY position)
+                FROM unnest(statuses.tags) WITH ORDINALITY AS tag_list(tag, position)
+            )
+            WHERE tags IS NOT NULL AND tags::text <> lower(tags::text)
+            """
+        )
+    )
+
+    op.create_index("statuses_created_at_index", "statuses", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("statuses_created_at_index", table_name="statuses")
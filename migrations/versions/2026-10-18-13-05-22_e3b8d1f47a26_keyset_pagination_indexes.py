@@ -0,0 +1,27 @@
+"""keyset pagination indexes
+
+Revision ID: e3b8d1f47a26
+Revises: 9a4f2c6e8b13
+Create Date: 2026-10-18 13:05:22.941537
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e3b8d1f47a26"
+down_revision = "9a4f2c6e8b13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (created_at, id) sort keys of the cursor pagination, scanned backwards for the newest rows first
+    op.create_index(
+        "statuses_to_check_created_at_id_index", "statuses_to_check", ["created_at", "id"], unique=False
+    )
+    op.create_index("accounts_created_at_id_index", "accounts", ["created_at", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("accounts_created_at_id_index", table_name="accounts")
+    op.drop_index("statuses_to_check_created_at_id_index", table_name="statuses_to_check")
@@ -0,0 +1,78 @@
+"""status verdict cache
+
+Revision ID: b71e05c9d4a8
+Revises: e3b8d1f47a26
+Create Date: 2026-10-18 14:22:51.680412
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b71e05c9d4a8"
+down_revision = "e3b8d1f47a26"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "statuses_to_check",
+        sa.Column("content_hash", sa.VARCHAR(), nullable=True, comment="Normalized Content Hash"),
+    )
+    op.add_column(
+        "statuses_to_check",
+        sa.Column("author_bucket", sa.VARCHAR(), nullable=True, comment="Author Features Bucket"),
+    )
+    op.add_column(
+        "statuses_to_check",
+        sa.Column("prompt_version", sa.VARCHAR(), nullable=True, comment="Prompt Version of Stored Responses"),
+    )
+
+    # mirrors content_hash() and author_bucket() of services/verdict_cache.py, existing responses were
+    # made with the first prompt version
+    op.execute(
+        sa.text(
+            """
+            UPDATE statuses_to_check
+            SET
+                content_hash = md5(btrim(regexp_replace(lower(coalesce(content, '')), '\\s+', ' ', 'g'))),
+                author_bucket = concat_ws(
+                    ':',
+                    floor(log(2.0, greatest(coalesce(author_followers_count, 0), 0)::numeric + 1))::int,
+                    floor(log(2.0, greatest(coalesce(author_following_count, 0), 0)::numeric + 1))::int,
+                    floor(log(2.0, greatest(coalesce(author_statuses_count, 0), 0)::numeric + 1))::int,
+                    floor(
+                        log(
+                            2.0,
+                            greatest(
+                                coalesce(floor(extract(epoch FROM created_at - author_created_at) / 86400), 0), 0
+                            )::numeric + 1
+                        )
+                    )::int
+                ),
+                prompt_version = CASE
+                    WHEN openai_response IS NOT NULL
+                        OR claude_response IS NOT NULL
+                        OR gemini_response IS NOT NULL
+                        OR llama_response IS NOT NULL
+                    THEN '1'
+                END
+            """
+        )
+    )
+
+    op.create_index(
+        "statuses_to_check_content_hash_index",
+        "statuses_to_check",
+        ["content_hash", "author_bucket"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("statuses_to_check_content_hash_index", table_name="statuses_to_check")
+
+    op.drop_column("statuses_to_check", "prompt_version")
+    op.drop_column("statuses_to_check", "author_bucket")
+    op.drop_column("statuses_to_check", "content_hash")
@@ -0,0 +1,27 @@
+"""instances row hash
+
+Revision ID: 4d2a9e7c1f60
+Revises: b71e05c9d4a8
+Create Date: 2026-10-18 15:10:37.214903
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4d2a9e7c1f60"
+down_revision = "b71e05c9d4a8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing rows have no hash, so they are rewritten once by the next refresh
+    op.add_column(
+        "instances",
+        sa.Column("row_hash", sa.VARCHAR(), nullable=True, comment="Hash of Synchronized Fields"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("instances", "row_hash")
@@ -0,0 +1,95 @@
+"""trend snapshots
+
+Revision ID: 8c3f6a2d5e91
+Revises: 4d2a9e7c1f60
+Create Date: 2026-10-18 15:48:12.530271
+
+"""
+import os
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8c3f6a2d5e91"
+down_revision = "4d2a9e7c1f60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "trend_snapshots",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False, comment="Trend Snapshot ID"),
+        sa.Column("instance_url", sa.String(), nullable=False, comment="Instance URL"),
+        sa.Column(
+            "taken_at",
+            sa.DateTime(),
+            server_default=sa.text("TIMEZONE('utc', now())"),
+            nullable=False,
+            comment="Taken At",
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "trend_snapshots_instance_url_taken_at_index", "trend_snapshots", ["instance_url", "taken_at"], unique=False
+    )
+
+    op.create_table(
+        "current_trend_snapshots",
+        sa.Column("instance_url", sa.String(), nullable=False, comment="Instance URL"),
+        sa.Column("snapshot_id", sa.BigInteger(), nullable=False, comment="Current Trend Snapshot ID"),
+        sa.ForeignKeyConstraint(["snapshot_id"], ["trend_snapshots.id"]),
+        sa.PrimaryKeyConstraint("instance_url"),
+    )
+
+    # one row per trend and day, the primary key serves range queries of a trend over days
+    op.create_table(
+        "trend_history",
+        sa.Column("instance_url", sa.String(), nullable=False, comment="Instance URL"),
+        sa.Column("name", sa.String(), nullable=False, comment="Trend Name"),
+        sa.Column("day", sa.Date(), nullable=False, comment="Day"),
+        sa.Column("uses", sa.Integer(), nullable=False, comment="Uses in the Day"),
+        sa.Column("accounts", sa.Integer(), nullable=False, comment="Accounts Used the Trend in the Day"),
+        sa.PrimaryKeyConstraint("instance_url", "name", "day"),
+    )
+    op.create_index("trend_history_day_index", "trend_history", ["day"], unique=False)
+
+    # current rows become the first snapshot of the configured instance
+    op.add_column(
+        "trends", sa.Column("snapshot_id", sa.BigInteger(), nullable=True, comment="Trend Snapshot ID")
+    )
+    op.execute(
+        sa.text(
+            "INSERT INTO trend_snapshots (instance_url) SELECT :instance_url WHERE EXISTS (SELECT 1 FROM trends)"
+        ).bindparams(instance_url=os.environ.get("MASTODON_INSTANCE_ENDPOINT", "https://mastodon.social"))
+    )
+    op.execute("UPDATE trends SET snapshot_id = (SELECT max(id) FROM trend_snapshots)")
+    op.execute(
+        "INSERT INTO current_trend_snapshots (instance_url, snapshot_id) SELECT instance_url, id FROM trend_snapshots"
+    )
+
+    op.alter_column("trends", "snapshot_id", nullable=False)
+    op.alter_column("trends", "id", type_=sa.BigInteger(), existing_nullable=False)
+    op.drop_constraint("trends_pkey", "trends", type_="primary")
+    op.create_primary_key("trends_pkey", "trends", ["snapshot_id", "id"])
+    op.create_foreign_key(
+        "trends_snapshot_id_fkey", "trends", "trend_snapshots", ["snapshot_id"], ["id"], ondelete="CASCADE"
+    )
+
+
+def downgrade() -> None:
+    # only the current snapshot of one instance fits the previous primary key
+    op.execute("DELETE FROM trends WHERE snapshot_id <> (SELECT max(snapshot_id) FROM current_trend_snapshots)")
+
+    op.drop_constraint("trends_snapshot_id_fkey", "trends", type_="foreignkey")
+    op.drop_constraint("trends_pkey", "trends", type_="primary")
+    op.create_primary_key("trends_pkey", "trends", ["id"])
+    op.alter_column("trends", "id", type_=sa.Integer(), existing_nullable=False)
+    op.drop_column("trends", "snapshot_id")
+
+    op.drop_index("trend_history_day_index", table_name="trend_history")
+    op.drop_table("trend_history")
+    op.drop_table("current_trend_snapshots")
+    op.drop_index("trend_snapshots_instance_url_taken_at_index", table_name="trend_snapshots")
+    op.drop_table("trend_snapshots")
@@ -0,0 +1,33 @@
+"""statuses to check classification attempts
+
+Revision ID: f27b9c4e0a15
+Revises: 8c3f6a2d5e91
+Create Date: 2026-10-18 16:20:33.807214
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f27b9c4e0a15"
+down_revision = "8c3f6a2d5e91"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the batch classifier gives up on rows which failed this many runs
+    op.add_column(
+        "statuses_to_check",
+        sa.Column(
+            "classification_attempts",
+            sa.Integer(),
+            server_default=sa.text("0"),
+            nullable=False,
+            comment="Failed Classification Attempts",
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("statuses_to_check", "classification_attempts")
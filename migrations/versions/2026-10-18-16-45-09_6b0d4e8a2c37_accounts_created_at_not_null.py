@@ -0,0 +1,39 @@
+"""accounts created_at not null
+
+Revision ID: 6b0d4e8a2c37
+Revises: f27b9c4e0a15
+Create Date: 2026-10-18 16:45:09.214683
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6b0d4e8a2c37"
+down_revision = "f27b9c4e0a15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (created_at, id) is the cursor of the accounts pagination, a row value comparison never matches NULLs
+    op.execute("UPDATE accounts SET created_at = TIMEZONE('utc', now()) WHERE created_at IS NULL")
+    op.alter_column(
+        "accounts",
+        "created_at",
+        existing_type=sa.DateTime(),
+        nullable=False,
+        server_default=sa.text("TIMEZONE('utc', now())"),
+        existing_comment="Created At",
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "accounts",
+        "created_at",
+        existing_type=sa.DateTime(),
+        nullable=True,
+        server_default=None,
+        existing_comment="Created At",
+    )
@@ -4,22 +4,32 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.responses import cached_response
+from db.models.account_model import AccountModel
 from db.schemas.account_schema import AccountSchema
 from db.schemas.common_schema import ResultsResponse
 from db.session_manager import get_session
 from services.account_service import get_accounts
+from services.count_service import CountMode
+from settings import get_settings
 from utils.helpers import response_wrapper_results
 
 # project
 
+settings = get_settings()
+
 router = APIRouter(tags=["1. Accounts"], prefix="/accounts")
 
 
 @router.get("", response_model=ResultsResponse[AccountSchema])
+@cached_response(ttl=settings.LIST_CACHE_TTL, namespace="responses:accounts", tags=(AccountModel.__tablename__,))
 async def get_suspicious_accounts(
     instance: str | None = Query(None),
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1),
+    cursor: bool = Query(default=False),
+    after: str | None = Query(None),
+    count: CountMode = Query(default=CountMode.EXACT),
     session: AsyncSession = Depends(get_session)
 ):
     """
@@ -29,10 +39,14 @@ async def get_suspicious_accounts(
         session=session,
         page=page,
         limit=limit,
+        cursor=cursor,
+        after=after,
+        count=count,
         instance=instance
     )
 
     return response_wrapper_results(
         results=accounts,
-        pagination=pagination
+        pagination=pagination,
+        schema=AccountSchema,
     )
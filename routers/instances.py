@@ -4,21 +4,31 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.responses import cached_response
+from db.models.instance_model import InstanceModel
 from db.schemas.common_schema import ResultsResponse
 from db.schemas.instance_schema import InstanceSchema
 from db.session_manager import get_session
+from services.count_service import CountMode
 from services.instance_service import get_all_instances
+from settings import get_settings
 from utils.helpers import response_wrapper_results
 
 # project
 
+settings = get_settings()
+
 router = APIRouter(tags=["2. Instances"], prefix="/instances")
 
 
 @router.get("", response_model=ResultsResponse[InstanceSchema])
+@cached_response(ttl=settings.LIST_CACHE_TTL, namespace="responses:instances", tags=(InstanceModel.__tablename__,))
 async def get_instances(
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1),
+    cursor: bool = Query(default=False),
+    after: str | None = Query(None),
+    count: CountMode = Query(default=CountMode.EXACT),
     session: AsyncSession = Depends(get_session)
 ):
     """
@@ -28,6 +38,9 @@ async def get_instances(
         session=session,
         page=page,
         limit=limit,
+        cursor=cursor,
+        after=after,
+        count=count,
     )
 
     return response_wrapper_results(
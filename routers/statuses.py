@@ -4,21 +4,33 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.responses import cached_response
+from db.models.statuses_to_check_model import StatusToCheckModel
 from db.schemas.common_schema import ResultsResponse
 from db.schemas.suspicious_status_schema import SuspiciousStatusSchema
 from db.session_manager import get_session
+from services.count_service import CountMode
 from services.status_service import get_all_suspicious_statuses
+from settings import get_settings
 from utils.helpers import response_wrapper_results
 
 # project
 
+settings = get_settings()
+
 router = APIRouter(tags=["4. Statuses"], prefix="/statuses")
 
 
 @router.get("/suspicious", response_model=ResultsResponse[SuspiciousStatusSchema])
+@cached_response(
+    ttl=settings.LIST_CACHE_TTL, namespace="responses:statuses", tags=(StatusToCheckModel.__tablename__,)
+)
 async def get_suspicious_statuses(
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1),
+    cursor: bool = Query(default=False),
+    after: str | None = Query(None),
+    count: CountMode = Query(default=CountMode.EXACT),
     session: AsyncSession = Depends(get_session)
 ):
     """
@@ -28,6 +40,9 @@ async def get_suspicious_statuses(
         session=session,
         page=page,
         limit=limit,
+        cursor=cursor,
+        after=after,
+        count=count,
     )
 
     return response_wrapper_results(
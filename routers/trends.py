@@ -4,21 +4,33 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.responses import cached_response
+from db.models.trend_model import SuspiciousTrendModel, TrendModel
 from db.schemas.common_schema import ResultsResponse
-from db.schemas.trend_schema import SuspiciousTrendSchema, TrendSchema
+from db.schemas.trend_schema import (FederatedTrendSchema,
+                                     SuspiciousTrendSchema, TrendSchema)
 from db.session_manager import get_session
-from services.trends_service import get_all_suspicious_trends, get_all_trends
+from services.count_service import CountMode
+from services.trends_service import (get_all_suspicious_trends, get_all_trends,
+                                     get_federated_trends)
+from settings import get_settings
 from utils.helpers import response_wrapper_results
 
 # project
 
+settings = get_settings()
+
 router = APIRouter(tags=["3. Trends"], prefix="/trends")
 
 
 @router.get("", response_model=ResultsResponse[TrendSchema])
+@cached_response(ttl=settings.LIST_CACHE_TTL, namespace="responses:trends", tags=(TrendModel.__tablename__,))
 async def get_trends(
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1),
+    cursor: bool = Query(default=False),
+    after: str | None = Query(None),
+    count: CountMode = Query(default=CountMode.EXACT),
     session: AsyncSession = Depends(get_session)
 ):
     """
@@ -27,7 +39,32 @@ async def get_trends(
     trends, pagination = await get_all_trends(
         session=session,
         page=page,
-        limit=limit
+        limit=limit,
+        cursor=cursor,
+        after=after,
+        count=count,
+    )
+
+    return response_wrapper_results(
+        results=trends,
+        pagination=pagination
+    )
+
+
+@router.get("/federated", response_model=ResultsResponse[FederatedTrendSchema])
+@cached_response(ttl=settings.LIST_CACHE_TTL, namespace="responses:trends", tags=(TrendModel.__tablename__,))
+async def get_trends_federated(
+    page: int = Query(default=1, ge=1),
+    limit: int = Query(default=20, ge=1),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Get trends of all collected instances merged by name
+    """
+    trends, pagination = await get_federated_trends(
+        session=session,
+        page=page,
+        limit=limit,
     )
 
     return response_wrapper_results(
@@ -37,10 +74,14 @@ async def get_trends(
 
 
 @router.get("/suspicious", response_model=ResultsResponse[SuspiciousTrendSchema])
+@cached_response(ttl=settings.LIST_CACHE_TTL, namespace="responses:trends", tags=(SuspiciousTrendModel.__tablename__,))
 async def get_suspicious_trends(
     instance: str | None = Query(None),
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1),
+    cursor: bool = Query(default=False),
+    after: str | None = Query(None),
+    count: CountMode = Query(default=CountMode.EXACT),
     session: AsyncSession = Depends(get_session)
 ):
     """
@@ -50,6 +91,9 @@ async def get_suspicious_trends(
         session=session,
         page=page,
         limit=limit,
+        cursor=cursor,
+        after=after,
+        count=count,
         instance=instance
     )
 
@@ -1,42 +1,52 @@
 # stdlib
-from sqlalchemy import func, select
+from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.db_setup import ScopedSession
 from db.models.account_model import AccountModel
-from utils.pagination import calculate_pagination
+from services.count_service import CountMode, count_rows
+from utils.pagination import (apply_cursor, calculate_cursor_pagination,
+                              calculate_pagination)
 
 
-async def get_accounts(session: AsyncSession, page: int, limit: int, instance: str = None):
+async def get_accounts(
+        session: AsyncSession,
+        page: int,
+        limit: int,
+        instance: str = None,
+        cursor: bool = False,
+        after: str = None,
+        count: CountMode = CountMode.EXACT,
+):
+    if cursor or after:
+        query = select(AccountModel)
+        if instance:
+            query = query.filter(AccountModel.instance_url == instance)  # noqa
+
+        columns = (AccountModel.created_at, AccountModel.id)
+        result = await session.execute(apply_cursor(query=query, columns=columns, after=after, limit=limit))
+        return calculate_cursor_pagination(rows=result.scalars().all(), columns=columns, limit=limit)
+
     query = (
         select(AccountModel)
         .offset((page - 1) * limit)
         .limit(limit)
     )
 
-    count_query = (
-        select(func.count(AccountModel.id))
-        .offset((page - 1) * limit)
-        .limit(limit)
-    )
-
     if instance:
         query = query.filter(AccountModel.instance_url == instance)  # noqa
-        count_query = count_query.filter(AccountModel.instance_url == instance)  # noqa
 
     result = await session.execute(query)
-    results = await session.execute(count_query)
+    accounts = result.scalars().all()
 
-    total_count = results.scalar()
+    total_count = await count_rows(session=session, model=AccountModel, mode=count, instance_url=instance)
 
-    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count)
-    accounts = result.scalars().all()
+    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count, results_count=len(accounts))
 
     return accounts, pagination
 
 
-def create_or_update_account(session: ScopedSession, account: dict, instance_url: str):
+async def create_or_update_account(session: AsyncSession, account: dict, instance_url: str):
     insert_stmt = insert(AccountModel).values(**account)
 
     insert_stmt = insert_stmt.on_conflict_do_update(
@@ -60,4 +70,4 @@ def create_or_update_account(session: ScopedSession, account: dict, instance_url
         ),
     )
 
-    return session.execute(insert_stmt)
+    return await session.execute(insert_stmt)
@@ -0,0 +1,248 @@
+# stdlib
+import asyncio
+import random
+import time
+from contextlib import aclosing
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# thirdparty
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# project
+from cache.redis import invalidate_tags
+from db.models.statuses_to_check_model import StatusToCheckModel
+from db.session_manager import db_manager
+from services.llm_provider import LLMModel, parse_verdict
+from services.status_service import (increment_classification_attempts,
+                                     llm_provider, save_ai_responses)
+from services.verdict_cache import (Verdict, get_cached_verdicts,
+                                    store_verdict, verdict_key)
+from settings import get_settings
+from utils.logging import logger
+from utils.metrics import (BATCH_CLASSIFIER_COST, BATCH_CLASSIFIER_ERRORS,
+                           BATCH_CLASSIFIER_ITEMS, BATCH_CLASSIFIER_TOKENS)
+from utils.rate_limiter import TokenBucket
+from utils.verdict_parser import IncrementalVerdictParser
+
+settings = get_settings()
+
+# dollars per million input and output tokens
+MODEL_PRICES: Dict[LLMModel, Tuple[float, float]] = {
+    LLMModel.OPENAI: (0.15, 0.60),
+    LLMModel.CLAUDE: (3.00, 15.00),
+    LLMModel.GEMINI: (0.10, 0.40),
+    LLMModel.LLAMA: (0.88, 0.88),
+}
+
+MODEL_API_KEYS: Dict[LLMModel, str] = {
+    LLMModel.OPENAI: settings.OPENAI_API_KEY,
+    LLMModel.CLAUDE: settings.ANTHROPIC_API_KEY,
+    LLMModel.GEMINI: settings.GOOGLE_API_KEY,
+    LLMModel.LLAMA: settings.TOGETHER_API_KEY,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # streamed responses do not report usage, four characters per token is close enough for accounting
+    return max(len(text) // 4, 1)
+
+
+class BatchClassifier:
+    """
+    Drains unchecked statuses_to_check rows in batches. Every row is classified by all configured models concurrently,
+    with a bounded number of requests in flight and a token bucket per API key. Verdicts which are already cached are
+    reused, rows are walked in (created_at, id) order and results of a batch are written in a single transaction, so
+    an interrupted run simply continues from the first unchecked row next time. Rows which could not be classified
+    are skipped after max_attempts runs.
+    """
+
+    def __init__(
+        self,
+        models: List[LLMModel],
+        batch_size: int,
+        concurrency: int,
+        rate_limit: float,
+        burst: int,
+        max_retries: int,
+        max_attempts: int,
+        retry_delay: float = 1.0,
+        verdict_only: bool = False,
+    ) -> None:
+        self.models = models
+        self.max_attempts = max_attempts
+        self.verdict_only = verdict_only
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._semaphores = {model: asyncio.Semaphore(concurrency) for model in models}
+        # models sharing an API key share its rate limit
+        buckets: Dict[str, TokenBucket] = {}
+        self._rate_limiters = {
+            model: buckets.setdefault(MODEL_API_KEYS[model], TokenBucket(rate=rate_limit, capacity=burst))
+            for model in models
+        }
+
+    async def run(self, max_batches: int) -> int:
+        if not self.models:
+            logger.warning("No models with API keys are configured for the batch classifier")
+            return 0
+
+        classified = 0
+        started_at = time.monotonic()
+        after: Optional[Tuple[datetime, str]] = None
+
+        for _ in range(max_batches):
+            # the session is only held for reads and writes, not while waiting for the models
+            async with db_manager.session() as session:
+                statuses = await self._get_unchecked_statuses(session=session, after=after)
+                if not statuses:
+                    break
+
+                status_dicts = [self._to_dict(status) for status in statuses]
+                cached = await get_cached_verdicts(
+                    session=session, statuses=status_dicts, models=self.models, verdict_only=self.verdict_only
+                )
+
+            after = (statuses[-1].created_at, statuses[-1].id)
+            responses = await self._classify_batch(status_dicts=status_dicts, cached=cached)
+
+            classified_ids = {response["status_id"] for response in responses}
+            failed_ids = [status_dict["id"] for status_dict in status_dicts if status_dict["id"] not in classified_ids]
+
+            async with db_manager.session() as session:
+                await save_ai_responses(session=session, responses=responses)
+                await increment_classification_attempts(session=session, status_ids=failed_ids)
+
+            if responses:
+                await invalidate_tags(StatusToCheckModel.__tablename__)
+
+            classified += len(responses)
+            elapsed = time.monotonic() - started_at
+            logger.info(f"Classified {classified} statuses, {classified / elapsed:.2f} statuses/s")
+
+        return classified
+
+    async def _get_unchecked_statuses(
+        self, session: AsyncSession, after: Optional[Tuple[datetime, str]]
+    ) -> List[StatusToCheckModel]:
+        query = (
+            select(StatusToCheckModel)
+            .filter(StatusToCheckModel.checked_at.is_(None))
+            # rows which keep failing are given up on instead of being retried every run
+            .filter(StatusToCheckModel.classification_attempts < self.max_attempts)
+            .order_by(StatusToCheckModel.created_at, StatusToCheckModel.id)
+            .limit(self.batch_size)
+        )
+
+        # rows which failed earlier in this run are not picked up again
+        if after is not None:
+            query = query.filter(tuple_(StatusToCheckModel.created_at, StatusToCheckModel.id) > after)
+
+        result = await session.execute(query)
+        return result.scalars().all()
+
+    @staticmethod
+    def _to_dict(status: StatusToCheckModel) -> dict:
+        status_dict = dict(status.__dict__)
+        status_dict.pop("_sa_instance_state", None)
+        return status_dict
+
+    async def _classify_batch(
+        self, status_dicts: List[dict], cached: Dict[Tuple[str, LLMModel], Verdict]
+    ) -> List[dict]:
+        jobs = [
+            (status_dict, model)
+            for status_dict in status_dicts
+            for model in self.models
+            if (status_dict["id"], model) not in cached
+        ]
+        verdicts = await asyncio.gather(*(self._classify(status=status, model=model) for status, model in jobs))
+
+        results = dict(cached)
+        for (status_dict, model), verdict in zip(jobs, verdicts):
+            if verdict is not None:
+                results[(status_dict["id"], model)] = verdict
+
+        responses = []
+        for status_dict in status_dicts:
+            # a row is checked only when every model has given its verdict
+            if not all((status_dict["id"], model) in results for model in self.models):
+                continue
+
+            responses.append(
+                dict(
+                    status_id=status_dict["id"],
+                    verdicts={model: results[(status_dict["id"], model)] for model in self.models},
+                )
+            )
+
+        return responses
+
+    async def _classify(self, status: dict, model: LLMModel) -> Optional[Verdict]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphores[model]:
+                    await self._rate_limiters[model].acquire()
+
+                    parser = IncrementalVerdictParser()
+                    truncated = False
+                    async with aclosing(llm_provider.analyze(status, model)) as deltas:
+                        async for delta in deltas:
+                            parser.feed(delta)
+
+                            # the reasoning is not needed, stop paying for output tokens
+                            if self.verdict_only and parser.done:
+                                truncated = True
+                                break
+            except Exception as e:
+                BATCH_CLASSIFIER_ERRORS.labels(model.value).inc()
+                if attempt == self.max_retries:
+                    logger.error(f"Failed to classify status {status['id']} with {model.value}: {str(e)}")
+                    return None
+
+                # exponential backoff with full jitter, so retries of one batch do not hit the API at once
+                await asyncio.sleep(random.uniform(0, self.retry_delay * 2 ** attempt))
+                continue
+
+            response = parser.text
+            _, confidence, is_suspicious = parse_verdict(parser)
+            verdict = Verdict(
+                response=response, confidence=confidence, is_suspicious=is_suspicious, truncated=truncated
+            )
+            await store_verdict(key=verdict_key(status=status, model=model, truncated=truncated), verdict=verdict)
+
+            self._account(model=model, prompt=llm_provider.build_prompt(status), response=response)
+            return verdict
+
+        return None
+
+    @staticmethod
+    def _account(model: LLMModel, prompt: str, response: str) -> None:
+        input_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(response)
+        input_price, output_price = MODEL_PRICES[model]
+
+        BATCH_CLASSIFIER_ITEMS.labels(model.value).inc()
+        BATCH_CLASSIFIER_TOKENS.labels(model.value, "input").inc(input_tokens)
+        BATCH_CLASSIFIER_TOKENS.labels(model.value, "output").inc(output_tokens)
+        BATCH_CLASSIFIER_COST.labels(model.value).inc(
+            (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+        )
+
+
+def create_batch_classifier() -> BatchClassifier:
+    # models without an API key are skipped
+    models = [LLMModel(model) for model in settings.BATCH_CLASSIFIER_MODELS if MODEL_API_KEYS[LLMModel(model)]]
+
+    return BatchClassifier(
+        models=models,
+        batch_size=settings.BATCH_CLASSIFIER_BATCH_SIZE,
+        concurrency=settings.BATCH_CLASSIFIER_CONCURRENCY,
+        rate_limit=settings.BATCH_CLASSIFIER_RATE_LIMIT,
+        burst=settings.BATCH_CLASSIFIER_BURST,
+        max_retries=settings.BATCH_CLASSIFIER_MAX_RETRIES,
+        max_attempts=settings.BATCH_CLASSIFIER_MAX_ATTEMPTS,
+        verdict_only=settings.BATCH_CLASSIFIER_VERDICT_ONLY,
+    )
@@ -0,0 +1,101 @@
+# stdlib
+from enum import Enum
+from typing import Any, Optional
+
+# thirdparty
+import orjson
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# project
+from cache.redis import build_key
+from db.db_setup import redis_client
+from settings import get_settings
+from utils.logging import logger
+
+settings = get_settings()
+
+
+class CountMode(str, Enum):
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    NONE = "none"
+
+
+def _generation_key(table: str) -> str:
+    return f"count_generation:{table}"
+
+
+async def count_rows(session: AsyncSession, model, mode: CountMode = CountMode.EXACT, **filters: Any) -> Optional[int]:
+    """
+    Count rows of a model matching equality filters, filters with None values are ignored.
+    Exact counts are cached in Redis per filter until the table is written to, estimated counts come from planner
+    statistics and cost nothing, no count is returned at all in the none mode.
+    """
+    if mode is CountMode.NONE:
+        return None
+
+    filters = {key: value for key, value in filters.items() if value is not None}
+    query = select(func.count()).select_from(model).filter_by(**filters)
+
+    if mode is CountMode.ESTIMATED:
+        estimated_count = await estimate_count(session=session, model=model, filters=filters)
+        if estimated_count is not None:
+            return estimated_count
+
+    table = model.__tablename__
+
+    try:
+        # a new generation is started on every write, so stale counts are never read again
+        generation = int(await redis_client.get(_generation_key(table)) or 0)
+        key = f"count:{table}:{generation}:{build_key(**filters)}"
+        cached_count = await redis_client.get(key)
+    except Exception as e:
+        logger.warning(f"Failed to read the count of {table} from Redis: {str(e)}")
+        key, cached_count = None, None
+
+    if cached_count is not None:
+        return int(cached_count)
+
+    result = await session.execute(query)
+    total_count = result.scalar()
+
+    if key is not None:
+        try:
+            await redis_client.set(key, total_count, ex=settings.COUNT_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to store the count of {table} in Redis: {str(e)}")
+
+    return total_count
+
+
+async def estimate_count(session: AsyncSession, model, filters: dict) -> Optional[int]:
+    # statistics of the whole table are kept by autovacuum and ANALYZE
+    if not filters:
+        query = text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)")
+        result = await session.execute(query, {"table": model.__tablename__})
+        estimated_count = result.scalar()
+
+        # the table has never been analyzed yet
+        return estimated_count if estimated_count is not None and estimated_count >= 0 else None
+
+    # the planner estimates the number of rows matching filters
+    query = select(1).select_from(model).filter_by(**filters)
+    compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+
+    plan = result.scalar()
+    if isinstance(plan, (str, bytes)):
+        plan = orjson.loads(plan)
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def invalidate_counts(*models) -> None:
+    """Forget cached counts of tables which were written to."""
+    for model in models:
+        try:
+            await redis_client.incr(_generation_key(model.__tablename__))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate the count of {model.__tablename__}: {str(e)}")
@@ -0,0 +1,126 @@
+# stdlib
+import asyncio
+from collections import Counter
+from typing import Optional, Set
+
+# project
+from cache.redis import invalidate_tags
+from db.models.trend_model import SuspiciousTrendModel
+from db.session_manager import db_manager
+from services.count_service import invalidate_counts
+from services.trends_service import \
+    increment_suspicious_trends_number_of_similar_posts
+from settings import get_settings
+from utils.logging import logger
+
+settings = get_settings()
+
+
+class SimilarPostsCounter:
+    """
+    Aggregates increments of the number of similar posts of suspicious trends in memory and writes them
+    periodically, a single UPDATE ... + n per trend instead of one per processed status. Readers see the counts
+    eventually, at most one flush interval late.
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        self._flush_interval = flush_interval
+        self._deltas: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, suspicious_trend_id: int, number: int = 1) -> None:
+        self._deltas[suspicious_trend_id] += number
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        # write whatever was counted since the last flush
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._deltas:
+            return
+
+        # increments made while writing go to the next flush
+        deltas, self._deltas = self._deltas, Counter()
+
+        try:
+            async with db_manager.session() as session:
+                await increment_suspicious_trends_number_of_similar_posts(session=session, deltas=deltas)
+        except asyncio.CancelledError:
+            self._deltas.update(deltas)
+            raise
+        except Exception as e:
+            logger.error(f"Failed to flush similar posts of {len(deltas)} suspicious trends: {str(e)}")
+            # keep the deltas, they are written with the next flush
+            self._deltas.update(deltas)
+            return
+
+        await invalidate_tags(SuspiciousTrendModel.__tablename__)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+
+
+class PendingInvalidations:
+    """
+    Collects models whose rows were written and invalidates their cached counts and lists once per flush interval,
+    a burst of writes costs a single INCR and publish per model instead of one per write. Readers see the changes
+    eventually, at most one flush interval late.
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        self._flush_interval = flush_interval
+        self._models: Set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, *models) -> None:
+        self._models.update(models)
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._models:
+            return
+
+        models, self._models = self._models, set()
+
+        # both calls log and swallow Redis errors, cached values expire with their TTL then
+        await invalidate_counts(*models)
+        await invalidate_tags(*(model.__tablename__ for model in models))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+
+
+similar_posts_counter = SimilarPostsCounter(flush_interval=settings.SIMILAR_POSTS_FLUSH_INTERVAL)
+pending_invalidations = PendingInvalidations(flush_interval=settings.LISTENER_INVALIDATION_INTERVAL)
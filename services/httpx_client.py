@@ -1,41 +1,36 @@
 # stdlib
-from contextlib import ContextDecorator
-from typing import Optional, Type
+import importlib.util
+from typing import Optional
 
 # thirdparty
-from httpx import Client
+from httpx import AsyncClient, Limits, Timeout
 
+# project
+from utils.logging import logger
 
-class HTTPXClient:
-    client: Optional[Client]
+
+class AsyncHTTPXClient:
+    client: Optional[AsyncClient]
     host: str
     entry_point: str
     base_url: str
 
-    def __init__(self, host=None, entry_point=None):
-        self.client = Client()  # timeout=Timeout(timeout=5000))
+    def __init__(self, host=None, entry_point=None, timeout=5.0, max_connections=20, http2=False):
         self.host = host
         self.entry_point = entry_point
         self.base_url = f"{host}{entry_point}"
 
-    def destructor(self):
-        self.client.close()
-
-
-class HTTPXContextManager(ContextDecorator):
-    def __init__(self, service_client: Type[HTTPXClient], *args, host=None):
-        self._service_client = service_client
-        self._service_client_instance = None
-        self._host = host
-
-        super().__init__()
-
-    def __enter__(self) -> HTTPXClient:
-        self._service_client_instance = self._service_client()
-        return self._service_client_instance
-
-    def __exit__(self, type, value, traceback):
-        self._service_client_instance.destructor()
+        # httpx raises ImportError for http2 without the h2 package (the http2 extra of httpx)
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 is enabled, but the h2 package is not installed, falling back to HTTP/1.1")
+            http2 = False
 
+        # a long-lived client keeps connections alive between requests
+        self.client = AsyncClient(
+            timeout=Timeout(timeout),
+            limits=Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=http2,
+        )
 
-httpx_context_manager = HTTPXContextManager
+    async def destructor(self):
+        await self.client.aclose()
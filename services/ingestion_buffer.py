@@ -0,0 +1,143 @@
+# stdlib
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# project
+from db.session_manager import db_manager
+from services.counter_buffer import pending_invalidations
+from services.status_service import BULK_SAVER_MODELS
+from settings import get_settings
+from utils.logging import logger
+
+settings = get_settings()
+
+Writer = Callable[..., Awaitable[None]]
+
+_STOP = object()
+
+
+class IngestionBuffer:
+    """
+    Bounded in-memory buffer which collects rows for the stream listener and writes them to the database
+    in batches. Each row is queued together with a bulk writer function (e.g. save_raw_statuses), rows are grouped
+    by writer on flush and every batch is committed in a single transaction. Failed batches are retried with
+    a backoff, then every writer is written on its own and failing batches are split, so only rows which can not
+    be written at all are lost.
+    """
+
+    def __init__(
+        self, max_size: int, batch_size: int, flush_interval: float, max_retries: int = 3, retry_delay: float = 0.5
+    ) -> None:
+        self._max_size = max_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+
+        self._queue = asyncio.Queue(maxsize=self._max_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        # the sentinel goes through the same queue, so everything added before stop() is flushed
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def put(self, writer: Writer, row: dict) -> None:
+        # waits while the buffer is full, so producers slow down instead of growing memory unbounded
+        await self._queue.put((writer, row))
+
+    async def _run(self) -> None:
+        batch: List[Tuple[Writer, dict]] = []
+        deadline = time.monotonic() + self._flush_interval
+
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _STOP:
+                await self._flush(batch)
+                return
+
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self._batch_size or time.monotonic() >= deadline:
+                await self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self._flush_interval
+
+    async def _flush(self, batch: List[Tuple[Writer, dict]]) -> None:
+        if not batch:
+            return
+
+        grouped: Dict[Writer, List[dict]] = {}
+        for writer, row in batch:
+            grouped.setdefault(writer, []).append(row)
+
+        if await self._write_with_retries(grouped):
+            written = list(grouped)
+        else:
+            written = [writer for writer, rows in grouped.items() if await self._write_split(writer, rows)]
+
+        # cached counts and lists of the written tables are invalidated once per invalidation interval
+        pending_invalidations.add(*(BULK_SAVER_MODELS[writer] for writer in written if writer in BULK_SAVER_MODELS))
+
+    async def _write_with_retries(self, grouped: Dict[Writer, List[dict]]) -> bool:
+        # the buffer fills up while waiting, so producers are slowed down during short database outages
+        for attempt in range(self._max_retries + 1):
+            try:
+                await self._write(grouped)
+                return True
+            except Exception as e:
+                rows_count = sum(len(rows) for rows in grouped.values())
+                logger.warning(f"Failed to flush {rows_count} buffered rows, attempt {attempt + 1}: {str(e)}")
+
+            if attempt < self._max_retries:
+                await asyncio.sleep(self._retry_delay * 2 ** attempt)
+
+        return False
+
+    async def _write_split(self, writer: Writer, rows: List[dict]) -> bool:
+        """Write rows of a writer, halving batches which fail. Returns whether any of the rows were written."""
+        try:
+            await self._write({writer: rows})
+            return True
+        except Exception as e:
+            if len(rows) == 1:
+                logger.error(f"Dropped buffered row {rows[0].get('id')} of {writer.__name__}: {str(e)}")
+                return False
+
+        middle = len(rows) // 2
+        first_written = await self._write_split(writer, rows[:middle])
+        second_written = await self._write_split(writer, rows[middle:])
+        return first_written or second_written
+
+    @staticmethod
+    async def _write(grouped: Dict[Writer, List[dict]]) -> None:
+        async with db_manager.session() as session:
+            for writer, rows in grouped.items():
+                await writer(session=session, statuses=rows)
+
+
+ingestion_buffer = IngestionBuffer(
+    max_size=settings.INGESTION_BUFFER_SIZE,
+    batch_size=settings.INGESTION_BATCH_SIZE,
+    flush_interval=settings.INGESTION_FLUSH_INTERVAL,
+    max_retries=settings.INGESTION_MAX_RETRIES,
+    retry_delay=settings.INGESTION_RETRY_DELAY,
+)
@@ -0,0 +1,186 @@
+# stdlib
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.sharedctypes import Synchronized
+from typing import List
+
+# project
+from db.session_manager import db_manager
+from services.instance_service import get_instances_by_active_users
+from settings import get_settings
+from utils.logging import logger, setup_logging
+from utils.multiprocess_metrics import (create_metrics_dir, mark_process_dead,
+                                        remove_metrics_dir,
+                                        start_metrics_server)
+
+settings = get_settings()
+
+
+async def select_instances(limit: int) -> List[str]:
+    db_manager.init(settings.DATABASE_URL)
+    try:
+        async with db_manager.session() as session:
+            names = await get_instances_by_active_users(session=session, limit=limit)
+    finally:
+        await db_manager.close()
+
+    instance_urls = [settings.MASTODON_INSTANCE_ENDPOINT.rstrip("/")]
+    for name in names:
+        instance_url = f"https://{name}"
+        if instance_url not in instance_urls:
+            instance_urls.append(instance_url)
+
+    return instance_urls[:limit]
+
+
+def shard_instances(instance_urls: List[str], shards: int) -> List[List[str]]:
+    # instances are sorted by active users, round robin spreads the biggest ones across processes
+    return [instance_urls[shard::shards] for shard in range(shards) if instance_urls[shard::shards]]
+
+
+def run_shard(instance_urls: List[str], heartbeat: Synchronized) -> None:
+    # spawned children start from a fresh interpreter without the logging configuration of the supervisor
+    setup_logging(logging.INFO)
+
+    # imported in the child process, so every shard gets its own buffer, indexes and connections
+    from services.listener import listen_mastodon_streams
+
+    started_at = None
+
+    def report_health(health: List[dict]) -> None:
+        nonlocal started_at
+        now = time.time()
+        started_at = started_at or now
+
+        stale = [
+            stream
+            for stream in health
+            if not stream["connected"] or now - (stream["last_event_at"] or started_at) > settings.STREAM_STALE_TIMEOUT
+        ]
+        if stale:
+            logger.warning(
+                f"{len(stale)} of {len(health)} streams are stale: "
+                + ", ".join(
+                    f"{stream['instance']} (connected {stream['connected']}, "
+                    f"{stream['consecutive_failures']} failures, {stream['queue_depth']} queued)"
+                    for stream in stale
+                )
+            )
+
+        # the supervisor restarts the shard when none of its streams received a status for too long
+        heartbeat.value = max([started_at] + [stream["last_event_at"] or 0.0 for stream in health])
+
+    async def main():
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        # cancel the listener on termination, so buffered rows are flushed
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, task.cancel)
+
+        db_manager.init(settings.DATABASE_URL)
+        try:
+            await listen_mastodon_streams(instance_urls=instance_urls, report_health=report_health)
+        except asyncio.CancelledError:
+            logger.info(f"Shard of {len(instance_urls)} instances shut down gracefully.")
+        finally:
+            await db_manager.close()
+
+    asyncio.run(main())
+
+
+class IngestionSupervisor:
+    """Streams public timelines of the most active instances, sharded across worker processes."""
+
+    def __init__(
+            self,
+            instances_count: int,
+            processes: int,
+            stale_timeout: float,
+            metrics_port: int,
+            check_interval: float = 5.0,
+    ) -> None:
+        self.instances_count = instances_count
+        self.processes = processes or multiprocessing.cpu_count()
+        self.stale_timeout = stale_timeout
+        self.metrics_port = metrics_port
+        self.check_interval = check_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._shards: List[List[str]] = []
+        self._workers: List[multiprocessing.Process] = []
+        # unix time of the last status received by a shard, zero until its streams started
+        self._heartbeats: List[Synchronized] = []
+        self._metrics_dir = ""
+        self._stopped = False
+
+    def _start_worker(self, shard: int) -> multiprocessing.Process:
+        self._heartbeats[shard].value = 0.0
+        worker = self._context.Process(
+            target=run_shard,
+            args=(self._shards[shard], self._heartbeats[shard]),
+            name=f"ingestion-shard-{shard}",
+        )
+        worker.start()
+        logger.info(f"Started {worker.name} (pid {worker.pid}) for {len(self._shards[shard])} instances")
+        return worker
+
+    def _restart_worker(self, shard: int) -> None:
+        # gauges of the previous process must not add up with the ones of its replacement
+        mark_process_dead(self._workers[shard].pid, self._metrics_dir)
+        self._workers[shard] = self._start_worker(shard)
+
+    def _is_stale(self, shard: int) -> bool:
+        heartbeat = self._heartbeats[shard].value
+        return bool(heartbeat) and time.time() - heartbeat > self.stale_timeout
+
+    @staticmethod
+    def _terminate(worker: multiprocessing.Process, timeout: float = 30.0) -> None:
+        # buffered rows are flushed on SIGTERM, a shard stuck in the flush is killed
+        worker.terminate()
+        worker.join(timeout)
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+
+    def stop(self, *args) -> None:
+        self._stopped = True
+
+    def run(self) -> None:
+        instance_urls = asyncio.run(select_instances(limit=self.instances_count))
+        self._shards = shard_instances(instance_urls=instance_urls, shards=self.processes)
+
+        # shards inherit the environment, database pools are divided between them like between gunicorn workers
+        os.environ["WEB_CONCURRENCY"] = str(len(self._shards))
+        # shards write their metrics into a shared directory, the supervisor serves them aggregated
+        self._metrics_dir = create_metrics_dir(prefix="analyzer-ingestion-metrics-")
+        start_metrics_server(port=self.metrics_port, path=self._metrics_dir)
+        logger.info(f"Serving metrics of the ingestion shards on port {self.metrics_port}")
+
+        self._heartbeats = [self._context.Value("d", 0.0) for _ in self._shards]
+        self._workers = [self._start_worker(shard) for shard in range(len(self._shards))]
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        try:
+            # restart shards which died or whose streams stopped delivering statuses
+            while not self._stopped:
+                for shard, worker in enumerate(self._workers):
+                    if not worker.is_alive():
+                        logger.warning(f"{worker.name} exited with code {worker.exitcode}, restarting")
+                        self._restart_worker(shard)
+                    elif self._is_stale(shard):
+                        logger.warning(f"{worker.name} received no statuses for {self.stale_timeout}s, restarting")
+                        self._terminate(worker)
+                        self._restart_worker(shard)
+                time.sleep(self.check_interval)
+
+            for worker in self._workers:
+                worker.terminate()
+            for worker in self._workers:
+                worker.join()
+        finally:
+            remove_metrics_dir(self._metrics_dir)
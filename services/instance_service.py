@@ -1,42 +1,85 @@
-from sqlalchemy import delete, func, select
+from typing import List
+
+from sqlalchemy import String, all_, bindparam, delete, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.redis import cached
+from cache.serialization import results_serializer
 from db.models.instance_model import InstanceModel
-from utils.pagination import calculate_pagination
+from db.schemas.instance_schema import InstanceSchema
+from services.count_service import CountMode, count_rows
+from settings import get_settings
+from utils.pagination import (apply_cursor, calculate_cursor_pagination,
+                              calculate_pagination)
+
+settings = get_settings()
+
+
+async def upsert_instances(session: AsyncSession, instances: List[dict], chunk_size: int = 1000):
+    # postgres accepts at most 32767 parameters per statement, rows are inserted in chunks
+    for start in range(0, len(instances), chunk_size):
+        insert_stmt = insert(InstanceModel).values(instances[start:start + chunk_size])
 
+        # unchanged rows are neither rewritten nor locked
+        insert_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={key: insert_stmt.excluded[key] for key in instances[0] if key != "id"},
+            where=InstanceModel.row_hash.is_distinct_from(insert_stmt.excluded.row_hash),
+        )
 
-async def delete_all_instances(session: AsyncSession):
-    query = delete(InstanceModel)
+        await session.execute(insert_stmt)
+
+
+async def delete_instances_except(session: AsyncSession, ids: List[str]):
+    # a single array parameter instead of one parameter per id
+    query = delete(InstanceModel).where(InstanceModel.id != all_(bindparam("ids", ids, type_=ARRAY(String))))
     await session.execute(query)
 
 
-async def update_and_retrieve_instances(session: AsyncSession, instances: list):
-    session.add_all(instances)
+async def get_instances_by_active_users(session: AsyncSession, limit: int):
+    query = (
+        select(InstanceModel.name)
+        .filter(InstanceModel.up.is_(True), InstanceModel.dead.is_not(True))
+        .order_by(InstanceModel.active_users.desc().nulls_last())
+        .limit(limit)
+    )
 
-    query = select(InstanceModel)
     result = await session.execute(query)
     return result.scalars().all()
 
 
-async def get_all_instances(session: AsyncSession, page: int, limit: int):
+@cached(
+    ttl=settings.LIST_CACHE_TTL,
+    namespace="instances",
+    serializer=results_serializer(InstanceSchema),
+    tags=(InstanceModel.__tablename__,),
+)
+async def get_all_instances(
+        session: AsyncSession,
+        page: int,
+        limit: int,
+        cursor: bool = False,
+        after: str = None,
+        count: CountMode = CountMode.EXACT,
+):
+    if cursor or after:
+        columns = (InstanceModel.id,)
+        query = apply_cursor(query=select(InstanceModel), columns=columns, after=after, limit=limit)
+        result = await session.execute(query)
+        return calculate_cursor_pagination(rows=result.scalars().all(), columns=columns, limit=limit)
+
     query = (
         select(InstanceModel)
         .offset((page - 1) * limit)
         .limit(limit)
     )
 
-    count_query = (
-        select(func.count(InstanceModel.id))
-        .offset((page - 1) * limit)
-        .limit(limit)
-    )
-
     result = await session.execute(query)
-    results = await session.execute(count_query)
+    instances = result.scalars().all()
 
-    total_count = results.scalar()
+    total_count = await count_rows(session=session, model=InstanceModel, mode=count)
 
-    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count)
-    instances = result.scalars().all()
+    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count, results_count=len(instances))
 
     return instances, pagination
@@ -1,191 +1,344 @@
 # stdlib
+import asyncio
 import re
 from copy import copy
 from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
 
-import mastodon
-# thirdparty
-from mastodon import Mastodon
-
-from db.db_setup import ScopedSession
+# project
+from cache.invalidation import listen_for_invalidations
+from db.models.account_model import AccountModel
+from db.models.trend_model import SuspiciousTrendModel
+from db.session_manager import db_manager
 from services.account_service import create_or_update_account
-from services.mastodon_social_client import HTTPXMastodonInstanceServiceClient
-from services.status_service import (get_statuses_by_tag, save_raw_status,
-                                     save_status, save_status_to_check)
-from services.trends_service import (
-    check_if_suspicious_trend_exist, check_if_trend_popular,
-    create_or_update_suspicious_trend,
-    increment_suspicious_trend_number_of_similar_posts)
+from services.counter_buffer import (pending_invalidations,
+                                     similar_posts_counter)
+from services.ingestion_buffer import ingestion_buffer
+from services.mastodon_social_client import get_tag_info_client
+from services.status_service import (get_recent_statuses, get_statuses_by_tag,
+                                     save_raw_statuses, save_statuses,
+                                     save_statuses_to_check)
+from services.stream_consumer import MastodonStreamConsumer
+from services.trend_lookup import TRENDS_INVALIDATION_CHANNEL, trend_lookup
+from services.trends_service import (create_or_update_suspicious_trend,
+                                     get_popular_trend_names,
+                                     get_suspicious_trend_names)
+from services.verdict_cache import author_bucket, content_hash
 from settings import get_settings
 from utils.logging import logger
-from utils.similarity_checker import \
-    calculate_cosine_similarity_between_two_statuses
+from utils.near_duplicates import NearDuplicateIndex
+from utils.rate_limiter import TokenBucket
+from utils.similarity_checker import SimilarityIndex
 from utils.utils import strip_html
 
-# project
 settings = get_settings()
 
-mastodon_instance = Mastodon(
-    access_token=settings.MASTODON_INSTANCE_ACCESS_TOKEN, api_base_url=settings.MASTODON_INSTANCE_ENDPOINT
+similarity_index = SimilarityIndex(
+    max_tags=settings.SIMILARITY_INDEX_MAX_TAGS,
+    max_statuses_per_tag=settings.SIMILARITY_INDEX_MAX_STATUSES_PER_TAG,
+)
+
+near_duplicate_index = NearDuplicateIndex(
+    num_perm=settings.NEAR_DUPLICATE_NUM_PERM,
+    bands=settings.NEAR_DUPLICATE_BANDS,
+    threshold=settings.NEAR_DUPLICATE_THRESHOLD,
+    max_statuses=settings.NEAR_DUPLICATE_MAX_STATUSES,
 )
 
 
-class Listener(mastodon.StreamListener):
-    def on_update(self, status):
-        status.pop("reblog", None)
-        status.pop("media_attachments", None)
-        status.pop("mentions", None)
-        status.pop("emojis", None)
-        status.pop("card", None)
-        status.pop("poll", None)
-        status.pop("filtered", None)
-        status.pop("application", None)
-        status.pop("quote", None)
-        status.pop("quote_approval", None)
-
-        # store every status
-        with ScopedSession() as session:
-            status_copy = copy(status)
-            status_copy.pop("account", None)
-            status_copy["tags"] = [item["name"] for item in status_copy["tags"]]
-            status_copy["content"] = strip_html(status_copy["content"])
-
-            save_raw_status(session=session, status=status_copy)
-
-        # check if only tags is more than 0
-        if len(status["tags"]) != 0:
-            # get author
-            account = status["account"]
-            status["content"] = strip_html(status["content"])
-
-            # get author register date
-            created_at = account["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-
-            # get time difference to check
-            difference = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
-
-            # check if a user was registered less than a month ago, has less than 1000 followers and has less
-            # than 100 statuses
-            if (
-                created_at >= difference
-                and account["followers_count"] <= 1000
-                and account["statuses_count"] <= 100
-            ):
-                tags = []
-                with ScopedSession() as session:
-                    for tag in status["tags"]:
-                        tags.append(tag["name"])
-
-                        # check if this is an existing popular current trend
-                        popular_trend = check_if_trend_popular(session=session, name=tag["name"])
-
-                        # if no trend, this is probably a new one, so it might be suspicious
-                        if not popular_trend:
-                            # try to find this trend in the database, if not - retrieve information from API
-                            suspicious_trend = check_if_suspicious_trend_exist(session=session, name=tag["name"])
-
-                            # get mastodon instance url
-                            instance_url = account["url"]
-
-                            # if mastodon.social in url, get it
-                            if "mastodon.social" in instance_url:
-                                instance_url = "https://mastodon.social"
-                            # get the first element of the array if it contains https
-                            else:
-                                instance_url = re.findall(r"^(https?:\/\/[\w.-]+)", instance_url)
-                                instance_url = instance_url[0]
-
-                            # retrieve info if trend does not exist
-                            if not suspicious_trend:
-                                # get info about this trend
-                                with HTTPXMastodonInstanceServiceClient as client:
-                                    # get aggregated info about tag in last seven days
-                                    url, accounts, uses, errors = client.get_tag_info(tag=tag["name"])
-
-                                    # if an error happened, just continue
-                                    if errors:
-                                        continue
-
-                                    # check trend info
-                                    if accounts <= 10 and uses <= 10:
-                                        # get rid of unnecessary fields for account model
-                                        account.pop("emojis", None)
-                                        account.pop("fields", None)
-                                        account.pop("noindex", None)
-                                        account.pop("roles", None)
-                                        account.pop("indexable", None)
-                                        account.pop("uri", None)
-                                        account.pop("hide_collections", None)
-
-                                        # create a new account entity or update in case of existence
-                                        create_or_update_account(
-                                            session=session, account=account, instance_url=instance_url
-                                        )
-
-                                        # create a new suspicious trend entity or update in case of existence
-                                        suspicious_trend = create_or_update_suspicious_trend(
-                                            session=session,
-                                            name=tag["name"],
-                                            url=url,
-                                            uses_in_last_seven_days=uses,
-                                            number_of_accounts=accounts,
-                                            instance_url=instance_url,
-                                        )
-
-                                        logger.info("\nPROBABLY AN ARTIFICIAL TREND AND THIS USER MIGHT BE A BOT!")
-                                        logger.info(f"ACCOUNT ACCT: {account['acct']}")
-                                        logger.info(f"ACCOUNT URL: {account['url']}")
-                                        logger.info(f"ACCOUNT CREATED_AT: {str(account['created_at'])}")
-                                        logger.info(f"ACCOUNT FOLLOWERS_COUNT: {str(account['followers_count'])}")
-                                        logger.info(f"ACCOUNT FOLLOWING_COUNT: {str(account['following_count'])}")
-                                        logger.info(f"ACCOUNT STATUSES_COUNT: {str(account['statuses_count'])}")
-                                        logger.info(f"TREND NAME: {tag['name']}")
-                                        logger.info(f"TREND URL: {tag['url']}")
-
-                                        # get statuses with this tag to check for a similar status text
-                                        statuses = get_statuses_by_tag(session=session, tag=tag["name"])
-
-                                        suspicious_status = dict(
-                                            id=status["id"],
-                                            created_at=status["created_at"],
-                                            language=status["language"],
-                                            url=status["url"],
-                                            content=status["content"],
-                                            is_suspicious=None,
-                                            checked_at=None,
-                                            author_followers_count=account["followers_count"],
-                                            author_following_count=account["following_count"],
-                                            author_statuses_count=account["statuses_count"],
-                                            author_created_at=account["created_at"],
-                                        )
-
-                                        save_status_to_check(session=session, status=suspicious_status)
-
-                                        # iterate over all stored statuses by tag
-                                        for stored_status in statuses:
-                                            # get cosine similarity between stored status and a new one
-                                            similarity = calculate_cosine_similarity_between_two_statuses(
-                                                status_content_1=stored_status.content,
-                                                status_content_2=status["content"],
-                                            )
-
-                                            # if similarity >= 0.5, increment the number of similar posts for
-                                            # suspicious trend
-                                            if similarity >= 0.5:
-                                                increment_suspicious_trend_number_of_similar_posts(
-                                                    session=session,
-                                                    suspicious_trend_id=suspicious_trend.id
-                                                )
-
-                # remove unnecessary, non-parsable elements
-                status.pop("tags", None)
-                status.pop("account", None)
-
-                # add parsed tags to status model to store it in the database
-                status["tags"] = tags
-
-                save_status(session=session, status=status)
+def get_instance_url(account: dict) -> str:
+    # get mastodon instance url
+    instance_url = account["url"]
+
+    # if mastodon.social in url, get it
+    if "mastodon.social" in instance_url:
+        return "https://mastodon.social"
+
+    # get the first element of the array if it contains https
+    return re.findall(r"^(https?:\/\/[\w.-]+)", instance_url)[0]
+
+
+def find_new_tags(tags: List[dict]) -> List[dict]:
+    """Get tags which are neither popular trends nor known suspicious trends, they might be new suspicious ones."""
+    return [
+        tag
+        for tag in tags
+        if not trend_lookup.is_popular(tag["name"]) and not trend_lookup.is_suspicious(tag["name"])
+    ]
+
+
+async def load_trend_lookup():
+    async with db_manager.session() as session:
+        trend_lookup.replace(
+            popular=await get_popular_trend_names(session=session),
+            suspicious=await get_suspicious_trend_names(session=session),
+        )
+
+
+async def refresh_trend_lookup():
+    # a safety net for invalidation messages lost while Redis was unavailable
+    while True:
+        await asyncio.sleep(settings.TREND_LOOKUP_REFRESH_INTERVAL)
+        try:
+            await load_trend_lookup()
+        except Exception as e:
+            logger.warning(f"Failed to refresh trend lookup: {str(e)}")
+
+
+async def store_suspicious_tags(status: dict, account: dict, suspicious_tags: List[tuple]) -> Tuple[str, List[dict]]:
+    """Store suspicious trends of a status posted by a new account, all changes are made in a single transaction."""
+    # find near-duplicates of this status across all tags and get its cluster, the indexes are CPU-bound and
+    # thread-safe, so they run in worker threads instead of stalling the other stream consumers
+    cluster_id, near_duplicate_ids = await asyncio.to_thread(
+        near_duplicate_index.add, status_id=str(status["id"]), content=status["content"]
+    )
+
+    statuses_to_check = []
+
+    if suspicious_tags:
+        instance_url = get_instance_url(account=account)
+
+        # get rid of unnecessary fields for account model
+        account.pop("emojis", None)
+        account.pop("fields", None)
+        account.pop("noindex", None)
+        account.pop("roles", None)
+        account.pop("indexable", None)
+        account.pop("uri", None)
+        account.pop("hide_collections", None)
+
+        # rows are locked in the same order by every transaction, so concurrent statuses with overlapping tags
+        # do not deadlock
+        suspicious_tags = sorted(suspicious_tags, key=lambda suspicious_tag: suspicious_tag[1])
+
+        # account and suspicious trend changes made for this status are committed together
+        async with db_manager.session() as session:
+            # create a new account entity or update in case of existence
+            await create_or_update_account(session=session, account=account, instance_url=instance_url)
+
+            for tag, url, accounts, uses in suspicious_tags:
+                # create a new suspicious trend entity or update in case of existence
+                suspicious_trend = await create_or_update_suspicious_trend(
+                    session=session,
+                    name=tag["name"],
+                    url=url,
+                    uses_in_last_seven_days=uses,
+                    number_of_accounts=accounts,
+                    instance_url=instance_url,
+                )
+
+                logger.info("\nPROBABLY AN ARTIFICIAL TREND AND THIS USER MIGHT BE A BOT!")
+                logger.info(f"ACCOUNT ACCT: {account['acct']}")
+                logger.info(f"ACCOUNT URL: {account['url']}")
+                logger.info(f"ACCOUNT CREATED_AT: {str(account['created_at'])}")
+                logger.info(f"ACCOUNT FOLLOWERS_COUNT: {str(account['followers_count'])}")
+                logger.info(f"ACCOUNT FOLLOWING_COUNT: {str(account['following_count'])}")
+                logger.info(f"ACCOUNT STATUSES_COUNT: {str(account['statuses_count'])}")
+                logger.info(f"TREND NAME: {tag['name']}")
+                logger.info(f"TREND URL: {tag['url']}")
+
+                suspicious_status = dict(
+                    id=status["id"],
+                    created_at=status["created_at"],
+                    language=status["language"],
+                    url=status["url"],
+                    content=status["content"],
+                    is_suspicious=None,
+                    checked_at=None,
+                    author_followers_count=account["followers_count"],
+                    author_following_count=account["following_count"],
+                    author_statuses_count=account["statuses_count"],
+                    author_created_at=account["created_at"],
+                    cluster_id=cluster_id,
+                )
+                suspicious_status["content_hash"] = content_hash(suspicious_status["content"])
+                suspicious_status["author_bucket"] = author_bucket(suspicious_status)
+
+                statuses_to_check.append(suspicious_status)
+
+                # load statuses with this tag into the similarity index once
+                if not similarity_index.is_loaded(tag["name"]):
+                    statuses = await get_statuses_by_tag(
+                        session=session,
+                        tag=tag["name"],
+                        since=datetime.utcnow() - timedelta(days=settings.SIMILARITY_INDEX_WARM_DAYS),
+                        limit=settings.SIMILARITY_INDEX_MAX_STATUSES_PER_TAG,
+                    )
+                    await asyncio.to_thread(similarity_index.load, tag=tag["name"], statuses=statuses)
+
+                # get stored statuses with cosine similarity >= 0.5 to a new one and near-duplicates posted under
+                # any other tag
+                similar_status_ids = set(near_duplicate_ids)
+                similar_status_ids.update(
+                    await asyncio.to_thread(
+                        similarity_index.find_similar, tag=tag["name"], content=status["content"], threshold=0.5
+                    )
+                )
+
+                # increment the number of similar posts for suspicious trend, increments are written in batches
+                if similar_status_ids:
+                    similar_posts_counter.add(suspicious_trend_id=suspicious_trend.id, number=len(similar_status_ids))
+
+        trend_lookup.add_suspicious(tag["name"] for tag, _, _, _ in suspicious_tags)
+
+    await asyncio.to_thread(
+        similarity_index.add,
+        status_id=str(status["id"]),
+        tags=[tag["name"] for tag in status["tags"]],
+        content=status["content"],
+    )
+
+    return cluster_id, statuses_to_check
+
+
+async def process_status(status: dict):
+    status.pop("reblog", None)
+    status.pop("media_attachments", None)
+    status.pop("mentions", None)
+    status.pop("emojis", None)
+    status.pop("card", None)
+    status.pop("poll", None)
+    status.pop("filtered", None)
+    status.pop("application", None)
+    status.pop("quote", None)
+    status.pop("quote_approval", None)
+
+    # store every status, rows are written in batches by the ingestion buffer
+    status_copy = copy(status)
+    status_copy.pop("account", None)
+    status_copy["tags"] = [item["name"] for item in status_copy["tags"]]
+    status_copy["content"] = strip_html(status_copy["content"])
+
+    await ingestion_buffer.put(save_raw_statuses, status_copy)
+
+    # check if only tags is more than 0
+    if len(status["tags"]) != 0:
+        # get author
+        account = status["account"]
+        status["content"] = strip_html(status["content"])
+
+        # get author register date
+        created_at = account["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+
+        # get time difference to check
+        difference = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+
+        # check if a user was registered less than a month ago, has less than 1000 followers and has less
+        # than 100 statuses
+        if (
+            created_at >= difference
+            and account["followers_count"] <= 1000
+            and account["statuses_count"] <= 100
+        ):
+            # find tags which are not known trends yet
+            new_tags = find_new_tags(tags=status["tags"])
+
+            # get aggregated info about new tags in last seven days
+            client = get_tag_info_client()
+            tags_info = await asyncio.gather(*(client.get_tag_info(tag=tag["name"]) for tag in new_tags))
+
+            suspicious_tags = []
+            for tag, (url, accounts, uses, errors) in zip(new_tags, tags_info):
+                # if an error happened, just continue
+                if errors:
+                    continue
+
+                # check trend info
+                if accounts <= 10 and uses <= 10:
+                    suspicious_tags.append((tag, url, accounts, uses))
+
+            cluster_id, statuses_to_check = await store_suspicious_tags(
+                status=status, account=account, suspicious_tags=suspicious_tags
+            )
+
+            # let other processes know about new suspicious trends
+            if suspicious_tags:
+                await trend_lookup.publish_suspicious(tag["name"] for tag, _, _, _ in suspicious_tags)
+                pending_invalidations.add(AccountModel, SuspiciousTrendModel)
+
+            for status_to_check in statuses_to_check:
+                await ingestion_buffer.put(save_statuses_to_check, status_to_check)
+
+            # tags are stored lower-cased for the indexed tag lookup
+            tags = [tag["name"].lower() for tag in status["tags"]]
+
+            # remove unnecessary, non-parsable elements
+            status.pop("tags", None)
+            status.pop("account", None)
+
+            # add parsed tags to status model to store it in the database
+            status["tags"] = tags
+            status["cluster_id"] = cluster_id
+
+            await ingestion_buffer.put(save_statuses, status)
+
+
+async def warm_similarity_index():
+    since = datetime.utcnow() - timedelta(days=settings.SIMILARITY_INDEX_WARM_DAYS)
+
+    # the indexes are fed chunk by chunk, so only one chunk of rows is held in memory
+    async with db_manager.session() as session:
+        async for statuses in get_recent_statuses(session=session, since=since):
+            await asyncio.to_thread(similarity_index.warm, statuses=statuses)
+            await asyncio.to_thread(near_duplicate_index.warm, statuses=statuses)
+
+
+def create_stream_consumer(instance_url: str) -> MastodonStreamConsumer:
+    # the access token is only valid for our own instance
+    if instance_url.rstrip("/") == settings.MASTODON_INSTANCE_ENDPOINT.rstrip("/"):
+        access_token = settings.MASTODON_INSTANCE_ACCESS_TOKEN
+    else:
+        access_token = ""
+
+    return MastodonStreamConsumer(
+        instance_url=instance_url,
+        access_token=access_token,
+        handler=process_status,
+        workers=settings.STREAM_WORKERS,
+        queue_size=settings.STREAM_QUEUE_SIZE,
+        reconnect_delay=settings.STREAM_RECONNECT_DELAY,
+        backfill_pages=settings.STREAM_BACKFILL_PAGES,
+        rate_limiter=TokenBucket(rate=settings.STREAM_INSTANCE_RATE_LIMIT, capacity=settings.STREAM_INSTANCE_BURST),
+    )
+
+
+async def report_stream_health(
+        consumers: List[MastodonStreamConsumer], report_health: Callable[[List[dict]], None]
+):
+    while True:
+        await asyncio.sleep(settings.STREAM_HEALTH_INTERVAL)
+        report_health([consumer.health for consumer in consumers])
+
+
+async def listen_mastodon_streams(
+        instance_urls: List[str], report_health: Optional[Callable[[List[dict]], None]] = None
+):
+    await load_trend_lookup()
+    await warm_similarity_index()
+    await ingestion_buffer.start()
+    await similar_posts_counter.start()
+    await pending_invalidations.start()
+
+    consumers = [create_stream_consumer(instance_url=instance_url) for instance_url in instance_urls]
+    background_tasks = [
+        asyncio.create_task(listen_for_invalidations({TRENDS_INVALIDATION_CHANNEL: trend_lookup.handle_invalidation})),
+        asyncio.create_task(refresh_trend_lookup()),
+    ]
+    if report_health is not None:
+        background_tasks.append(asyncio.create_task(report_stream_health(consumers, report_health)))
+
+    try:
+        await asyncio.gather(*(consumer.run() for consumer in consumers))
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+
+        # flush whatever is still buffered on shutdown
+        await ingestion_buffer.stop()
+        await similar_posts_counter.stop()
+        await pending_invalidations.stop()
 
 
 async def listen_mastodon_stream():
-    mastodon_instance.stream_public(Listener(), run_async=True)
+    await listen_mastodon_streams(instance_urls=[settings.MASTODON_INSTANCE_ENDPOINT])
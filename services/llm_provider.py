@@ -1,9 +1,7 @@
 # stdlib
-import json
-import re
 from datetime import datetime
 from enum import Enum
-from typing import AsyncGenerator, Dict, Tuple
+from typing import AsyncGenerator, Dict, Iterable, Tuple
 
 # thirdparty
 import anthropic
@@ -11,9 +9,27 @@ import google.generativeai as genai
 from openai import AsyncOpenAI
 
 from settings import get_settings
+from utils.verdict_parser import VERDICT_FIELDS, IncrementalVerdictParser
 
 settings = get_settings()
 
+# bump whenever the prompt changes, verdicts cached for another version are not reused
+PROMPT_VERSION = "1"
+
+# structured output schema, fields of the verdict come first so they can be parsed while the reasoning is streamed
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "is_suspicious": {"type": "boolean"},
+        "confidence": {"type": "number"},
+        "likelihood": {"type": "string", "enum": ["Low", "Medium", "High"]},
+        "reasoning": {"type": "string"},
+        "red_flags": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["is_suspicious", "confidence", "likelihood", "reasoning", "red_flags"],
+    "additionalProperties": False,
+}
+
 
 class LLMModel(str, Enum):
     OPENAI = "openai"
@@ -104,20 +120,23 @@ Confidence scale:
                 }
             ],
             stream=True,
-            temperature=0.3
+            temperature=0.3,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "verdict", "schema": VERDICT_SCHEMA, "strict": True},
+            },
         )
 
-        accumulated = ""
-        async for chunk in response:
-            content = chunk.choices[0].delta.content
-            if content:
-                accumulated += content
-                yield accumulated
+        # the connection is released as soon as a consumer stops reading
+        async with response:
+            async for chunk in response:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
 
     async def analyze_claude(self, status: dict) -> AsyncGenerator[str, None]:
         prompt = self.build_prompt(status)
 
-        accumulated = ""
         async with self.anthropic_client.messages.stream(
                 model="claude-sonnet-4-20250514",
                 max_tokens=2000,
@@ -126,12 +145,17 @@ Confidence scale:
                     {
                         "role": "user",
                         "content": prompt
+                    },
+                    # Claude has no JSON mode, a prefilled answer makes it continue the JSON object
+                    {
+                        "role": "assistant",
+                        "content": "{"
                     }
                 ]
         ) as stream:
+            yield "{"
             async for text in stream.text_stream:
-                accumulated += text
-                yield accumulated
+                yield text
 
     async def analyze_gemini(self, status: dict) -> AsyncGenerator[str, None]:
         prompt = self.build_prompt(status)
@@ -139,6 +163,7 @@ Confidence scale:
         generation_config = genai.GenerationConfig(
             temperature=0.3,
             max_output_tokens=2000,
+            response_mime_type="application/json",
         )
 
         response = await self.gemini_model.generate_content_async(
@@ -147,11 +172,9 @@ Confidence scale:
             stream=True
         )
 
-        accumulated = ""
         async for chunk in response:
             if chunk.text:
-                accumulated += chunk.text
-                yield accumulated
+                yield chunk.text
 
     async def analyze_llama(self, status: dict) -> AsyncGenerator[str, None]:
         prompt = self.build_prompt(status)
@@ -171,17 +194,18 @@ Confidence scale:
             ],
             stream=True,
             temperature=0.3,
-            max_tokens=2000
+            max_tokens=2000,
+            response_format={"type": "json_object", "schema": VERDICT_SCHEMA},
         )
 
-        accumulated = ""
-        async for chunk in response:
-            content = chunk.choices[0].delta.content
-            if content:
-                accumulated += content
-                yield accumulated
+        async with response:
+            async for chunk in response:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
 
     async def analyze(self, status: dict, model: LLMModel) -> AsyncGenerator[str, None]:
+        """Stream the response of a model as text deltas, consumers join them into the full text once."""
         if model == LLMModel.OPENAI:
             async for result in self.analyze_openai(status):
                 yield result
@@ -199,17 +223,22 @@ Confidence scale:
 
 
 def extract_json_and_confidence(text: str) -> Tuple[Dict, float, bool]:
-    try:
-        json_match = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_match:
-            data = json.loads(json_match.group())
-            confidence = float(data.get('confidence', 0.5))
-            is_suspicious = bool(data.get('is_suspicious', False))
-            return data, confidence, is_suspicious
-    except (json.JSONDecodeError, ValueError):
-        pass
-
-    text_lower = text.lower()
+    parser = IncrementalVerdictParser()
+    parser.feed(text)
+    return parse_verdict(parser)
+
+
+def parse_verdict(parser: IncrementalVerdictParser) -> Tuple[Dict, float, bool]:
+    """Get the verdict from a parser fed with a (possibly cut short) response, keywords are used without JSON."""
+    if any(field in parser.fields for field in VERDICT_FIELDS):
+        try:
+            confidence = float(parser.fields.get('confidence', 0.5))
+            is_suspicious = bool(parser.fields.get('is_suspicious', False))
+            return parser.object() or dict(parser.fields), confidence, is_suspicious
+        except (TypeError, ValueError):
+            pass
+
+    text_lower = parser.text.lower()
 
     is_suspicious = any(word in text_lower for word in [
         'suspicious', 'fake', 'bot', 'artificial', 'generated',
@@ -225,3 +254,19 @@ def extract_json_and_confidence(text: str) -> Tuple[Dict, float, bool]:
         confidence = 0.6
 
     return {}, confidence, is_suspicious
+
+
+def ensemble_verdict(verdicts: Iterable) -> Tuple[bool, float]:
+    """Combine verdicts of several models, each vote is weighted by the confidence of the model."""
+    score = 0.0
+    total_weight = 0.0
+    for verdict in verdicts:
+        weight = verdict.confidence or 0.0
+        score += weight if verdict.is_suspicious else -weight
+        total_weight += weight
+
+    if total_weight == 0:
+        return False, 0.0
+
+    # the confidence of the ensemble is the weighted share of the winning side
+    return score > 0, (total_weight + abs(score)) / (2 * total_weight)
@@ -1,41 +1,66 @@
+import hashlib
 from datetime import datetime
+from typing import Optional
 
 import aiohttp
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.redis import invalidate_tags
 from db.models.instance_model import InstanceModel
-from services.instance_service import (delete_all_instances,
-                                       update_and_retrieve_instances)
+from services.count_service import invalidate_counts
+from services.instance_service import delete_instances_except, upsert_instances
 from settings import get_settings
+from utils.logging import logger
 
 settings = get_settings()
 
+INSTANCE_COLUMNS = frozenset(InstanceModel.__table__.columns.keys())
+INSTANCE_DATETIME_FIELDS = ("added_at", "updated_at", "checked_at")
+
+# checked_at moves on every check of instances.social, a row is only rewritten when something else changed
+INSTANCE_UNHASHED_FIELDS = frozenset(("checked_at", "row_hash"))
+
+
+def parse_instances_datetime(value: Optional[str]) -> Optional[datetime]:
+    # timestamps are UTC ISO strings with a Z suffix, they are stored without a time zone
+    return datetime.fromisoformat(value).replace(tzinfo=None) if value else None
+
+
+def instance_row(instance: dict) -> dict:
+    row = {key: instance.get(key) for key in INSTANCE_COLUMNS if key != "row_hash"}
+
+    hashed = {key: value for key, value in row.items() if key not in INSTANCE_UNHASHED_FIELDS}
+    row["row_hash"] = hashlib.md5(orjson.dumps(hashed, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    for field in INSTANCE_DATETIME_FIELDS:
+        row[field] = parse_instances_datetime(row[field])
+
+    return row
+
 
 async def upsert_mastodon_instances(session: AsyncSession):
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {settings.INSTANCES_SOCIAL_SECRET}"}
     url = f"{settings.INSTANCES_SOCIAL_ENDPOINT}/api/1.0/instances/list?count=10000&include_down=false&min_active_users=100"
     async with aiohttp.ClientSession(headers=headers) as client_session:
         async with client_session.get(url=url) as response:
-            data = await response.json()
-
-            await delete_all_instances(session=session)
-
-            retrieved_instances = []
-
-            for instance in data["instances"]:
-                instance["added_at"] = (
-                    datetime.strptime(instance["added_at"], "%Y-%m-%dT%H:%M:%S.%fZ") if instance["added_at"] else None
-                )
-                instance["updated_at"] = (
-                    datetime.strptime(instance["updated_at"], "%Y-%m-%dT%H:%M:%S.%fZ")
-                    if instance["updated_at"]
-                    else None
-                )
-                instance["checked_at"] = (
-                    datetime.strptime(instance["checked_at"], "%Y-%m-%dT%H:%M:%S.%fZ")
-                    if instance["checked_at"]
-                    else None
-                )
-                retrieved_instances.append(InstanceModel(**instance))
-
-            await update_and_retrieve_instances(session=session, instances=retrieved_instances)
+            response.raise_for_status()
+            data = orjson.loads(await response.read())
+
+    # a row can not be upserted twice by one statement
+    rows = list({row["id"]: row for row in map(instance_row, data["instances"])}.values())
+
+    # keep the current table rather than emptying it because of a broken response
+    if not rows:
+        logger.warning("instances.social returned no instances, the refresh is skipped")
+        return
+
+    # new and changed rows are written and stale ones are deleted in the same transaction, so readers never see
+    # an empty or a partially filled table
+    await upsert_instances(session=session, instances=rows)
+    await delete_instances_except(session=session, ids=[row["id"] for row in rows])
+
+    # caches are invalidated once the rows are visible, otherwise a concurrent reader could cache the old ones again
+    await session.commit()
+    await invalidate_counts(InstanceModel)
+    await invalidate_tags(InstanceModel.__tablename__)
@@ -1,42 +1,164 @@
+import asyncio
 import inspect
+import time
 import traceback
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import orjson
+from httpx import Response
 
 import settings
-from services.httpx_client import HTTPXClient, httpx_context_manager
+from db.db_setup import redis_client
+from services.httpx_client import AsyncHTTPXClient
+from utils.logging import logger
+from utils.lru_cache import TTLCache
 
 settings = settings.get_settings()
 
+TOO_MANY_REQUESTS = {"error": "Too Many Requests"}
+
+
+def get_retry_after(response: Response, default: float = 60.0) -> float:
+    # Retry-After is either a number of seconds or an HTTP date
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            try:
+                return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0)
+            except (TypeError, ValueError):
+                pass
+
+    # Mastodon also sends the time when the rate limit window resets
+    reset = response.headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            return max((datetime.fromisoformat(reset) - datetime.now(timezone.utc)).total_seconds(), 0)
+        except ValueError:
+            pass
+
+    return default
+
 
-@httpx_context_manager
-class HTTPXMastodonInstanceServiceClient(HTTPXClient):
+class HTTPXMastodonInstanceServiceClient(AsyncHTTPXClient):
     mastodon_instance = settings.MASTODON_INSTANCE_ENDPOINT
     api_endpoint = "/api/v1/"
 
     def __init__(self):
-        super().__init__(self.mastodon_instance, self.api_endpoint)
+        super().__init__(
+            self.mastodon_instance,
+            self.api_endpoint,
+            timeout=settings.MASTODON_CLIENT_TIMEOUT,
+            max_connections=settings.MASTODON_CLIENT_MAX_CONNECTIONS,
+            http2=settings.MASTODON_CLIENT_HTTP2,
+        )
+        self._cache = TTLCache(maxsize=settings.TAG_INFO_CACHE_SIZE, ttl=settings.TAG_INFO_CACHE_TTL)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._blocked_until = 0.0
 
     @property
     def headers(self):
         return {"Content-Type": "application/json"}
 
-    def get_tag_info(self, tag: str):
+    def _redis_key(self, tag: str) -> str:
+        return f"tag_info:{self.mastodon_instance}:{tag}"
+
+    async def get_tag_info(self, tag: str):
+        tag = tag.lower()
+
+        # in-process cache
+        cached = self._cache.get(tag)
+        if cached is not None:
+            return cached
+
+        # shared cache
+        try:
+            cached = await redis_client.get(self._redis_key(tag))
+        except Exception as e:
+            logger.warning(f"Failed to read tag info of {tag} from Redis: {str(e)}")
+            cached = None
+
+        if cached is not None:
+            result = tuple(orjson.loads(cached))
+            self._cache.set(tag, result)
+            return result
+
+        # concurrent lookups of the same tag share one request
+        future = self._in_flight.get(tag)
+        if future is None:
+            future = self._in_flight[tag] = asyncio.ensure_future(self._fetch_tag_info(tag))
+            future.add_done_callback(lambda _: self._in_flight.pop(tag, None))
+
+        return await asyncio.shield(future)
+
+    async def _fetch_tag_info(self, tag: str):
+        result = await self._request_tag_info(tag)
+
+        # errors are not cached, the tag is looked up again next time
+        if result[3] is None:
+            self._cache.set(tag, result)
+            try:
+                await redis_client.set(self._redis_key(tag), orjson.dumps(result), ex=settings.TAG_INFO_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Failed to store tag info of {tag} in Redis: {str(e)}")
+
+        return result
+
+    async def _wait_for_rate_limit(self) -> None:
+        delay = self._blocked_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _request_tag_info(self, tag: str):
         try:
             url = f"{self.mastodon_instance}{self.api_endpoint}tags/{tag}"
-            response = self.client.get(url=url, headers=self.headers)
-            result = response.json()
 
-            # calculate the number of usages in last 7 days and aggregate number of accounts
-            accounts = 0
-            uses = 0
+            for _ in range(settings.TAG_INFO_MAX_RETRIES + 1):
+                await self._wait_for_rate_limit()
+
+                response = await self.client.get(url=url, headers=self.headers)
+
+                # wait until the rate limit window resets and try again
+                if response.status_code == 429:
+                    retry_after = get_retry_after(response)
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+                    logger.warning(f"Rate limited by {self.mastodon_instance}, retrying in {retry_after:.1f}s")
+                    continue
+
+                # do not wait for 429 if the window is already exhausted
+                if response.headers.get("X-RateLimit-Remaining") == "0":
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + get_retry_after(response))
 
-            if "error" in result:
-                return None, None, None, {"error": "Too Many Requests"}
+                result = response.json()
 
-            for day in result["history"]:
-                accounts += int(day["accounts"])
-                uses += int(day["uses"])
+                # calculate the number of usages in last 7 days and aggregate number of accounts
+                accounts = 0
+                uses = 0
 
-            return result["url"], accounts, uses, None
+                if "error" in result:
+                    return None, None, None, {"error": result["error"]}
+
+                for day in result["history"]:
+                    accounts += int(day["accounts"])
+                    uses += int(day["uses"])
+
+                return result["url"], accounts, uses, None
+
+            return None, None, None, TOO_MANY_REQUESTS
         except Exception as e:
             traceback.print_exc()
             return None, None, None, {format(inspect.currentframe().f_code.co_name): [str(e)]}
+
+
+tag_info_client: Optional[HTTPXMastodonInstanceServiceClient] = None
+
+
+def get_tag_info_client() -> HTTPXMastodonInstanceServiceClient:
+    # created lazily, so the client belongs to the event loop of the process which uses it
+    global tag_info_client
+    if tag_info_client is None:
+        tag_info_client = HTTPXMastodonInstanceServiceClient()
+    return tag_info_client
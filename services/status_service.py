@@ -1,49 +1,80 @@
 # flake8: noqa
 # stdlib
 from datetime import datetime
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List
 
 # thirdparty
-from sqlalchemy import func, insert, select, update
+from sqlalchemy import select, update
 from sqlalchemy.dialects.postgresql import insert as postgres_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.db_setup import ScopedSession
+from cache.redis import cached
+from cache.serialization import results_serializer
 from db.models.status_model import RawStatusModel, StatusModel
 from db.models.statuses_to_check_model import StatusToCheckModel
-from services.llm_provider import LLMModel, LLMProvider
+from db.schemas.suspicious_status_schema import SuspiciousStatusSchema
+from services.count_service import CountMode, count_rows
+from services.llm_provider import PROMPT_VERSION, LLMModel, LLMProvider
 from settings import get_settings
-from utils.pagination import calculate_pagination
+from utils.pagination import (apply_cursor, calculate_cursor_pagination,
+                              calculate_pagination)
 
 settings = get_settings()
 
 llm_provider = LLMProvider()
 
 
-def save_status(session: ScopedSession, status: dict):
-    status = dict(**status)
-    query = insert(StatusModel).values(status)
-    session.execute(query)
-    session.commit()
+async def bulk_insert_statuses(session: AsyncSession, model, statuses: list):
+    columns = model.__table__.columns.keys()
+    keys = [key for key in columns if any(key in status for status in statuses)]
+    rows = [{key: status.get(key) for key in keys} for status in statuses]
 
-
-def save_raw_status(session: ScopedSession, status: dict):
-    status = dict(**status)
-    insert_stmt = postgres_insert(RawStatusModel).values(status)
+    insert_stmt = postgres_insert(model).values(rows)
     insert_stmt = insert_stmt.on_conflict_do_nothing()
-    session.execute(insert_stmt)
-    session.commit()
+    await session.execute(insert_stmt)
 
 
-def save_status_to_check(session: ScopedSession, status: dict):
-    status = dict(**status)
-    insert_stmt = postgres_insert(StatusToCheckModel).values(status)
-    insert_stmt = insert_stmt.on_conflict_do_nothing()
-    session.execute(insert_stmt)
-    session.commit()
+async def save_statuses(session: AsyncSession, statuses: list):
+    await bulk_insert_statuses(session=session, model=StatusModel, statuses=statuses)
+
+
+async def save_raw_statuses(session: AsyncSession, statuses: list):
+    await bulk_insert_statuses(session=session, model=RawStatusModel, statuses=statuses)
+
+
+async def save_statuses_to_check(session: AsyncSession, statuses: list):
+    await bulk_insert_statuses(session=session, model=StatusToCheckModel, statuses=statuses)
 
 
-async def get_all_suspicious_statuses(session: AsyncSession, page: int, limit: int):
+# tables written by the bulk savers, their cached counts are invalidated after a flush
+BULK_SAVER_MODELS = {
+    save_statuses: StatusModel,
+    save_raw_statuses: RawStatusModel,
+    save_statuses_to_check: StatusToCheckModel,
+}
+
+
+# invalidated after verdicts are saved and after the listener flushes new statuses to check
+@cached(
+    ttl=settings.LIST_CACHE_TTL,
+    namespace="statuses",
+    serializer=results_serializer(SuspiciousStatusSchema),
+    tags=(StatusToCheckModel.__tablename__,),
+)
+async def get_all_suspicious_statuses(
+        session: AsyncSession,
+        page: int,
+        limit: int,
+        cursor: bool = False,
+        after: str = None,
+        count: CountMode = CountMode.EXACT,
+):
+    if cursor or after:
+        columns = (StatusToCheckModel.created_at, StatusToCheckModel.id)
+        query = apply_cursor(query=select(StatusToCheckModel), columns=columns, after=after, limit=limit)
+        result = await session.execute(query)
+        return calculate_cursor_pagination(rows=result.scalars().all(), columns=columns, limit=limit)
+
     query = (
         select(StatusToCheckModel)
         .order_by(StatusToCheckModel.created_at.desc())
@@ -51,19 +82,12 @@ async def get_all_suspicious_statuses(session: AsyncSession, page: int, limit: i
         .limit(limit)
     )
 
-    count_query = (
-        select(func.count(StatusToCheckModel.id))
-        .offset((page - 1) * limit)
-        .limit(limit)
-    )
-
     result = await session.execute(query)
-    results = await session.execute(count_query)
+    statuses = result.scalars().all()
 
-    total_count = results.scalar()
+    total_count = await count_rows(session=session, model=StatusToCheckModel, mode=count)
 
-    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count)
-    statuses = result.scalars().all()
+    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count, results_count=len(statuses))
 
     return statuses, pagination
 
@@ -78,10 +102,38 @@ async def get_suspicious_status_by_id(session: AsyncSession, status_id: str):
     return result.scalar_one_or_none()
 
 
-def get_statuses_by_tag(session: ScopedSession, tag: str):
-    query = select(StatusModel).filter(func.array_to_string(StatusModel.tags, ",").ilike(func.any(["%" + tag + "%"])))
-    result = session.execute(query)
-    return result.scalars().all()
+async def get_statuses_by_tag(session: AsyncSession, tag: str, since: datetime, limit: int):
+    # tags are stored lower-cased, so containment uses the GIN index and matches whole tags only
+    query = (
+        select(StatusModel.id, StatusModel.content)
+        .filter(StatusModel.tags.contains([tag.lower()]))
+        .filter(StatusModel.created_at >= since)
+        .order_by(StatusModel.created_at.desc())
+        .limit(limit)
+    )
+    result = await session.execute(query)
+    return result.all()
+
+
+async def get_recent_statuses(session: AsyncSession, since: datetime, chunk_size: int = 1000):
+    """Yield the statuses created since the given time in chunks, read from a server-side cursor."""
+    query = (
+        select(StatusModel.id, StatusModel.tags, StatusModel.content, StatusModel.cluster_id)
+        .filter(StatusModel.created_at >= since)
+        .order_by(StatusModel.created_at)
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await session.stream(query)
+    async for statuses in result.partitions():
+        yield statuses
+
+
+def ai_response_fields(model: LLMModel, ai_response: str, confidence: float, is_suspicious: bool) -> dict:
+    return {
+        f"{model.value}_response": ai_response,
+        f"{model.value}_confidence": confidence,
+        f"{model.value}_is_suspicious": is_suspicious,
+    }
 
 
 async def save_ai_response(
@@ -95,33 +147,10 @@ async def save_ai_response(
     status_id_str = str(status_id)
 
     update_fields = {
-        "checked_at": datetime.utcnow()
+        "checked_at": datetime.utcnow(),
+        "prompt_version": PROMPT_VERSION,
     }
-
-    if model == LLMModel.OPENAI:
-        update_fields.update({
-            "openai_response": ai_response,
-            "openai_confidence": confidence,
-            "openai_is_suspicious": is_suspicious
-        })
-    elif model == LLMModel.CLAUDE:
-        update_fields.update({
-            "claude_response": ai_response,
-            "claude_confidence": confidence,
-            "claude_is_suspicious": is_suspicious
-        })
-    elif model == LLMModel.GEMINI:
-        update_fields.update({
-            "gemini_response": ai_response,
-            "gemini_confidence": confidence,
-            "gemini_is_suspicious": is_suspicious
-        })
-    elif model == LLMModel.LLAMA:
-        update_fields.update({
-            "llama_response": ai_response,
-            "llama_confidence": confidence,
-            "llama_is_suspicious": is_suspicious
-        })
+    update_fields.update(ai_response_fields(model, ai_response, confidence, is_suspicious))
 
     query = (
         update(StatusToCheckModel)
@@ -134,6 +163,47 @@ async def save_ai_response(
     await session.flush()
 
 
+async def save_ai_responses(session: AsyncSession, responses: List[dict]):
+    """
+    Multi-row variant of save_ai_response, each item holds a status_id, verdicts given by models and optionally
+    an ensemble is_suspicious verdict.
+    """
+    if not responses:
+        return
+
+    checked_at = datetime.utcnow()
+
+    rows = []
+    for response in responses:
+        row = dict(id=str(response["status_id"]), checked_at=checked_at, prompt_version=PROMPT_VERSION)
+        for model, verdict in response["verdicts"].items():
+            # the text of a truncated response is not stored, so it is never replayed as a full answer
+            response_text = None if verdict.truncated else verdict.response
+            row.update(ai_response_fields(model, response_text, verdict.confidence, verdict.is_suspicious))
+
+        # the ensemble verdict of several models
+        if "is_suspicious" in response:
+            row["is_suspicious"] = response["is_suspicious"]
+
+        rows.append(row)
+
+    # bulk UPDATE by primary key, executed as a single executemany
+    await session.execute(update(StatusToCheckModel), rows)
+    await session.flush()
+
+
+async def increment_classification_attempts(session: AsyncSession, status_ids: List[str]):
+    if not status_ids:
+        return
+
+    query = (
+        update(StatusToCheckModel)
+        .values(classification_attempts=StatusToCheckModel.classification_attempts + 1)
+        .where(StatusToCheckModel.id.in_(status_ids))
+    )
+    await session.execute(query)
+
+
 async def get_ai_response(status: dict, model: LLMModel) -> AsyncGenerator[str, None]:
     async for result in llm_provider.analyze(status, model):
         yield result
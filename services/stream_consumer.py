@@ -0,0 +1,223 @@
+# stdlib
+import asyncio
+import time
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+# thirdparty
+import orjson
+from httpx import AsyncClient, HTTPError, Timeout
+
+# project
+from utils.logging import logger
+from utils.metrics import (STREAM_CONNECTED, STREAM_EVENTS, STREAM_LAST_EVENT,
+                           STREAM_QUEUE_DEPTH, STREAM_RECONNECTS)
+from utils.rate_limiter import TokenBucket
+
+StatusHandler = Callable[[dict], Awaitable[None]]
+
+STATUS_DATETIME_FIELDS = ("created_at", "edited_at")
+ACCOUNT_DATETIME_FIELDS = ("created_at", "last_status_at")
+STATUS_ID_FIELDS = ("in_reply_to_id", "in_reply_to_account_id")
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def decode_status(status: dict) -> dict:
+    """Decode a status entity the same way Mastodon.py did: datetimes are parsed and numeric ids are converted."""
+    for field in STATUS_DATETIME_FIELDS:
+        status[field] = parse_datetime(status.get(field))
+
+    for field in STATUS_ID_FIELDS:
+        status[field] = int(status[field]) if status.get(field) else None
+
+    account = status.get("account")
+    if account:
+        account["id"] = int(account["id"])
+        for field in ACCOUNT_DATETIME_FIELDS:
+            account[field] = parse_datetime(account.get(field))
+
+    return status
+
+
+async def iterate_server_sent_events(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[str, str]]:
+    event = "message"
+    data: List[str] = []
+
+    async for line in lines:
+        # an empty line dispatches the event
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event = "message"
+            data = []
+            continue
+
+        # comments are used as heartbeats
+        if line.startswith(":"):
+            continue
+
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+
+
+class MastodonStreamConsumer:
+    """
+    Reads the public timeline of a Mastodon instance over server-sent events and fans statuses out to a pool of
+    worker tasks through a bounded queue. After a reconnect the gap is backfilled from the public timeline.
+    An optional token bucket caps the rate of statuses accepted from the instance.
+    """
+
+    def __init__(
+        self,
+        instance_url: str,
+        handler: StatusHandler,
+        access_token: str = "",
+        workers: int = 8,
+        queue_size: int = 10000,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 60.0,
+        backfill_pages: int = 10,
+        rate_limiter: Optional[TokenBucket] = None,
+    ) -> None:
+        self.instance_url = instance_url.rstrip("/")
+        self.handler = handler
+        self.access_token = access_token
+        self.workers = workers
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.backfill_pages = backfill_pages
+        self.rate_limiter = rate_limiter
+        self.last_status_id: Optional[str] = None
+        self.connected = False
+        self.last_event_at: Optional[float] = None
+        self.consecutive_failures = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    @property
+    def health(self) -> dict:
+        return {
+            "instance": self.instance_url,
+            "connected": self.connected,
+            "last_event_at": self.last_event_at,
+            "consecutive_failures": self.consecutive_failures,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    @property
+    def headers(self) -> dict:
+        if self.access_token:
+            return {"Authorization": f"Bearer {self.access_token}"}
+        return {}
+
+    async def run(self) -> None:
+        workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+        delay = self.reconnect_delay
+        try:
+            async with AsyncClient(
+                headers=self.headers,
+                timeout=Timeout(10.0, read=None),
+                follow_redirects=True,
+            ) as client:
+                while True:
+                    try:
+                        if self.last_status_id is not None:
+                            await self._backfill(client)
+
+                        streaming_url = await self._get_streaming_url(client)
+                        async for status in self._stream(client, streaming_url):
+                            delay = self.reconnect_delay
+                            self.consecutive_failures = 0
+                            await self._enqueue(status)
+                    except Exception as e:
+                        self.consecutive_failures += 1
+                        logger.warning(
+                            f"Stream of {self.instance_url} interrupted "
+                            f"({self.consecutive_failures} failures in a row): {str(e)}"
+                        )
+                    finally:
+                        self._set_connected(False)
+
+                    STREAM_RECONNECTS.labels(self.instance_url).inc()
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            self._set_connected(False)
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _get_streaming_url(self, client: AsyncClient) -> str:
+        # the streaming API may be served from a different host
+        try:
+            response = await client.get(f"{self.instance_url}/api/v2/instance")
+            response.raise_for_status()
+            streaming_url = response.json()["configuration"]["urls"]["streaming"]
+            return streaming_url.replace("wss://", "https://").replace("ws://", "http://").rstrip("/")
+        except (HTTPError, KeyError, TypeError, ValueError):
+            return self.instance_url
+
+    async def _stream(self, client: AsyncClient, streaming_url: str) -> AsyncIterator[dict]:
+        async with client.stream("GET", f"{streaming_url}/api/v1/streaming/public") as response:
+            response.raise_for_status()
+            self._set_connected(True)
+            logger.info(f"Connected to the public stream of {self.instance_url}")
+
+            async for event, data in iterate_server_sent_events(response.aiter_lines()):
+                if event == "update":
+                    yield decode_status(orjson.loads(data))
+
+    async def _backfill(self, client: AsyncClient) -> None:
+        # statuses right after min_id come in pages ordered from the newest to the oldest one
+        for _ in range(self.backfill_pages):
+            response = await client.get(
+                f"{self.instance_url}/api/v1/timelines/public",
+                params={"min_id": self.last_status_id, "limit": 40},
+            )
+            response.raise_for_status()
+
+            statuses = response.json()
+            if not statuses:
+                return
+
+            for status in reversed(statuses):
+                await self._enqueue(decode_status(status))
+
+    def _set_connected(self, connected: bool) -> None:
+        self.connected = connected
+        STREAM_CONNECTED.labels(self.instance_url).set(int(connected))
+
+    async def _enqueue(self, status: dict) -> None:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+
+        self.last_event_at = time.time()
+        STREAM_LAST_EVENT.labels(self.instance_url).set(self.last_event_at)
+
+        if self.last_status_id is None or int(status["id"]) > int(self.last_status_id):
+            self.last_status_id = status["id"]
+
+        STREAM_EVENTS.labels(self.instance_url).inc()
+        # waits while workers are behind, which stops reading from the stream
+        await self._queue.put(status)
+        STREAM_QUEUE_DEPTH.labels(self.instance_url).set(self._queue.qsize())
+
+    async def _work(self) -> None:
+        while True:
+            status = await self._queue.get()
+            STREAM_QUEUE_DEPTH.labels(self.instance_url).set(self._queue.qsize())
+
+            try:
+                await self.handler(status)
+            except Exception as e:
+                logger.error(f"Failed to process status {status.get('id')}: {str(e)}", exc_info=True)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,83 @@
+# stdlib
+import threading
+from typing import Iterable, NamedTuple
+
+# thirdparty
+import orjson
+
+# project
+from cache.invalidation import publish_invalidation
+
+TRENDS_INVALIDATION_CHANNEL = "trends:invalidate"
+
+
+class TrendSnapshot(NamedTuple):
+    version: int
+    popular: frozenset
+    suspicious: frozenset
+
+
+class TrendLookup:
+    """
+    Process-local snapshot of popular and suspicious trend names for the listener hot path. Snapshots are immutable
+    and swapped as a whole, so readers never see a half-updated state. Other processes are notified about changes
+    through Redis pub/sub.
+    """
+
+    def __init__(self) -> None:
+        self._snapshot = TrendSnapshot(version=0, popular=frozenset(), suspicious=frozenset())
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def is_popular(self, name: str) -> bool:
+        return name.lower() in self._snapshot.popular
+
+    def is_suspicious(self, name: str) -> bool:
+        return name.lower() in self._snapshot.suspicious
+
+    def replace(self, popular: Iterable[str], suspicious: Iterable[str]) -> None:
+        with self._lock:
+            self._snapshot = TrendSnapshot(
+                version=self._snapshot.version + 1,
+                popular=frozenset(name.lower() for name in popular),
+                suspicious=frozenset(name.lower() for name in suspicious),
+            )
+
+    def set_popular(self, names: Iterable[str]) -> None:
+        with self._lock:
+            self._snapshot = self._snapshot._replace(
+                version=self._snapshot.version + 1,
+                popular=frozenset(name.lower() for name in names),
+            )
+
+    def add_suspicious(self, names: Iterable[str]) -> None:
+        names = frozenset(name.lower() for name in names)
+
+        with self._lock:
+            if names <= self._snapshot.suspicious:
+                return
+
+            self._snapshot = self._snapshot._replace(
+                version=self._snapshot.version + 1,
+                suspicious=self._snapshot.suspicious | names,
+            )
+
+    async def publish_popular(self, names: Iterable[str]) -> None:
+        await publish_invalidation(TRENDS_INVALIDATION_CHANNEL, orjson.dumps({"popular": list(names)}))
+
+    async def publish_suspicious(self, names: Iterable[str]) -> None:
+        await publish_invalidation(TRENDS_INVALIDATION_CHANNEL, orjson.dumps({"suspicious": list(names)}))
+
+    async def handle_invalidation(self, message: bytes) -> None:
+        data = orjson.loads(message)
+
+        if "popular" in data:
+            self.set_popular(data["popular"])
+        if "suspicious" in data:
+            self.add_suspicious(data["suspicious"])
+
+
+trend_lookup = TrendLookup()
@@ -0,0 +1,175 @@
+# stdlib
+import asyncio
+from typing import List, Optional, Tuple
+
+# thirdparty
+import aiohttp
+import orjson
+
+# project
+from cache.redis import invalidate_tags
+from db.db_setup import redis_client
+from db.models.trend_model import TrendModel
+from db.session_manager import db_manager
+from services.count_service import invalidate_counts
+from services.instance_service import get_instances_by_active_users
+from services.trend_lookup import trend_lookup
+from services.trends_service import store_trends_snapshot
+from settings import get_settings
+from utils.logging import logger
+from utils.metrics import TRENDS_COLLECTOR_REQUESTS
+
+settings = get_settings()
+
+# the maximum limit of /api/v1/trends/tags, further trends are requested with an offset
+TRENDS_PAGE_SIZE = 20
+
+
+class TrendsCollector:
+    """
+    Collects trending tags of many instances concurrently and stores them as snapshots per instance. All requests
+    share one aiohttp session whose connector limits connections per host, a semaphore limits the number of
+    instances fetched at once. The ETag of the first page is kept in Redis, an instance which answers 304 keeps
+    its current snapshot.
+    """
+
+    def __init__(self, concurrency: int, per_host_limit: int, max_pages: int, timeout: float) -> None:
+        self.concurrency = concurrency
+        self.per_host_limit = per_host_limit
+        self.max_pages = max_pages
+        self.timeout = timeout
+
+    async def run(self, instance_urls: List[str]) -> int:
+        """Collect trends of instances, returns the number of instances whose trends changed."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host_limit)
+
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"Accept": "application/json"},
+        ) as client_session:
+            updated = await asyncio.gather(
+                *(self._collect(client_session, semaphore, instance_url) for instance_url in instance_urls)
+            )
+
+        if any(updated):
+            await invalidate_counts(TrendModel)
+            await invalidate_tags(TrendModel.__tablename__)
+
+        return sum(updated)
+
+    async def _collect(
+            self, client_session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, instance_url: str
+    ) -> bool:
+        try:
+            async with semaphore:
+                result = await self.fetch_trends(client_session, instance_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, TypeError) as e:
+            TRENDS_COLLECTOR_REQUESTS.labels("error").inc()
+            logger.warning(f"Failed to collect trends of {instance_url}: {type(e).__name__} {str(e)}")
+            return False
+
+        if result is None:
+            return False
+
+        etag, trends = result
+        # instances with disabled trends return nothing, their current snapshot is kept like on broken responses
+        if not trends:
+            return False
+
+        # written outside of the semaphore, so slow transactions do not hold back requests, a failed write of one
+        # instance must not abort the run of the other ones
+        try:
+            async with db_manager.session() as session:
+                names = await store_trends_snapshot(session=session, instance_url=instance_url, trends=trends)
+        except Exception as e:
+            logger.error(f"Failed to store trends of {instance_url}: {type(e).__name__} {str(e)}")
+            return False
+
+        # popular trends of the listeners come from the snapshot of the configured instance, like in
+        # update_mastodon_trends they are notified once the new one is committed
+        if instance_url.rstrip("/") == settings.MASTODON_INSTANCE_ENDPOINT.rstrip("/"):
+            await trend_lookup.publish_popular(names)
+
+        # the ETag is only remembered once the snapshot is stored, otherwise a failed write would be skipped with 304
+        if etag:
+            await self._set_etag(instance_url, etag)
+
+        return True
+
+    async def fetch_trends(
+            self, client_session: aiohttp.ClientSession, instance_url: str
+    ) -> Optional[Tuple[Optional[str], list]]:
+        """Get all pages of trends of an instance and the ETag of the first one, None if they are not modified."""
+        etag = await self._get_etag(instance_url)
+        response_etag = None
+        trends = []
+
+        for page in range(self.max_pages):
+            # later pages are only requested when the first one changed
+            headers = {"If-None-Match": etag} if etag and page == 0 else {}
+            params = {"limit": TRENDS_PAGE_SIZE, "offset": page * TRENDS_PAGE_SIZE}
+
+            async with client_session.get(
+                f"{instance_url}/api/v1/trends/tags", params=params, headers=headers
+            ) as response:
+                if response.status == 304:
+                    TRENDS_COLLECTOR_REQUESTS.labels("not_modified").inc()
+                    return None
+
+                response.raise_for_status()
+                data = orjson.loads(await response.read())
+                if page == 0:
+                    response_etag = response.headers.get("ETag")
+
+            if not isinstance(data, list):
+                raise TypeError(f"Unexpected trends response {str(data)[:100]}")
+
+            TRENDS_COLLECTOR_REQUESTS.labels("ok").inc()
+            trends.extend(data)
+
+            if len(data) < TRENDS_PAGE_SIZE:
+                break
+
+        return response_etag, trends
+
+    @staticmethod
+    def _etag_key(instance_url: str) -> str:
+        return f"trends_etag:{instance_url}"
+
+    async def _get_etag(self, instance_url: str) -> Optional[str]:
+        try:
+            etag = await redis_client.get(self._etag_key(instance_url))
+        except Exception as e:
+            logger.warning(f"Failed to read the trends ETag of {instance_url} from Redis: {str(e)}")
+            return None
+
+        return etag.decode() if etag else None
+
+    async def _set_etag(self, instance_url: str, etag: str) -> None:
+        try:
+            await redis_client.set(self._etag_key(instance_url), etag, ex=settings.TRENDS_COLLECTOR_ETAG_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to store the trends ETag of {instance_url} in Redis: {str(e)}")
+
+
+def create_trends_collector() -> TrendsCollector:
+    return TrendsCollector(
+        concurrency=settings.TRENDS_COLLECTOR_CONCURRENCY,
+        per_host_limit=settings.TRENDS_COLLECTOR_PER_HOST_LIMIT,
+        max_pages=settings.TRENDS_COLLECTOR_MAX_PAGES,
+        timeout=settings.TRENDS_COLLECTOR_TIMEOUT,
+    )
+
+
+async def collect_federated_trends(instances_count: int) -> int:
+    """Collect trends of the instances with the most active users."""
+    async with db_manager.session() as session:
+        names = await get_instances_by_active_users(session=session, limit=instances_count)
+
+    instance_urls = list(dict.fromkeys(f"https://{name}" for name in names))
+    updated = await create_trends_collector().run(instance_urls=instance_urls)
+
+    logger.info(f"Collected trends of {updated} of {len(instance_urls)} instances")
+    return updated
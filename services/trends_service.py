@@ -1,27 +1,118 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
 import aiohttp
-from sqlalchemy import delete, func, select, update
+from sqlalchemy import bindparam, delete, distinct, func, select, update
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.db_setup import ScopedSession
-from db.models.trend_model import SuspiciousTrendModel, TrendModel
+from cache.redis import cached, invalidate_tags
+from cache.serialization import results_serializer
+from db.models.trend_model import (CurrentTrendSnapshotModel,
+                                   SuspiciousTrendModel, TrendHistoryModel,
+                                   TrendModel, TrendSnapshotModel)
+from db.schemas.trend_schema import (FederatedTrendSchema,
+                                     SuspiciousTrendSchema, TrendSchema)
+from services.count_service import CountMode, count_rows, invalidate_counts
+from services.trend_lookup import trend_lookup
 from settings import get_settings
-from utils.pagination import calculate_pagination
+from utils.logging import logger
+from utils.pagination import (apply_cursor, calculate_cursor_pagination,
+                              calculate_pagination)
 
 settings = get_settings()
 
 
-async def delete_all_trends(session: AsyncSession):
-    query = delete(TrendModel)
-    await session.execute(query)
+def parse_trend_history(instance_url: str, trend: dict) -> List[dict]:
+    # days are unix timestamps of midnight UTC, counters are strings
+    return [
+        dict(
+            instance_url=instance_url,
+            name=trend["name"].lower(),
+            day=datetime.fromtimestamp(int(day["day"]), tz=timezone.utc).date(),
+            uses=int(day["uses"]),
+            accounts=int(day["accounts"]),
+        )
+        for day in trend["history"]
+    ]
 
 
-async def update_and_retrieve_trends(session: AsyncSession, trends: list):
-    session.add_all(trends)
+def current_snapshot_id(instance_url: str):
+    return (
+        select(CurrentTrendSnapshotModel.snapshot_id)
+        .where(CurrentTrendSnapshotModel.instance_url == instance_url)  # noqa
+        .scalar_subquery()
+    )
 
-    query = select(TrendModel)
-    result = await session.execute(query)
-    return result.scalars().all()
+
+async def get_current_trend_snapshot_id(session: AsyncSession, instance_url: str) -> Optional[int]:
+    result = await session.execute(select(current_snapshot_id(instance_url)))
+    return result.scalar()
+
+
+async def store_trends_snapshot(session: AsyncSession, instance_url: str, trends: list) -> List[str]:
+    """
+    Store trends of an instance as a new snapshot, merge their daily history and make the snapshot the current one.
+    Readers follow the pointer to the current snapshot, which is swapped in the same transaction, so they see either
+    the previous or the new trends and never an empty table.
+    """
+    result = await session.execute(
+        insert(TrendSnapshotModel).values(instance_url=instance_url).returning(TrendSnapshotModel.id)
+    )
+    snapshot_id = result.scalar_one()
+
+    # a trend or a day can not be written twice by one statement
+    trends = list({int(trend["id"]): trend for trend in trends}.values())
+    history = {
+        (row["name"], row["day"]): row for trend in trends for row in parse_trend_history(instance_url, trend)
+    }
+
+    if trends:
+        await session.execute(
+            insert(TrendModel),
+            [
+                dict(
+                    snapshot_id=snapshot_id,
+                    id=int(trend["id"]),
+                    name=trend["name"],
+                    url=trend["url"],
+                    uses_in_last_seven_days=sum(int(day["uses"]) for day in trend["history"]),
+                )
+                for trend in trends
+            ],
+        )
+
+    if history:
+        # the counters of the current day grow until it is over
+        query = insert(TrendHistoryModel).values(list(history.values()))
+        await session.execute(
+            query.on_conflict_do_update(
+                index_elements=["instance_url", "name", "day"],
+                set_=dict(uses=query.excluded.uses, accounts=query.excluded.accounts),
+            )
+        )
+
+    query = insert(CurrentTrendSnapshotModel).values(instance_url=instance_url, snapshot_id=snapshot_id)
+    await session.execute(
+        query.on_conflict_do_update(index_elements=["instance_url"], set_=dict(snapshot_id=query.excluded.snapshot_id))
+    )
+
+    # trends of removed snapshots are deleted by the foreign key
+    now = datetime.utcnow()
+    await session.execute(
+        delete(TrendSnapshotModel)
+        .where(TrendSnapshotModel.instance_url == instance_url)  # noqa
+        .where(TrendSnapshotModel.taken_at < now - timedelta(days=settings.TREND_SNAPSHOTS_RETENTION_DAYS))
+        .where(TrendSnapshotModel.id != snapshot_id)
+    )
+    await session.execute(
+        delete(TrendHistoryModel)
+        .where(TrendHistoryModel.instance_url == instance_url)  # noqa
+        .where(TrendHistoryModel.day < (now - timedelta(days=settings.TREND_HISTORY_RETENTION_DAYS)).date())
+    )
+
+    return [trend["name"] for trend in trends]
 
 
 async def update_mastodon_trends(session: AsyncSession):
@@ -29,92 +120,220 @@ async def update_mastodon_trends(session: AsyncSession):
     headers = {"Content-Type": "application/json"}
     async with aiohttp.ClientSession(headers=headers) as aio_session:
         async with aio_session.get(url) as response:
+            response.raise_for_status()
             trends = await response.json()
 
-            await delete_all_trends(session=session)
+    # keep the current snapshot rather than replacing it because of a broken response
+    if not trends:
+        logger.warning("Mastodon returned no trends, the refresh is skipped")
+        return
 
-            retrieved_trends = []
+    names = await store_trends_snapshot(
+        session=session, instance_url=settings.MASTODON_INSTANCE_ENDPOINT, trends=trends
+    )
 
-            for trend in trends:
-                counter = 0
-                for day in trend["history"]:
-                    counter += int(day["uses"])
-                retrieved_trends.append(TrendModel(
-                    id=int(trend["id"]),
-                    name=trend["name"],
-                    url=trend["url"],
-                    uses_in_last_seven_days=counter
-                ))
+    # caches are invalidated once the snapshot is visible, otherwise a concurrent reader could cache the old one again
+    await session.commit()
+    await invalidate_counts(TrendModel)
+    await invalidate_tags(TrendModel.__tablename__)
+
+    # refresh the lookup table of this process and notify the other ones
+    trend_lookup.set_popular(names)
+    await trend_lookup.publish_popular(names)
 
-            await update_and_retrieve_trends(session=session, trends=retrieved_trends)
 
+async def get_popular_trend_names(session: AsyncSession):
+    query = select(TrendModel.name).where(
+        TrendModel.snapshot_id == current_snapshot_id(settings.MASTODON_INSTANCE_ENDPOINT)  # noqa
+    )
+    result = await session.execute(query)
+    return result.scalars().all()
 
-def check_if_trend_popular(session: ScopedSession, name: str):
-    query = select(TrendModel).filter(TrendModel.name == name)  # noqa
-    result = session.execute(query)
-    return result.scalars().one_or_none()
 
+def trend_velocity(uses: List[int]) -> Optional[float]:
+    """Growth of the uses of the last day relative to the average of the previous days of a window."""
+    if len(uses) < 2:
+        return None
 
-def check_if_suspicious_trend_exist(session: ScopedSession, name: str):
-    query = select(SuspiciousTrendModel).filter(SuspiciousTrendModel.name == name)  # noqa
-    result = session.execute(query)
-    return result.scalars().one_or_none()
+    baseline = sum(uses[:-1]) / (len(uses) - 1)
+    return (uses[-1] - baseline) / max(baseline, 1)
 
 
-async def get_all_trends(session: AsyncSession, page: int, limit: int):
+async def get_trend_velocities(
+        session: AsyncSession,
+        names: Iterable[str],
+        instance_url: str,
+        days: int = settings.TREND_VELOCITY_DAYS,
+) -> Dict[str, Optional[float]]:
+    """Velocities of trends by lower-cased names, computed from the stored history with one index range scan."""
+    names = list({name.lower() for name in names})
+    if not names:
+        return {}
+
+    # uses of today are still accumulating, so the last complete day is compared with the days before it
+    today = datetime.utcnow().date()
     query = (
-        select(TrendModel)
-        .offset((page - 1) * limit)
-        .limit(limit)
+        select(TrendHistoryModel.name, TrendHistoryModel.uses)
+        .where(TrendHistoryModel.instance_url == instance_url)  # noqa
+        .where(TrendHistoryModel.name.in_(names))
+        .where(TrendHistoryModel.day >= today - timedelta(days=days))
+        .where(TrendHistoryModel.day < today)
+        .order_by(TrendHistoryModel.name, TrendHistoryModel.day)
     )
+    result = await session.execute(query)
+
+    uses = defaultdict(list)
+    for name, day_uses in result.all():
+        uses[name].append(day_uses)
+
+    return {name: trend_velocity(uses[name]) for name in names}
 
-    count_query = (
-        select(func.count(TrendModel.id))
+
+async def attach_trend_velocities(session: AsyncSession, trends: list, instance_url: str) -> None:
+    velocities = await get_trend_velocities(
+        session=session, names=[trend.name for trend in trends], instance_url=instance_url
+    )
+    for trend in trends:
+        trend.velocity = velocities.get(trend.name.lower())
+
+
+async def get_suspicious_trend_names(session: AsyncSession):
+    query = select(SuspiciousTrendModel.name)
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+@cached(
+    ttl=settings.LIST_CACHE_TTL,
+    namespace="trends",
+    serializer=results_serializer(TrendSchema),
+    tags=(TrendModel.__tablename__,),
+)
+async def get_all_trends(
+        session: AsyncSession,
+        page: int,
+        limit: int,
+        cursor: bool = False,
+        after: str = None,
+        count: CountMode = CountMode.EXACT,
+):
+    instance_url = settings.MASTODON_INSTANCE_ENDPOINT
+
+    # the snapshot is read once, so trends and their count come from the same one
+    snapshot_id = await get_current_trend_snapshot_id(session=session, instance_url=instance_url)
+    query = select(TrendModel).where(TrendModel.snapshot_id == snapshot_id)  # noqa
+
+    if cursor or after:
+        columns = (TrendModel.id,)
+        result = await session.execute(apply_cursor(query=query, columns=columns, after=after, limit=limit))
+        trends, pagination = calculate_cursor_pagination(rows=result.scalars().all(), columns=columns, limit=limit)
+        await attach_trend_velocities(session=session, trends=trends, instance_url=instance_url)
+        return trends, pagination
+
+    query = (
+        query
         .offset((page - 1) * limit)
         .limit(limit)
     )
 
     result = await session.execute(query)
-    results = await session.execute(count_query)
+    trends = result.scalars().all()
+    await attach_trend_velocities(session=session, trends=trends, instance_url=instance_url)
 
-    total_count = results.scalar()
+    total_count = 0
+    if snapshot_id is not None:
+        total_count = await count_rows(session=session, model=TrendModel, mode=count, snapshot_id=snapshot_id)
 
-    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count)
-    trends = result.scalars().all()
+    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count, results_count=len(trends))
 
     return trends, pagination
 
 
-async def get_all_suspicious_trends(session: AsyncSession, page: int, limit: int, instance: str = None):
+@cached(
+    ttl=settings.LIST_CACHE_TTL,
+    namespace="trends",
+    serializer=results_serializer(FederatedTrendSchema),
+    tags=(TrendModel.__tablename__,),
+)
+async def get_federated_trends(session: AsyncSession, page: int, limit: int):
+    """Current trends of all instances merged by lower-cased name, the ones trending on most instances first."""
+    name = func.lower(TrendModel.name)
+    instances_count = func.count(distinct(CurrentTrendSnapshotModel.instance_url))
+    uses = func.sum(TrendModel.uses_in_last_seven_days)
+
     query = (
-        select(SuspiciousTrendModel)
+        select(
+            name.label("name"),
+            instances_count.label("instances_count"),
+            uses.label("uses_in_last_seven_days"),
+        )
+        .join(CurrentTrendSnapshotModel, CurrentTrendSnapshotModel.snapshot_id == TrendModel.snapshot_id)
+        .group_by(name)
+        .order_by(instances_count.desc(), uses.desc(), name)
         .offset((page - 1) * limit)
         .limit(limit)
     )
 
-    count_query = (
-        select(func.count(SuspiciousTrendModel.id))
+    result = await session.execute(query)
+    trends = result.all()
+
+    query = (
+        select(func.count(distinct(name)))
+        .select_from(TrendModel)
+        .join(CurrentTrendSnapshotModel, CurrentTrendSnapshotModel.snapshot_id == TrendModel.snapshot_id)
+    )
+    total_count = (await session.execute(query)).scalar_one()
+
+    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count, results_count=len(trends))
+
+    return trends, pagination
+
+
+@cached(
+    ttl=settings.LIST_CACHE_TTL,
+    namespace="trends",
+    serializer=results_serializer(SuspiciousTrendSchema),
+    tags=(SuspiciousTrendModel.__tablename__,),
+)
+async def get_all_suspicious_trends(
+        session: AsyncSession,
+        page: int,
+        limit: int,
+        instance: str = None,
+        cursor: bool = False,
+        after: str = None,
+        count: CountMode = CountMode.EXACT,
+):
+    if cursor or after:
+        query = select(SuspiciousTrendModel)
+        if instance:
+            query = query.filter(SuspiciousTrendModel.instance_url == instance)  # noqa
+
+        columns = (SuspiciousTrendModel.id,)
+        result = await session.execute(apply_cursor(query=query, columns=columns, after=after, limit=limit))
+        return calculate_cursor_pagination(rows=result.scalars().all(), columns=columns, limit=limit)
+
+    query = (
+        select(SuspiciousTrendModel)
         .offset((page - 1) * limit)
         .limit(limit)
     )
 
     if instance:
         query = query.filter(SuspiciousTrendModel.instance_url == instance)  # noqa
-        count_query = count_query.filter(SuspiciousTrendModel.instance_url == instance)  # noqa
 
     result = await session.execute(query)
-    results = await session.execute(count_query)
+    trends = result.scalars().all()
 
-    total_count = results.scalar()
+    total_count = await count_rows(session=session, model=SuspiciousTrendModel, mode=count, instance_url=instance)
 
-    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count)
-    trends = result.scalars().all()
+    pagination = calculate_pagination(page=page, limit=limit, total_count=total_count, results_count=len(trends))
 
     return trends, pagination
 
 
-def create_or_update_suspicious_trend(
-        session: ScopedSession,
+async def create_or_update_suspicious_trend(
+        session: AsyncSession,
         name: str,
         url: str,
         uses_in_last_seven_days: int,
@@ -140,17 +359,22 @@ def create_or_update_suspicious_trend(
         set_=dict(uses_in_last_seven_days=uses_in_last_seven_days, number_of_accounts=number_of_accounts),
     )
 
-    result = session.execute(insert_stmt)
+    result = await session.execute(insert_stmt)
     result = result.fetchone()
 
     return result
 
 
-def increment_suspicious_trend_number_of_similar_posts(session: ScopedSession, suspicious_trend_id: int):
+async def increment_suspicious_trends_number_of_similar_posts(session: AsyncSession, deltas: Dict[int, int]):
+    # a core update of the table is executed once for all trends, rows are locked in the order of ids, so
+    # concurrent flushes of different processes do not deadlock
+    table = SuspiciousTrendModel.__table__
     query = (
-        update(SuspiciousTrendModel)
-        .values(dict(number_of_similar_statuses=SuspiciousTrendModel.number_of_similar_statuses + 1))
-        .filter(SuspiciousTrendModel.id == suspicious_trend_id)  # noqa
+        update(table)
+        .values(number_of_similar_statuses=table.c.number_of_similar_statuses + bindparam("delta"))
+        .where(table.c.id == bindparam("trend_id"))
     )
 
-    session.execute(query)
+    await session.execute(
+        query, [dict(trend_id=trend_id, delta=delta) for trend_id, delta in sorted(deltas.items())]
+    )
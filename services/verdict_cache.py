@@ -0,0 +1,217 @@
+# stdlib
+import hashlib
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# thirdparty
+import orjson
+from sqlalchemy import literal, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# project
+from db.db_setup import redis_client
+from db.models.statuses_to_check_model import StatusToCheckModel
+from services.llm_provider import PROMPT_VERSION, LLMModel
+from settings import get_settings
+from utils.logging import logger
+from utils.metrics import VERDICT_CACHE_HITS, VERDICT_CACHE_MISSES
+
+settings = get_settings()
+
+whitespace_pattern = re.compile(r"\s+")
+
+
+class Verdict(NamedTuple):
+    response: str
+    confidence: float
+    is_suspicious: bool
+    # the response was cut off after the verdict fields, it is neither replayed nor stored as a full answer
+    truncated: bool = False
+
+
+def content_hash(content: Optional[str]) -> str:
+    # the same normalization is used by the backfill of the content_hash column
+    normalized = whitespace_pattern.sub(" ", (content or "").lower()).strip()
+    return hashlib.md5(normalized.encode("utf-8")).hexdigest()  # noqa: S324
+
+
+def log_bucket(value: Optional[int]) -> int:
+    # floor(log2(value + 1)), so 0, 1-2, 3-6, 7-14 and so on share a bucket
+    return (max(value or 0, 0) + 1).bit_length() - 1
+
+
+def author_bucket(status: dict) -> str:
+    """Coarse author features which go into the prompt, authors within one bucket get the same verdict."""
+    age_days = 0
+    if status.get("created_at") and status.get("author_created_at"):
+        age_days = (status["created_at"] - status["author_created_at"]).days
+
+    return ":".join(
+        str(log_bucket(value))
+        for value in (
+            status.get("author_followers_count"),
+            status.get("author_following_count"),
+            status.get("author_statuses_count"),
+            age_days,
+        )
+    )
+
+
+def verdict_key(status: dict, model: LLMModel, truncated: bool = False) -> str:
+    key = f"verdict:{model.value}:{PROMPT_VERSION}:{content_hash(status['content'])}:{author_bucket(status)}"
+    return f"{key}:truncated" if truncated else key
+
+
+def stored_verdict(status: dict, model: LLMModel, verdict_only: bool = False) -> Optional[Verdict]:
+    if status.get("prompt_version") != PROMPT_VERSION:
+        return None
+
+    response = status.get(f"{model.value}_response")
+    confidence = status.get(f"{model.value}_confidence")
+    is_suspicious = status.get(f"{model.value}_is_suspicious")
+
+    if response is not None:
+        return Verdict(response=response, confidence=confidence, is_suspicious=is_suspicious)
+
+    # truncated responses are stored without the text, only verdict-only requests can reuse them
+    if verdict_only and confidence is not None:
+        return Verdict(response="", confidence=confidence, is_suspicious=is_suspicious, truncated=True)
+
+    return None
+
+
+async def get_cached_verdicts(
+        session: AsyncSession, statuses: List[dict], models: List[LLMModel], verdict_only: bool = False
+) -> Dict[Tuple[str, LLMModel], Verdict]:
+    """
+    Find verdicts of the models for many statuses, keyed by status id and model: their own rows first, then Redis
+    with one MGET, then identical posts in the DB with one query. Truncated verdicts are only returned for
+    verdict-only requests, full answers are returned for both.
+    """
+    verdicts: Dict[Tuple[str, LLMModel], Verdict] = {}
+    pending: List[Tuple[dict, LLMModel]] = []
+    for status in statuses:
+        for model in models:
+            verdict = stored_verdict(status, model, verdict_only=verdict_only)
+            if verdict is not None:
+                VERDICT_CACHE_HITS.labels(model.value, "status").inc()
+                verdicts[(status["id"], model)] = verdict
+            else:
+                pending.append((status, model))
+
+    pending = await _get_redis_verdicts(pending=pending, verdict_only=verdict_only, verdicts=verdicts)
+    pending = await _get_database_verdicts(
+        session=session, pending=pending, verdict_only=verdict_only, verdicts=verdicts
+    )
+
+    for _, model in pending:
+        VERDICT_CACHE_MISSES.labels(model.value).inc()
+
+    return verdicts
+
+
+async def _get_redis_verdicts(
+        pending: List[Tuple[dict, LLMModel]], verdict_only: bool, verdicts: Dict[Tuple[str, LLMModel], Verdict]
+) -> List[Tuple[dict, LLMModel]]:
+    if not pending:
+        return pending
+
+    # a full answer is preferred over a truncated one
+    variants = (False, True) if verdict_only else (False,)
+    keys = [verdict_key(status, model, truncated=truncated) for status, model in pending for truncated in variants]
+
+    try:
+        values = await redis_client.mget(keys)
+    except Exception as e:
+        logger.warning(f"Failed to read verdicts from Redis: {str(e)}")
+        return pending
+
+    remaining = []
+    for index, (status, model) in enumerate(pending):
+        candidates = values[index * len(variants):(index + 1) * len(variants)]
+        cached = next((value for value in candidates if value is not None), None)
+        if cached is None:
+            remaining.append((status, model))
+            continue
+
+        VERDICT_CACHE_HITS.labels(model.value, "redis").inc()
+        verdicts[(status["id"], model)] = Verdict(*orjson.loads(cached))
+
+    return remaining
+
+
+async def _get_database_verdicts(
+        session: AsyncSession,
+        pending: List[Tuple[dict, LLMModel]],
+        verdict_only: bool,
+        verdicts: Dict[Tuple[str, LLMModel], Verdict],
+) -> List[Tuple[dict, LLMModel]]:
+    if not pending:
+        return pending
+
+    groups = {status["id"]: (content_hash(status["content"]), author_bucket(status)) for status, _ in pending}
+
+    # the same text posted by a similar author under another status id, one row per text, author bucket and model
+    # with full answers first, the models are combined into a single statement
+    queries = []
+    for model in dict.fromkeys(model for _, model in pending):
+        response_column = getattr(StatusToCheckModel, f"{model.value}_response")
+        confidence_column = getattr(StatusToCheckModel, f"{model.value}_confidence")
+        subquery = (
+            select(
+                StatusToCheckModel.content_hash,
+                StatusToCheckModel.author_bucket,
+                response_column.label("response"),
+                confidence_column.label("confidence"),
+                getattr(StatusToCheckModel, f"{model.value}_is_suspicious").label("is_suspicious"),
+            )
+            .filter(tuple_(StatusToCheckModel.content_hash, StatusToCheckModel.author_bucket).in_(set(groups.values())))
+            .filter(StatusToCheckModel.prompt_version == PROMPT_VERSION)
+            .filter((confidence_column if verdict_only else response_column).is_not(None))
+            .distinct(StatusToCheckModel.content_hash, StatusToCheckModel.author_bucket)
+            .order_by(StatusToCheckModel.content_hash, StatusToCheckModel.author_bucket, response_column.is_(None))
+            .subquery()
+        )
+        queries.append(select(literal(model.value).label("model"), subquery))
+
+    result = await session.execute(union_all(*queries))
+    rows = {(row.model, row.content_hash, row.author_bucket): row for row in result}
+
+    remaining = []
+    found: Dict[str, Verdict] = {}
+    for status, model in pending:
+        row = rows.get((model.value, *groups[status["id"]]))
+        if row is None:
+            remaining.append((status, model))
+            continue
+
+        VERDICT_CACHE_HITS.labels(model.value, "database").inc()
+        verdict = Verdict(
+            response=row.response or "",
+            confidence=row.confidence,
+            is_suspicious=row.is_suspicious,
+            truncated=row.response is None,
+        )
+        verdicts[(status["id"], model)] = verdict
+        found[verdict_key(status, model, truncated=verdict.truncated)] = verdict
+
+    await store_verdicts(found)
+    return remaining
+
+
+async def store_verdict(key: str, verdict: Verdict) -> None:
+    await store_verdicts({key: verdict})
+
+
+async def store_verdicts(verdicts: Dict[str, Verdict]) -> None:
+    if not verdicts:
+        return
+
+    try:
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            for key, verdict in verdicts.items():
+                # orjson does not serialize named tuples, the fields are stored as a list
+                pipeline.set(key, orjson.dumps(list(verdict)), ex=settings.VERDICT_CACHE_TTL)
+            await pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to store verdicts in Redis: {str(e)}")
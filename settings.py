@@ -1,5 +1,6 @@
 # stdlib
 from functools import cache
+from typing import List, Literal
 
 # thirdparty
 from dotenv import load_dotenv
@@ -25,14 +26,21 @@ class Settings(BaseSettings):
     TRACEBACK_OUTPUT_ENABLED: bool = False
 
     DATABASE_URL: str
-    DATABASE_URL_PSYCOPG2: str
 
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str = ""
 
+    # "queue" keeps connections open in the process, "pgbouncer" does the same for pgbouncer in transaction mode
+    # (no prepared statement caches), "null" opens a connection per session
+    DATABASE_POOL_MODE: Literal["queue", "pgbouncer", "null"] = "queue"
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_RECYCLE: int = 1800
+    # pool sizes are totals per host, they are divided between gunicorn workers
     ASYNC_ENGINE_POOL_SIZE: int = 20
     ASYNC_ENGINE_MAX_OVERFLOW: int = 50
+    # set by gunicorn_config.py for the workers
+    WEB_CONCURRENCY: int = 1
 
     RABBITMQ_HOST: str = "rabbitmq"
     RABBITMQ_PORT: int = 5672
@@ -44,6 +52,13 @@ class Settings(BaseSettings):
 
     MASTODON_INSTANCE_ENDPOINT: str = "https://mastodon.social"
     MASTODON_INSTANCE_ACCESS_TOKEN: str = ""
+    MASTODON_CLIENT_TIMEOUT: float = 5.0
+    MASTODON_CLIENT_MAX_CONNECTIONS: int = 20
+    MASTODON_CLIENT_HTTP2: bool = True
+
+    TAG_INFO_CACHE_TTL: int = 600
+    TAG_INFO_CACHE_SIZE: int = 10000
+    TAG_INFO_MAX_RETRIES: int = 3
 
     OTLP_GRPC_ENDPOINT: str = "http://tempo:4317"
 
@@ -52,6 +67,79 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: str = ""
     TOGETHER_API_KEY: str = ""
 
+    INGESTION_BUFFER_SIZE: int = 10000
+    INGESTION_BATCH_SIZE: int = 500
+    INGESTION_FLUSH_INTERVAL: float = 1.0
+    INGESTION_MAX_RETRIES: int = 3
+    INGESTION_RETRY_DELAY: float = 0.5
+    SIMILAR_POSTS_FLUSH_INTERVAL: float = 10.0
+    LISTENER_INVALIDATION_INTERVAL: float = 5.0
+
+    SIMILARITY_INDEX_MAX_TAGS: int = 10000
+    SIMILARITY_INDEX_MAX_STATUSES_PER_TAG: int = 5000
+    SIMILARITY_INDEX_WARM_DAYS: int = 7
+
+    NEAR_DUPLICATE_NUM_PERM: int = 128
+    NEAR_DUPLICATE_BANDS: int = 32
+    NEAR_DUPLICATE_THRESHOLD: float = 0.5
+    NEAR_DUPLICATE_MAX_STATUSES: int = 100000
+
+    NORMALIZER_TOKENS_CACHE_SIZE: int = 50000
+    NORMALIZER_STEMS_CACHE_SIZE: int = 100000
+
+    STREAM_WORKERS: int = 8
+    STREAM_QUEUE_SIZE: int = 10000
+    STREAM_RECONNECT_DELAY: float = 1.0
+    STREAM_BACKFILL_PAGES: int = 10
+    STREAM_INSTANCE_RATE_LIMIT: float = 100.0
+    STREAM_INSTANCE_BURST: int = 500
+    STREAM_HEALTH_INTERVAL: float = 30.0
+    # streams which received nothing for this long are reported as stale
+    STREAM_STALE_TIMEOUT: float = 300.0
+
+    FEDERATED_INSTANCES_COUNT: int = 50
+    FEDERATED_INGESTION_PROCESSES: int = 0
+    # shards none of whose streams received a status for this long are restarted
+    FEDERATED_INGESTION_STALE_TIMEOUT: float = 900.0
+    FEDERATED_INGESTION_METRICS_PORT: int = 9100
+
+    TREND_LOOKUP_REFRESH_INTERVAL: float = 300.0
+    TREND_SNAPSHOTS_RETENTION_DAYS: int = 7
+    TREND_HISTORY_RETENTION_DAYS: int = 90
+    TREND_VELOCITY_DAYS: int = 7
+
+    TRENDS_COLLECTOR_INSTANCES_COUNT: int = 500
+    TRENDS_COLLECTOR_CONCURRENCY: int = 64
+    TRENDS_COLLECTOR_PER_HOST_LIMIT: int = 2
+    TRENDS_COLLECTOR_MAX_PAGES: int = 3
+    TRENDS_COLLECTOR_TIMEOUT: float = 10.0
+    TRENDS_COLLECTOR_ETAG_TTL: int = 3600
+
+    TASK_LOCK_TTL: int = 60
+
+    COUNT_CACHE_TTL: int = 300
+
+    VERDICT_CACHE_TTL: int = 604800
+
+    BATCH_CLASSIFIER_MODELS: List[str] = ["openai"]
+    BATCH_CLASSIFIER_BATCH_SIZE: int = 50
+    BATCH_CLASSIFIER_MAX_BATCHES: int = 20
+    BATCH_CLASSIFIER_CONCURRENCY: int = 8
+    BATCH_CLASSIFIER_RATE_LIMIT: float = 5.0
+    BATCH_CLASSIFIER_BURST: int = 10
+    BATCH_CLASSIFIER_MAX_RETRIES: int = 3
+    BATCH_CLASSIFIER_MAX_ATTEMPTS: int = 5
+    BATCH_CLASSIFIER_VERDICT_ONLY: bool = False
+    # metrics of the celery pool processes are served from the worker on this port
+    CELERY_METRICS_PORT: int = 9101
+
+    WS_COALESCE_INTERVAL: float = 0.05
+
+    CACHE_L1_SIZE: int = 1000
+    CACHE_L1_TTL: float = 5.0
+    CACHE_NEGATIVE_TTL: int = 10
+    LIST_CACHE_TTL: int = 30
+
 
 @cache
 def get_settings() -> Settings:
@@ -1,13 +1,16 @@
 # stdlib
 import traceback
 from datetime import date, datetime
+from functools import cache
+from typing import Any, Dict, List, Optional, Sequence, Type
 
 # thirdparty
+import orjson
 from fastapi import Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, ValidationError
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 # project
 from settings import get_settings
@@ -22,11 +25,41 @@ def response_wrapper_result(result, status_code=status.HTTP_200_OK):
     return JSONResponse(content=response, status_code=status_code)
 
 
-def response_wrapper_results(results, status_code=status.HTTP_200_OK, pagination=None):
-    response = {"results": jsonable_encoder(results)}
-    if pagination:
-        response["pagination"] = pagination
-    return JSONResponse(content=response, status_code=status_code)
+@cache
+def get_list_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[schema])
+
+
+def encode_results(
+    results: Sequence[Any], pagination: Optional[Dict[str, Any]] = None, schema: Optional[Type[BaseModel]] = None
+) -> bytes:
+    """
+    Encode a list response to JSON bytes. Schema instances (or rows validated with the given schema) are dumped by
+    pydantic-core straight to bytes, other results fall back to jsonable_encoder.
+    """
+    if schema is None and results and isinstance(results[0], BaseModel):
+        schema = type(results[0])
+
+    if schema is not None:
+        adapter = get_list_adapter(schema)
+        if results and not isinstance(results[0], schema):
+            results = adapter.validate_python(results, from_attributes=True)
+        encoded_results = adapter.dump_json(results)
+    else:
+        encoded_results = orjson.dumps(jsonable_encoder(results))
+
+    if not pagination:
+        return b'{"results":' + encoded_results + b"}"
+
+    return b'{"results":' + encoded_results + b',"pagination":' + orjson.dumps(pagination) + b"}"
+
+
+def response_wrapper_results(results, status_code=status.HTTP_200_OK, pagination=None, schema=None):
+    return Response(
+        content=encode_results(results=results, pagination=pagination, schema=schema),
+        status_code=status_code,
+        media_type="application/json",
+    )
 
 
 def json_serial(obj):
@@ -44,9 +77,14 @@ class CustomHTTPException(Exception):
 
 class PaginationModel(BaseModel):
     page: int
-    pages: int
+    pages: int | None = None
+    on_page: int
+    total_results: int | None = None
+
+
+class CursorPaginationModel(BaseModel):
     on_page: int
-    total_results: int
+    next: str | None = None
 
 
 def generate_error_response_content(
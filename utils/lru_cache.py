@@ -0,0 +1,83 @@
+# stdlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe bounded mapping which evicts the least recently used key. on_evict is called with every key which
+    leaves the mapping, so indexes built on top of it can follow.
+    """
+
+    def __init__(self, maxsize: int, on_evict: Optional[Callable[[Hashable], None]] = None) -> None:
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        evicted = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+
+        self._evicted(evicted)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            evicted = [key] if self._data.pop(key, _MISSING) is not _MISSING else []
+
+        self._evicted(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            evicted = list(self._data)
+            self._data.clear()
+
+        self._evicted(evicted)
+
+    def _evicted(self, keys: list) -> None:
+        # called outside of the lock, the callback may use the cache
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries expire after a time-to-live."""
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[Hashable], None]] = None) -> None:
+        super().__init__(maxsize=maxsize, on_evict=on_evict)
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self.delete(key)
+            return default
+
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        super().set(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
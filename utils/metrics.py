@@ -0,0 +1,121 @@
+"""Prometheus metrics of the analyzer."""
+
+# thirdparty
+from prometheus_client import Counter, Gauge, Histogram
+
+NORMALIZER_CACHE_HITS = Counter(
+    "analyzer_normalizer_cache_hits_total",
+    "Number of similarity normalizer cache hits",
+    ["cache"],
+)
+NORMALIZER_CACHE_MISSES = Counter(
+    "analyzer_normalizer_cache_misses_total",
+    "Number of similarity normalizer cache misses",
+    ["cache"],
+)
+
+STREAM_QUEUE_DEPTH = Gauge(
+    "analyzer_stream_queue_depth",
+    "Number of received statuses waiting for a stream worker",
+    ["instance"],
+    multiprocess_mode="livesum",
+)
+STREAM_EVENTS = Counter(
+    "analyzer_stream_events_total",
+    "Number of statuses received from a stream",
+    ["instance"],
+)
+STREAM_RECONNECTS = Counter(
+    "analyzer_stream_reconnects_total",
+    "Number of stream reconnects",
+    ["instance"],
+)
+STREAM_CONNECTED = Gauge(
+    "analyzer_stream_connected",
+    "Whether a stream is currently connected",
+    ["instance"],
+    multiprocess_mode="livesum",
+)
+STREAM_LAST_EVENT = Gauge(
+    "analyzer_stream_last_event_timestamp_seconds",
+    "Unix time of the last status received from a stream",
+    ["instance"],
+    multiprocess_mode="max",
+)
+
+VERDICT_CACHE_HITS = Counter(
+    "analyzer_verdict_cache_hits_total",
+    "Number of LLM verdicts served from a cache",
+    ["model", "tier"],
+)
+VERDICT_CACHE_MISSES = Counter(
+    "analyzer_verdict_cache_misses_total",
+    "Number of LLM verdicts requested from a provider",
+    ["model"],
+)
+
+BATCH_CLASSIFIER_ITEMS = Counter(
+    "analyzer_batch_classifier_items_total",
+    "Number of statuses classified by the batch classifier",
+    ["model"],
+)
+BATCH_CLASSIFIER_TOKENS = Counter(
+    "analyzer_batch_classifier_tokens_total",
+    "Estimated number of tokens used by the batch classifier",
+    ["model", "direction"],
+)
+BATCH_CLASSIFIER_COST = Counter(
+    "analyzer_batch_classifier_cost_dollars_total",
+    "Estimated cost of the batch classifier requests",
+    ["model"],
+)
+BATCH_CLASSIFIER_ERRORS = Counter(
+    "analyzer_batch_classifier_errors_total",
+    "Number of failed batch classifier requests",
+    ["model"],
+)
+
+TRENDS_COLLECTOR_REQUESTS = Counter(
+    "analyzer_trends_collector_requests_total",
+    "Number of trends requests of the trends collector by their result",
+    ["result"],
+)
+
+CACHE_REQUESTS = Counter(
+    "analyzer_cache_requests_total",
+    "Number of cached function calls by the tier which served them",
+    ["namespace", "result"],
+)
+CACHE_LATENCY = Histogram(
+    "analyzer_cache_latency_seconds",
+    "Latency of cached function calls",
+    ["namespace"],
+)
+
+DB_POOL_WAIT = Histogram(
+    "analyzer_db_pool_wait_seconds",
+    "Time spent waiting for a database connection from the pool",
+    ["engine"],
+)
+DB_POOL_CHECKOUTS = Counter(
+    "analyzer_db_pool_checkouts_total",
+    "Number of database connections checked out from the pool",
+    ["engine"],
+)
+DB_POOL_TIMEOUTS = Counter(
+    "analyzer_db_pool_timeouts_total",
+    "Number of checkouts which timed out waiting for a database connection",
+    ["engine"],
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "analyzer_db_pool_checked_out",
+    "Number of database connections in use",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "analyzer_db_pool_overflow",
+    "Number of database connections open above the pool size",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
@@ -0,0 +1,39 @@
+"""Prometheus multiprocess mode of processes which run their work in child processes."""
+
+# stdlib
+import os
+import shutil
+import tempfile
+
+
+def create_metrics_dir(prefix: str) -> str:
+    """
+    Create an empty directory for the metric files of child processes and point prometheus_client at it.
+    Children which import prometheus_client afterwards (spawned, or forked before the import) write their metrics
+    there, the parent aggregates them with start_metrics_server.
+    """
+    path = tempfile.mkdtemp(prefix=prefix)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def start_metrics_server(port: int, path: str) -> None:
+    """Serve the metrics of all children on a port from a background thread."""
+    # imported here, prometheus_client picks its value class on import and forked children inherit it
+    from prometheus_client import (CollectorRegistry, multiprocess,
+                                   start_http_server)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path)
+    start_http_server(port, registry=registry)
+
+
+def mark_process_dead(pid: int, path: str) -> None:
+    """Drop the live gauges of an exited child, its counters keep counting towards the totals."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(pid, path)
+
+
+def remove_metrics_dir(path: str) -> None:
+    shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,128 @@
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from utils.similarity_checker import normalize
+
+# parameters of the universal hash family used for permutations
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+# get hashed word shingles of a normalized status content
+def shingles(content: str, size: int = 3) -> Set[int]:
+    tokens = normalize(content)
+    if len(tokens) <= size:
+        grams = [" ".join(tokens)] if tokens else []
+    else:
+        grams = [" ".join(tokens[index:index + size]) for index in range(len(tokens) - size + 1)]
+
+    return {zlib.crc32(gram.encode("utf-8")) for gram in grams}
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of status contents with a banded LSH index on top of them. Statuses sharing at least one band
+    are candidates, candidates with estimated Jaccard similarity >= threshold are near-duplicates and share a cluster.
+    """
+
+    def __init__(
+        self,
+        num_perm: int,
+        bands: int,
+        threshold: float,
+        max_statuses: int,
+        shingle_size: int = 3,
+        seed: int = 1,
+    ) -> None:
+        if num_perm % bands != 0:
+            raise ValueError("Number of permutations must be divisible by the number of bands.")
+
+        self.threshold = threshold
+        self.max_statuses = max_statuses
+        self.shingle_size = shingle_size
+        self._bands = bands
+        self._rows = num_perm // bands
+
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._signatures: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._clusters: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, content: str) -> Optional[np.ndarray]:
+        hashes = np.fromiter(shingles(content, self.shingle_size), dtype=np.uint64)
+        if hashes.size == 0:
+            return None
+
+        # multiplication overflow wraps around, which is fine for hashing purposes
+        with np.errstate(over="ignore"):
+            permuted = np.bitwise_and((np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME, MAX_HASH)
+
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def add(self, status_id: str, content: str, cluster_id: Optional[str] = None) -> Tuple[str, List[str]]:
+        """Index a status and return its cluster id together with ids of already indexed near-duplicates."""
+        signature = self.signature(content)
+        if signature is None:
+            return cluster_id or status_id, []
+
+        with self._lock:
+            if status_id in self._signatures:
+                return self._clusters[status_id], []
+
+            duplicates = self._find_duplicates(signature)
+
+            if cluster_id is None:
+                # join the oldest cluster among near-duplicates, status ids are snowflakes
+                clusters = [self._clusters[duplicate] for duplicate in duplicates]
+                cluster_id = min(clusters, key=lambda value: (len(value), value)) if clusters else status_id
+
+            self._insert(status_id, signature, cluster_id)
+
+            return cluster_id, duplicates
+
+    def warm(self, statuses: Iterable) -> None:
+        for status in statuses:
+            self.add(str(status.id), status.content or "", cluster_id=status.cluster_id)
+
+    def _find_duplicates(self, signature: np.ndarray) -> List[str]:
+        candidates: Set[str] = set()
+        for band, buckets in enumerate(self._buckets):
+            candidates |= buckets.get(self._band_key(signature, band), set())
+
+        return [
+            candidate
+            for candidate in candidates
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold
+        ]
+
+    def _insert(self, status_id: str, signature: np.ndarray, cluster_id: str) -> None:
+        self._signatures[status_id] = signature
+        self._clusters[status_id] = cluster_id
+        for band, buckets in enumerate(self._buckets):
+            buckets.setdefault(self._band_key(signature, band), set()).add(status_id)
+
+        # forget the oldest statuses
+        while len(self._signatures) > self.max_statuses:
+            evicted_id, evicted_signature = self._signatures.popitem(last=False)
+            self._clusters.pop(evicted_id, None)
+            for band, buckets in enumerate(self._buckets):
+                key = self._band_key(evicted_signature, band)
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(evicted_id)
+                    if not bucket:
+                        del buckets[key]
+
+    def _band_key(self, signature: np.ndarray, band: int) -> bytes:
+        return signature[band * self._rows:(band + 1) * self._rows].tobytes()
@@ -1,10 +1,21 @@
 # stdlib
+import base64
+import binascii
+from datetime import datetime
 from math import ceil
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# thirdparty
+import orjson
+from sqlalchemy import ColumnElement, Select, tuple_
+
+# project
+from utils.errors import ErrorResponseEnum
+from utils.helpers import CustomHTTPException
 
 
 class Pagination:
-    def __init__(self, page: int, pages: int, on_page: int, total_results: int) -> None:
+    def __init__(self, page: int, pages: Optional[int], on_page: int, total_results: Optional[int]) -> None:
         self.page = page
         self.pages = pages
         self.on_page = on_page
@@ -19,10 +30,17 @@ class Pagination:
         }
 
 
-def calculate_pagination(page: int, limit: int, total_count: int) -> Dict[str, Any]:
+def calculate_pagination(
+    page: int, limit: int, total_count: Optional[int], results_count: Optional[int] = None
+) -> Dict[str, Any]:
     if limit <= 0:
         raise ValueError("Limit must be greater than zero.")
 
+    # totals are not counted, only the size of the current page is known
+    if total_count is None:
+        pagination = Pagination(page=page, pages=None, on_page=results_count or 0, total_results=None)
+        return pagination.to_dict()
+
     pages = ceil(total_count / limit) if total_count > 0 else 1
     on_page = min(limit, total_count - (page - 1) * limit)
 
@@ -33,3 +51,57 @@ def calculate_pagination(page: int, limit: int, total_count: int) -> Dict[str, A
         total_results=total_count,
     )
     return pagination.to_dict()
+
+
+class CursorPagination:
+    def __init__(self, on_page: int, next_cursor: Optional[str]) -> None:
+        self.on_page = on_page
+        self.next_cursor = next_cursor
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "on_page": self.on_page,
+            "next": self.next_cursor,
+        }
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(list(values))).decode()
+
+
+def decode_cursor(cursor: str, columns: Sequence[ColumnElement]) -> Tuple[Any, ...]:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("Cursor does not match the sort key.")
+
+        # datetimes are encoded as ISO strings
+        return tuple(
+            datetime.fromisoformat(value) if column.type.python_type is datetime else value
+            for column, value in zip(columns, values)
+        )
+    except (ValueError, TypeError, NotImplementedError, binascii.Error):
+        raise CustomHTTPException(ErrorResponseEnum.INVALID_CURSOR)
+
+
+def apply_cursor(query: Select, columns: Sequence[ColumnElement], after: Optional[str], limit: int) -> Select:
+    """Order the query by the sort key (newest first) and continue right after the row encoded in the cursor."""
+    if after:
+        query = query.filter(tuple_(*columns) < tuple_(*decode_cursor(after, columns)))
+
+    # one extra row tells whether there is a next page
+    return query.order_by(*(column.desc() for column in columns)).limit(limit + 1)
+
+
+def calculate_cursor_pagination(
+    rows: Sequence[Any], columns: Sequence[ColumnElement], limit: int
+) -> Tuple[Sequence[Any], Dict[str, Any]]:
+    rows = list(rows)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+    pagination = CursorPagination(on_page=len(rows), next_cursor=next_cursor)
+    return rows, pagination.to_dict()
@@ -1,9 +1,19 @@
+import hashlib
 import string
-from typing import List
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
 
 import nltk
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from settings import get_settings
+from utils.lru_cache import LRUCache
+from utils.metrics import NORMALIZER_CACHE_HITS, NORMALIZER_CACHE_MISSES
+
+settings = get_settings()
 
 # define a stemmer
 stemmer = nltk.stem.porter.PorterStemmer()
@@ -11,23 +21,282 @@ stemmer = nltk.stem.porter.PorterStemmer()
 # get punctuation characters
 remove_punctuation_map = dict((ord(char), None) for char in string.punctuation)
 
+# normalized token streams keyed by a content hash and stems keyed by a token
+tokens_cache = LRUCache(maxsize=settings.NORMALIZER_TOKENS_CACHE_SIZE)
+stems_cache = LRUCache(maxsize=settings.NORMALIZER_STEMS_CACHE_SIZE)
+
+
+# define a cached stemming function, returns the stem and whether it was cached
+def stem(token: str) -> Tuple[str, bool]:
+    stemmed = stems_cache.get(token)
+    if stemmed is not None:
+        return stemmed, True
+
+    stemmed = stemmer.stem(token)
+    stems_cache.set(token, stemmed)
+    return stemmed, False
+
 
 # define a stemming function
 def stem_tokens(tokens: List[str]):
-    return [stemmer.stem(item) for item in tokens]
+    stems = []
+    hits = 0
+    for token in tokens:
+        stemmed, cached = stem(token)
+        stems.append(stemmed)
+        hits += cached
+
+    # counted once per status, in prometheus multiprocess mode every increment writes to a shared file
+    if hits:
+        NORMALIZER_CACHE_HITS.labels("stems").inc(hits)
+    if len(tokens) > hits:
+        NORMALIZER_CACHE_MISSES.labels("stems").inc(len(tokens) - hits)
+
+    return stems
 
 
 # define a normalizer function using stemmer and remove punctuation characters
 def normalize(text: str):
-    return stem_tokens(nltk.word_tokenize(text.lower().translate(remove_punctuation_map)))
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    tokens = tokens_cache.get(key)
+    if tokens is not None:
+        NORMALIZER_CACHE_HITS.labels("tokens").inc()
+        return list(tokens)
+
+    NORMALIZER_CACHE_MISSES.labels("tokens").inc()
+    tokens = stem_tokens(nltk.word_tokenize(text.lower().translate(remove_punctuation_map)))
+    tokens_cache.set(key, tuple(tokens))
+    return tokens
+
+
+# number of hashed features used by the similarity index
+N_FEATURES = 2 ** 18
+
+# define a hashing vectorizer, the vocabulary is fixed, so stored vectors never have to be refitted
+hashing_vectorizer = HashingVectorizer(
+    tokenizer=normalize,
+    stop_words="english",
+    token_pattern=None,
+    alternate_sign=False,
+    norm=None,
+    n_features=N_FEATURES,
+)
+
+
+# get term counts of a status content
+def vectorize(content: str) -> sparse.csr_matrix:
+    return hashing_vectorizer.transform([content])
+
+
+class TagSimilarityIndex:
+    """
+    Term counts of stored statuses under one tag, kept for Tf-Idf cosine similarity lookups without rebuilding.
+
+    Hashed features are mapped to columns of a tag-local vocabulary, so document frequencies fit a small array which
+    is updated in place when rows are added or evicted. Rows are appended to a short tail which is sealed into
+    a CSR chunk every chunk_size rows, the oldest chunks are evicted as a whole, so at least max_statuses and fewer
+    than max_statuses + 2 * chunk_size recent statuses are kept. A lookup weights the counts with the current idf
+    on the fly, its cost is a pair of sparse matrix-vector products per chunk.
+    """
+
+    CHUNK_SIZE = 64
+
+    def __init__(self, max_statuses: int) -> None:
+        self.max_statuses = max_statuses
+        self.chunk_size = max(min(self.CHUNK_SIZE, max_statuses), 1)
+        self.loaded = False
+        self._known_ids: set = set()
+        self._columns: Dict[int, int] = {}
+        self._document_frequency = np.zeros(1024, dtype=np.int64)
+        # sealed chunks of (status ids, counts, squared counts)
+        self._chunks: Deque[Tuple[List[str], sparse.csr_matrix, sparse.csr_matrix]] = deque()
+        self._rows_count = 0
+        self._tail_ids: List[str] = []
+        self._tail_rows: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._tail: Optional[Tuple[sparse.csr_matrix, sparse.csr_matrix]] = None
+
+    def __len__(self) -> int:
+        return self._rows_count
+
+    def add(self, status_id: str, counts: sparse.csr_matrix) -> None:
+        if status_id in self._known_ids:
+            return
+
+        columns = np.fromiter(
+            (self._columns.setdefault(feature, len(self._columns)) for feature in counts.indices),
+            dtype=np.int64,
+            count=len(counts.indices),
+        )
+        if len(self._columns) > len(self._document_frequency):
+            self._document_frequency = np.concatenate(
+                [self._document_frequency, np.zeros(len(self._document_frequency), dtype=np.int64)]
+            )
+        self._document_frequency[columns] += 1
+
+        self._known_ids.add(status_id)
+        self._tail_ids.append(status_id)
+        self._tail_rows.append((columns, counts.data.copy()))
+        self._tail = None
+        self._rows_count += 1
+
+        if len(self._tail_ids) >= self.chunk_size:
+            self._seal()
+
+    def find_similar(self, counts: sparse.csr_matrix, threshold: float) -> List[str]:
+        if not self._rows_count:
+            return []
+
+        # smoothed idf, the same formula TfidfVectorizer uses, features unknown to the tag have a zero frequency
+        width = len(self._columns)
+        idf = np.log((1 + self._rows_count) / (1 + self._document_frequency[:width])) + 1
+        unknown_idf = np.log(1 + self._rows_count) + 1
+
+        query = np.zeros(width)
+        query_norm = 0.0
+        for feature, count in zip(counts.indices, counts.data):
+            column = self._columns.get(feature)
+            if column is None:
+                query_norm += (count * unknown_idf) ** 2
+            else:
+                query[column] = count * idf[column] ** 2
+                query_norm += (count * idf[column]) ** 2
+
+        if not query_norm:
+            return []
+
+        # cosine of idf-weighted vectors: sum(c * q * idf^2) / (|c * idf| * |q * idf|)
+        idf_squared = idf ** 2
+        similar = []
+        for status_ids, chunk, chunk_squared in self._iter_chunks():
+            chunk_width = chunk.shape[1]
+            dot = chunk @ query[:chunk_width]
+            norms = np.sqrt(chunk_squared @ idf_squared[:chunk_width])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scores = dot / (norms * np.sqrt(query_norm))
+            similar.extend(status_ids[index] for index in np.flatnonzero(scores >= threshold))
+
+        return similar
+
+    def _iter_chunks(self):
+        yield from self._chunks
+
+        if self._tail_ids:
+            if self._tail is None:
+                self._tail = self._build_chunk(self._tail_rows)
+            yield (self._tail_ids, *self._tail)
+
+    def _build_chunk(self, rows: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[sparse.csr_matrix, sparse.csr_matrix]:
+        indptr = np.cumsum([0, *(len(columns) for columns, _ in rows)])
+        indices = np.concatenate([columns for columns, _ in rows])
+        data = np.concatenate([values for _, values in rows]).astype(np.float64)
+
+        chunk = sparse.csr_matrix((data, indices, indptr), shape=(len(rows), len(self._columns)))
+        return chunk, chunk.power(2)
+
+    def _seal(self) -> None:
+        self._chunks.append((self._tail_ids, *self._build_chunk(self._tail_rows)))
+        self._tail_ids, self._tail_rows, self._tail = [], [], None
+
+        # keep only the most recent statuses
+        evicted = False
+        while self._chunks and self._rows_count - len(self._chunks[0][0]) >= self.max_statuses:
+            status_ids, chunk, _ = self._chunks.popleft()
+            self._known_ids.difference_update(status_ids)
+            self._document_frequency[:chunk.shape[1]] -= np.bincount(chunk.indices, minlength=chunk.shape[1])
+            self._rows_count -= len(status_ids)
+            evicted = True
+
+        # columns of evicted words are dropped once they make up most of the vocabulary
+        live_columns = np.flatnonzero(self._document_frequency[:len(self._columns)])
+        if evicted and len(live_columns) * 2 < len(self._columns):
+            self._compact(live_columns)
+
+    def _compact(self, live_columns: np.ndarray) -> None:
+        remap = np.full(len(self._columns), -1, dtype=np.int64)
+        remap[live_columns] = np.arange(len(live_columns))
+
+        self._columns = {
+            feature: int(remap[column]) for feature, column in self._columns.items() if remap[column] >= 0
+        }
+        document_frequency = np.zeros(max(len(live_columns) * 2, 1024), dtype=np.int64)
+        document_frequency[:len(live_columns)] = self._document_frequency[live_columns]
+        self._document_frequency = document_frequency
+
+        chunks = deque()
+        for status_ids, chunk, chunk_squared in self._chunks:
+            shape = (chunk.shape[0], len(live_columns))
+            indices = remap[chunk.indices]
+            chunks.append((
+                status_ids,
+                sparse.csr_matrix((chunk.data, indices, chunk.indptr), shape=shape),
+                sparse.csr_matrix((chunk_squared.data, indices, chunk_squared.indptr), shape=shape),
+            ))
+        self._chunks = chunks
+
+
+class SimilarityIndex:
+    """
+    Per-tag similarity index. Statuses are tokenized once when they are added, a lookup for a new status is a few
+    sparse matrix-vector products against the stored counts of the tag.
+    """
+
+    def __init__(self, max_tags: int, max_statuses_per_tag: int) -> None:
+        self.max_tags = max_tags
+        self.max_statuses_per_tag = max_statuses_per_tag
+        self._tags: OrderedDict[str, TagSimilarityIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_loaded(self, tag: str) -> bool:
+        with self._lock:
+            index = self._tags.get(tag.lower())
+            return index is not None and index.loaded
+
+    def add(self, status_id: str, tags: Iterable[str], content: str) -> None:
+        counts = vectorize(content)
+
+        with self._lock:
+            for tag in tags:
+                self._get_or_create(tag).add(status_id, counts)
+
+    def load(self, tag: str, statuses: Iterable) -> None:
+        rows = [(str(status.id), vectorize(status.content or "")) for status in statuses]
+
+        with self._lock:
+            index = self._get_or_create(tag)
+            for status_id, counts in rows:
+                index.add(status_id, counts)
+            index.loaded = True
+
+    def warm(self, statuses: Iterable) -> None:
+        for status in statuses:
+            self.add(str(status.id), status.tags or [], status.content or "")
+
+        with self._lock:
+            for index in self._tags.values():
+                index.loaded = True
+
+    def find_similar(self, tag: str, content: str, threshold: float = 0.5) -> List[str]:
+        counts = vectorize(content)
+
+        with self._lock:
+            index = self._tags.get(tag.lower())
+            if index is None:
+                return []
 
+            self._tags.move_to_end(tag.lower())
+            return index.find_similar(counts, threshold)
 
-# define a Tf-Idf vectorizer
-vectorizer = TfidfVectorizer(tokenizer=normalize, stop_words="english")
+    def _get_or_create(self, tag: str) -> TagSimilarityIndex:
+        tag = tag.lower()
 
+        index = self._tags.get(tag)
+        if index is None:
+            index = self._tags[tag] = TagSimilarityIndex(max_statuses=self.max_statuses_per_tag)
+            # evict the least recently used tag
+            if len(self._tags) > self.max_tags:
+                self._tags.popitem(last=False)
+        else:
+            self._tags.move_to_end(tag)
 
-# calculate a cosine similarity for two text
-def calculate_cosine_similarity_between_two_statuses(status_content_1: str, status_content_2: str):
-    tfidf = vectorizer.fit_transform([status_content_1, status_content_2])
-    # Use sklearn's cosine_similarity function or convert sparse matrix properly
-    return cosine_similarity(tfidf[0:1], tfidf[1:2])[0, 0]
+        return index
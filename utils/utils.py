@@ -1,5 +1,6 @@
 """Utility functions."""
 
+import os
 from html.parser import HTMLParser
 
 # thirdparty
@@ -11,7 +12,7 @@ from opentelemetry.instrumentation.logging import LoggingInstrumentor
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from prometheus_client import CollectorRegistry, multiprocess
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
 from prometheus_client.openmetrics.exposition import (CONTENT_TYPE_LATEST,
                                                       generate_latest)
 from starlette.requests import Request
@@ -39,8 +40,12 @@ def strip_html(html):
 
 def metrics(request: Request) -> Response:
     """Generate metrics for Prometheus."""
-    registry = CollectorRegistry()
-    multiprocess.MultiProcessCollector(registry)
+    # aggregate metrics of all workers when running in prometheus multiprocess mode
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
     data = generate_latest(registry)
     return Response(content=data, media_type=CONTENT_TYPE_LATEST)
 
@@ -0,0 +1,147 @@
+# stdlib
+from typing import Any, Dict, Optional, Tuple
+
+# thirdparty
+import orjson
+
+VERDICT_FIELDS = ("is_suspicious", "confidence")
+
+LITERALS = {"true": True, "false": False, "null": None}
+
+
+class IncrementalVerdictParser:
+    """
+    Incremental parser of the top-level JSON object in a streamed LLM response. Scalar fields of the object are
+    surfaced as soon as their values are complete, so the verdict is known long before the reasoning is streamed.
+    Text around the object (e.g. markdown fences) is ignored.
+    """
+
+    def __init__(self, required: Tuple[str, ...] = VERDICT_FIELDS) -> None:
+        self.required = required
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._chunks = []
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._token = []
+        self._key: Optional[str] = None
+        self._expecting_value = False
+
+    @property
+    def done(self) -> bool:
+        return all(field in self.fields for field in self.required)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, delta: str) -> Dict[str, Any]:
+        """Consume the next delta and return top-level fields completed by it."""
+        self._chunks.append(delta)
+        parsed = {}
+
+        for char in delta:
+            self._position += 1
+
+            if self.complete:
+                continue
+
+            if self._in_string:
+                self._read_string(char, parsed)
+                continue
+
+            if self._depth == 0:
+                # skip everything before the object starts
+                if char == "{":
+                    self._depth = 1
+                    self._start = self._position - 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._token = []
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._finish_literal(parsed)
+                    self.complete = True
+                    self._end = self._position
+                self._depth -= 1
+            elif self._depth > 1:
+                continue
+            elif char == ":":
+                self._expecting_value = True
+                self._token = []
+            elif char == ",":
+                self._finish_literal(parsed)
+            elif self._expecting_value and not char.isspace():
+                self._token.append(char)
+            elif self._expecting_value and self._token:
+                self._finish_literal(parsed)
+
+        self.fields.update(parsed)
+        return parsed
+
+    def object(self) -> Optional[dict]:
+        """The whole top-level object once it is complete."""
+        if not self.complete:
+            return None
+
+        try:
+            return orjson.loads(self.text[self._start:self._end])
+        except orjson.JSONDecodeError:
+            return None
+
+    def _read_string(self, char: str, parsed: Dict[str, Any]) -> None:
+        if self._escaped:
+            self._escaped = False
+            if self._depth == 1:
+                self._token.append("\\" + char)
+            return
+
+        if char == "\\":
+            self._escaped = True
+        elif char == '"':
+            self._in_string = False
+            if self._depth != 1:
+                return
+
+            try:
+                value = orjson.loads('"' + "".join(self._token) + '"')
+            except orjson.JSONDecodeError:
+                # models sometimes put raw control characters into strings
+                value = "".join(self._token)
+            if self._expecting_value:
+                parsed[self._key] = value
+                self._expecting_value = False
+            else:
+                self._key = value
+            self._token = []
+        elif self._depth == 1:
+            self._token.append(char)
+
+    def _finish_literal(self, parsed: Dict[str, Any]) -> None:
+        if not self._expecting_value:
+            return
+
+        self._expecting_value = False
+        token = "".join(self._token).strip()
+        self._token = []
+
+        # nested values are not surfaced
+        if not token:
+            return
+
+        if token in LITERALS:
+            parsed[self._key] = LITERALS[token]
+            return
+
+        try:
+            parsed[self._key] = float(token) if any(char in token for char in ".eE") else int(token)
+        except ValueError:
+            pass